@@ -6,7 +6,11 @@ from config import Config
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Pool settings and SQLite pragmas for the selected DATABASE_PROFILE
+from services import engine_profiles
+engine_profiles.configure(app)
 db.init_app(app)
+engine_profiles.init_app(app)
 migrate = Migrate(app, db)
 
 # Import routes
@@ -18,6 +22,48 @@ app.register_blueprint(student_routes.bp)
 app.register_blueprint(issue_routes.bp)
 app.register_blueprint(fine_routes.bp)
 
+# Fine policy table, compiled once per worker
+from services import fine_policy
+fine_policy.init_app(app)
+
+# Size the barcode lookup cache
+from services import book_lookup
+book_lookup.init_app(app)
+
+# Catalog version, ETags and rendered-page cache for the listing pages
+from services import response_cache
+response_cache.init_app(app)
+
+# In-memory available-books index behind the book picker
+from services import availability
+availability.init_app(app)
+
+# Count SQL statements per request against a budget
+from services import query_counter
+query_counter.init_app(app)
+
+# Per-endpoint request metrics at /metrics
+from services import metrics
+metrics.init_app(app)
+
+# Register CLI commands
+from commands import register_commands
+register_commands(app)
+
+# Background fine accrual, started by the first request each worker serves so CLI commands never run it;
+# every worker has a scheduler and each interval is accrued by whichever claims it first
+from services.fine_scheduler import FineAccrualScheduler
+app.extensions['fine_scheduler'] = FineAccrualScheduler(
+    app,
+    interval=app.config['FINE_ACCRUAL_INTERVAL_SECONDS'],
+    batch_size=app.config['FINE_ACCRUAL_BATCH_SIZE']
+)
+
+@app.before_request
+def start_fine_scheduler():
+    if app.config['FINE_SCHEDULER_ENABLED']:
+        app.extensions['fine_scheduler'].start()
+
 @app.route('/')
 def index():
     from flask import render_template
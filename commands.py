@@ -0,0 +1,467 @@
+"""
+Flask CLI commands for maintenance and batch jobs.
+
+Registered on the app in app.py; run with `flask <command>`.
+"""
+import json
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('accrue-fines')
+@click.option('--batch-size', type=int, default=None, help='Open issues updated per transaction.')
+@with_appcontext
+def accrue_fines_command(batch_size):
+    """Accrue fines for all open issues once."""
+    from services.fine_scheduler import accrue_fines
+    
+    run = accrue_fines(batch_size or current_app.config['FINE_ACCRUAL_BATCH_SIZE'])
+    click.echo(f'Accrued fines: {run.rows_touched} rows touched in {run.batches} batches')
+
+
+@click.command('fine-scheduler')
+@with_appcontext
+def fine_scheduler_command():
+    """Run the fine-accrual scheduler in the foreground."""
+    scheduler = current_app.extensions['fine_scheduler']
+    click.echo(f'Accruing fines every {scheduler.interval} seconds (Ctrl+C to stop)')
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the full-text catalog search index from the work table."""
+    from services.book_search import ensure_search_index
+    
+    indexed = ensure_search_index(rebuild=True)
+    click.echo(f'Search index rebuilt: {indexed} titles indexed')
+
+
+def _keep_fine_scheduler_off():
+    """Keep background fine accrual from starting under commands that time or count their own requests"""
+    current_app.config['FINE_SCHEDULER_ENABLED'] = False
+
+
+def _run_import(import_rows, path, file_format, chunk_size, rejects_path):
+    from services.importer import read_rows
+    
+    def progress(report):
+        click.echo(f'  {report.inserted} inserted, {len(report.rejected)} rejected '
+                   f'({report.rows_per_second:.0f} rows/s)')
+    
+    report = import_rows(read_rows(path, file_format), chunk_size=chunk_size, progress=progress)
+    click.echo(f'Read {report.read} rows in {report.elapsed:.1f}s: {report.inserted} inserted, '
+               f'{len(report.rejected)} rejected ({report.rows_per_second:.0f} rows/s)')
+    
+    for line_number, reason, _ in report.rejected[:20]:
+        click.echo(f'  line {line_number}: {reason}')
+    if len(report.rejected) > 20:
+        click.echo(f'  ... and {len(report.rejected) - 20} more')
+    
+    if rejects_path and report.rejected:
+        with open(rejects_path, 'w', encoding='utf-8') as handle:
+            for line_number, reason, row in report.rejected:
+                handle.write(json.dumps({'line': line_number, 'reason': reason, 'row': row}) + '\n')
+        click.echo(f'Rejected rows written to {rejects_path}')
+
+
+import_options = [
+    click.argument('path', type=click.Path(exists=True, dir_okay=False)),
+    click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+                 help='File format (default: from the file extension).'),
+    click.option('--chunk-size', type=int, default=1000, show_default=True,
+                 help='Rows validated and committed per batch.'),
+    click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False), default=None,
+                 help='Write rejected rows and reasons to this JSONL file.')
+]
+
+
+def with_import_options(command):
+    for option in reversed(import_options):
+        command = option(command)
+    return command
+
+
+@click.command('import-books')
+@with_import_options
+@with_appcontext
+def import_books_command(path, file_format, chunk_size, rejects_path):
+    """Bulk-import books from a CSV or JSONL file.
+
+    Columns: title, author, book_type, category, course, duration_type, duration_days,
+    copies (default 1). Rows for a title already in the catalog add copies to it.
+    Book codes and barcodes are assigned automatically, one per copy.
+    """
+    from services.importer import import_books
+    _run_import(import_books, path, file_format, chunk_size, rejects_path)
+
+
+@click.command('import-students')
+@with_import_options
+@with_appcontext
+def import_students_command(path, file_format, chunk_size, rejects_path):
+    """Bulk-import students from a CSV or JSONL file.
+
+    Columns: name, course, email, admission_number (generated when blank).
+    """
+    from services.importer import import_students
+    _run_import(import_students, path, file_format, chunk_size, rejects_path)
+
+
+def _run_export(output, start, end, status, file_format, fines_only):
+    from services.exporter import export_query, parse_date, stream_export
+    
+    try:
+        query = export_query(parse_date(start), parse_date(end), status, fines_only=fines_only)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    with click.open_file(output, 'w', encoding='utf-8') as handle:
+        for chunk in stream_export(query, file_format):
+            handle.write(chunk)
+
+
+export_options = [
+    click.option('--output', '-o', default='-', help='Output file (default: stdout).'),
+    click.option('--from', 'start', default=None, help='Earliest issue date (YYYY-MM-DD).'),
+    click.option('--to', 'end', default=None, help='Latest issue date (YYYY-MM-DD), inclusive.'),
+    click.option('--status', type=click.Choice(['all', 'returned', 'outstanding']), default='all',
+                 show_default=True),
+    click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default='csv',
+                 show_default=True)
+]
+
+
+def with_export_options(command):
+    for option in reversed(export_options):
+        command = option(command)
+    return command
+
+
+@click.command('export-issues')
+@with_export_options
+@with_appcontext
+def export_issues_command(output, start, end, status, file_format):
+    """Export circulation history with student and book details."""
+    _run_export(output, start, end, status, file_format, fines_only=False)
+
+
+@click.command('export-fines')
+@with_export_options
+@with_appcontext
+def export_fines_command(output, start, end, status, file_format):
+    """Export every issue that carries a fine."""
+    _run_export(output, start, end, status, file_format, fines_only=True)
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every query.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if any hot-path query is planned as a full table scan."""
+    from services.query_plans import check_query_plans
+    
+    results = check_query_plans()
+    for result in results:
+        if result['exempt']:
+            click.echo(f'[exempt] {result["name"]} (full scan of {", ".join(result["full_scans"])}: '
+                       f'{result["exempt"]})')
+        else:
+            status = 'ok  ' if result['ok'] else 'SCAN'
+            click.echo(f'[{status}] {result["name"]}' +
+                       (f' (full scan of {", ".join(result["full_scans"])})' if not result['ok'] else ''))
+        if verbose or not result['ok']:
+            for line in result['plan']:
+                click.echo(f'         {line}')
+    
+    failures = [result for result in results if not result['ok']]
+    if failures:
+        raise SystemExit(f'{len(failures)} of {len(results)} queries fall back to a full scan')
+    exempt = sum(1 for result in results if result['exempt'])
+    click.echo(f'All {len(results)} queries use an index' + (f' ({exempt} exempt)' if exempt else ''))
+
+
+@click.command('check-sql-budget')
+@with_appcontext
+def check_sql_budget_command():
+    """Fail if a main page runs more SQL statements than its budget."""
+    from services.benchmark import busiest_admission_number
+    from services.query_counter import count_statements, statement_budget
+    
+    _keep_fine_scheduler_off()
+    # Profile of the student with the longest history is the worst case for that page
+    busiest = busiest_admission_number()
+    paths = ['/books/', '/books/available', '/students/', '/issues/', '/fines/']
+    if busiest:
+        paths.append(f'/students/profile/{busiest}')
+    
+    app = current_app._get_current_object()
+    adapter = app.url_map.bind('localhost')
+    client = app.test_client()
+    failures = 0
+    for path in paths:
+        budget = statement_budget(app, adapter.match(path)[0])
+        with count_statements() as statements:
+            response = client.get(path)
+        ok = response.status_code == 200 and (budget is None or len(statements) <= budget)
+        failures += not ok
+        click.echo(f'[{"ok  " if ok else "FAIL"}] {path}: {len(statements)} statements '
+                   f'(budget {budget}, HTTP {response.status_code})')
+    
+    if failures:
+        raise SystemExit(f'{failures} of {len(paths)} pages exceed their SQL statement budget')
+    click.echo(f'All {len(paths)} pages are within their SQL statement budget')
+
+
+@click.command('generate-data')
+@click.option('--size', type=click.Choice(['10k', '100k', '1m']), default='10k', show_default=True,
+              help='Preset dataset size (total rows).')
+@click.option('--books', type=int, default=None, help='Override the preset number of books.')
+@click.option('--students', type=int, default=None, help='Override the preset number of students.')
+@click.option('--issues', type=int, default=None, help='Override the preset number of issues.')
+@click.option('--seed', type=int, default=42, show_default=True, help='Random seed.')
+@click.option('--as-of', 'as_of', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Date the circulation history leads up to (default: today).')
+@click.option('--chunk-size', type=int, default=5000, show_default=True, help='Rows inserted per transaction.')
+@with_appcontext
+def generate_data_command(size, books, students, issues, seed, as_of, chunk_size):
+    """Add a deterministic synthetic library for scaling and benchmark runs."""
+    from services.datagen import SIZES, generate_library
+    
+    preset = SIZES[size]
+    
+    def progress(report):
+        click.echo(f'  {report.books} books, {report.students} students, {report.issues} issues '
+                   f'({report.elapsed:.1f}s)')
+    
+    try:
+        report = generate_library(
+            books if books is not None else preset['books'],
+            students if students is not None else preset['students'],
+            issues if issues is not None else preset['issues'],
+            seed=seed, as_of=as_of, chunk_size=chunk_size, progress=progress
+        )
+    except OverflowError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Generated {report.books} books, {report.students} students and {report.issues} issues '
+               f'({report.open_issues} open) in {report.elapsed:.1f}s '
+               f'[seed {seed}, as of {report.as_of:%Y-%m-%d}]')
+
+
+@click.command('benchmark')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None,
+              help='Write the results as JSON to this file.')
+@click.option('--repeat', type=int, default=5, show_default=True, help='Timed runs per case.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Earlier results file to compare against.')
+@click.option('--threshold', type=float, default=0.2, show_default=True,
+              help='Relative median slowdown counted as a regression.')
+@click.option('--skip-cli', is_flag=True, help='Only time the web routes.')
+@with_appcontext
+def benchmark_command(output, repeat, baseline, threshold, skip_cli):
+    """Time every page and maintenance command against the current database."""
+    from services.benchmark import compare, run_benchmark
+    
+    _keep_fine_scheduler_off()
+    def progress(result):
+        click.echo(f'  {result["name"]:<34} median {result["median_ms"]:>10.2f} ms  '
+                   f'{result["statements"]:>5} statements')
+    
+    document = run_benchmark(current_app._get_current_object(), repeat=repeat,
+                             include_cli=not skip_cli, progress=progress)
+    dataset = document['dataset']
+    click.echo(f'{len(document["results"])} cases on {dataset["books"]} books, {dataset["students"]} students, '
+               f'{dataset["issues"]} issues')
+    
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(document, handle, indent=2)
+        click.echo(f'Results written to {output}')
+    
+    if baseline:
+        with open(baseline, encoding='utf-8') as handle:
+            changes = compare(document, json.load(handle), threshold)
+        for name, before, after, change, regressed in changes:
+            click.echo(f'[{"SLOW" if regressed else "ok  "}] {name:<34} {before:>10.2f} -> {after:>10.2f} ms '
+                       f'({change:+.0%})')
+        regressions = [change for change in changes if change[4]]
+        if regressions:
+            raise SystemExit(f'{len(regressions)} cases slowed down by more than {threshold:.0%}')
+
+
+@click.command('benchmark-engine')
+@click.option('--readers', type=int, default=8, show_default=True, help='Concurrent reader threads.')
+@click.option('--writers', type=int, default=2, show_default=True, help='Concurrent writer threads.')
+@click.option('--seconds', type=float, default=5.0, show_default=True, help='Duration per profile.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None,
+              help='Write the results as JSON to this file.')
+@with_appcontext
+def benchmark_engine_command(readers, writers, seconds, output):
+    """Compare engine profiles under concurrent reads and writes (use a scratch database)."""
+    from services.benchmark import run_engine_benchmark
+    
+    document = run_engine_benchmark(current_app._get_current_object(), profiles=('baseline', 'production'),
+                                    readers=readers, writers=writers, seconds=seconds)
+    for result in document['results']:
+        for role in ('read', 'write'):
+            stats = result[role]
+            click.echo(f'{result["profile"]:<11} {role:<5} {stats["ops_per_second"]:>9.1f} ops/s  '
+                       f'p50 {stats["p50_ms"] or 0:>8.2f} ms  p95 {stats["p95_ms"] or 0:>8.2f} ms  '
+                       f'{stats["errors"]} errors')
+    
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(document, handle, indent=2)
+        click.echo(f'Results written to {output}')
+
+
+@click.command('stress-issue')
+@click.option('--books', type=int, default=5, show_default=True, help='Titles with free copies contended for.')
+@click.option('--workers', type=int, default=16, show_default=True, help='Concurrent client threads.')
+@click.option('--requests', 'requests_per_worker', type=int, default=25, show_default=True,
+              help='Issue requests per thread.')
+@with_appcontext
+def stress_issue_command(books, workers, requests_per_worker):
+    """Fail if concurrent issue requests ever issue one copy twice (use a scratch database)."""
+    from services.stress import run_issue_stress
+    
+    _keep_fine_scheduler_off()
+    try:
+        report = run_issue_stress(current_app._get_current_object(), books=books, workers=workers,
+                                  requests_per_worker=requests_per_worker)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{report["requests"]} issue requests from {report["workers"]} threads for {report["books"]} titles '
+               f'with {report["copies"]} free copies ({report["requests_per_second"]} req/s): '
+               f'{report["issues_created"]} issues created')
+    if report['double_issues']:
+        click.echo(f'  Issued more than once: {report["double_issues"]}')
+    if report['mismatched_availability']:
+        click.echo(f'  Availability flag wrong for books {report["mismatched_availability"]}')
+    if report['drifted_counters']:
+        click.echo(f'  Available-copy counter wrong for works {report["drifted_counters"]}')
+    if not report['ok']:
+        raise SystemExit('Concurrent issuing is not safe')
+    click.echo('No double issues')
+
+
+@click.command('reconcile-loan-counters')
+@click.option('--dry-run', is_flag=True, help='Report drifted counters without correcting them.')
+@with_appcontext
+def reconcile_loan_counters_command(dry_run):
+    """Recompute every student's loan and fine counters from the issue history."""
+    from models import db
+    from services.loan_counters import reconcile
+    
+    checked, corrected = reconcile()
+    if dry_run:
+        db.session.rollback()
+        click.echo(f'{corrected} of {checked} students have drifted counters')
+    else:
+        db.session.commit()
+        click.echo(f'Checked {checked} students, corrected {corrected}')
+
+
+@click.command('reconcile-copy-counters')
+@click.option('--dry-run', is_flag=True, help='Report drifted counters without correcting them.')
+@with_appcontext
+def reconcile_copy_counters_command(dry_run):
+    """Recount every title's total and available copies from the book table."""
+    from models import db
+    from services.inventory import reconcile
+    
+    checked, corrected = reconcile()
+    if dry_run:
+        db.session.rollback()
+        click.echo(f'{corrected} of {checked} titles have drifted counters')
+    else:
+        db.session.commit()
+        click.echo(f'Checked {checked} titles, corrected {corrected}')
+
+
+@click.command('archive-issues')
+@click.option('--older-than', type=int, default=None, help='Archive issues returned more than this many days ago.')
+@click.option('--batch-size', type=int, default=None, help='Issues moved per transaction.')
+@with_appcontext
+def archive_issues_command(older_than, batch_size):
+    """Move old returned issues from the issue table into issue_history."""
+    from services.archive import archive_returned_issues
+    
+    older_than = current_app.config['ARCHIVE_AFTER_DAYS'] if older_than is None else older_than
+    report = archive_returned_issues(
+        older_than, batch_size or current_app.config['ARCHIVE_BATCH_SIZE'],
+        progress=lambda report: click.echo(f'  {report.archived} issues archived', err=True)
+    )
+    click.echo(f'Archived {report.archived} issues returned before {report.cutoff:%Y-%m-%d} '
+               f'in {report.batches} batches ({report.elapsed:.1f}s)')
+
+
+@click.command('fine-policy')
+@click.option('--category', default=None, help='Category the rule applies to, e.g. medical (default: any).')
+@click.option('--book-type', default=None, help='textbook or reference (default: any).')
+@click.option('--rate', type=float, default=None, help='Fine per day late, in rupees.')
+@click.option('--grace-days', type=int, default=None, help='Days after the due date before fines start.')
+@click.option('--remove', is_flag=True, help='Delete the rule for this category and book type.')
+@with_appcontext
+def fine_policy_command(category, book_type, rate, grace_days, remove):
+    """Show the fine policy, or set or remove the rule for a category and/or book type."""
+    from services.fine_policy import current_policy, remove_rule, set_rule
+    
+    category = category.lower() if category else None
+    book_type = book_type.lower() if book_type else None
+    try:
+        if remove:
+            if not remove_rule(category, book_type):
+                click.echo('No such rule')
+        elif rate is not None or grace_days is not None:
+            set_rule(category, book_type, rate, grace_days)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    policy = current_policy()
+    click.echo(f'{"any":<12} {"any":<10} {policy.default.rate_per_day:>8.2f}/day  '
+               f'{policy.default.grace_period_days:>3} days grace')
+    for rule_category, rule_book_type, rule in policy.scoped_rules():
+        click.echo(f'{rule_category or "any":<12} {rule_book_type or "any":<10} {rule.rate_per_day:>8.2f}/day  '
+                   f'{rule.grace_period_days:>3} days grace')
+
+
+@click.command('expire-holds')
+@click.option('--batch-size', type=int, default=None, help='Expired holds handled per transaction.')
+@with_appcontext
+def expire_holds_command(batch_size):
+    """Expire holds whose copy was not collected in time and pass the copies on."""
+    from services.holds import expire_holds
+    
+    sweep = expire_holds(batch_size or current_app.config['HOLD_SWEEP_BATCH_SIZE'])
+    click.echo(f'Expired {sweep.expired} holds in {sweep.batches} batches: {sweep.passed_on} copies set aside '
+               f'for the next hold, {sweep.released} back on the shelf')
+
+
+def register_commands(app):
+    """Attach all CLI commands to the Flask app"""
+    app.cli.add_command(accrue_fines_command)
+    app.cli.add_command(fine_scheduler_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(import_books_command)
+    app.cli.add_command(import_students_command)
+    app.cli.add_command(export_issues_command)
+    app.cli.add_command(export_fines_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(check_sql_budget_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(benchmark_engine_command)
+    app.cli.add_command(stress_issue_command)
+    app.cli.add_command(reconcile_loan_counters_command)
+    app.cli.add_command(reconcile_copy_counters_command)
+    app.cli.add_command(archive_issues_command)
+    app.cli.add_command(fine_policy_command)
+    app.cli.add_command(expire_holds_command)
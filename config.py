@@ -5,3 +5,54 @@ class Config:
     basedir = os.path.abspath(os.path.dirname(__file__))
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///library.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Engine profile: 'production' (SQLite WAL/pragmas, pooled PostgreSQL) or 'baseline' (driver defaults)
+    # See services/engine_profiles.py
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'production'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 64 * 1024)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+
+    # Background fine accrual (see services/fine_scheduler.py): runs in every web worker, and each interval is
+    # accrued by whichever worker claims it first. Turn it off only if `flask accrue-fines` runs from cron instead
+    FINE_SCHEDULER_ENABLED = os.environ.get('FINE_SCHEDULER_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    FINE_ACCRUAL_INTERVAL_SECONDS = int(os.environ.get('FINE_ACCRUAL_INTERVAL_SECONDS') or 24 * 60 * 60)
+    FINE_ACCRUAL_BATCH_SIZE = int(os.environ.get('FINE_ACCRUAL_BATCH_SIZE') or 500)
+    # Seconds a worker keeps its compiled fine policy before re-reading the table (see services/fine_policy.py)
+    FINE_POLICY_RELOAD_SECONDS = int(os.environ.get('FINE_POLICY_RELOAD_SECONDS') or 60)
+
+    # Holds: days a returned book is set aside for the next student in its queue, whether students
+    # whose course matches the title's go first, and holds expired per transaction (see services/holds.py)
+    HOLD_PICKUP_DAYS = int(os.environ.get('HOLD_PICKUP_DAYS') or 3)
+    HOLD_COURSE_PRIORITY = os.environ.get('HOLD_COURSE_PRIORITY', '1').lower() in ('1', 'true', 'yes')
+    HOLD_SWEEP_BATCH_SIZE = int(os.environ.get('HOLD_SWEEP_BATCH_SIZE') or 500)
+
+    # Returned issues older than this move to issue_history (see services/archive.py)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 365)
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE') or 1000)
+
+    # Listing pages (books, students) are keyset-paginated
+    LISTING_PAGE_SIZE = int(os.environ.get('LISTING_PAGE_SIZE') or 50)
+    LISTING_MAX_PAGE_SIZE = int(os.environ.get('LISTING_MAX_PAGE_SIZE') or 200)
+
+    # Scanned barcode / book code -> book id cache (entries per worker process)
+    BOOK_LOOKUP_CACHE_SIZE = int(os.environ.get('BOOK_LOOKUP_CACHE_SIZE') or 4096)
+
+    # Rendered /books/ and /students/ pages kept per worker, keyed by catalog version
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 256)
+
+    # Upper bound on results returned by the student typeahead (/students/search)
+    TYPEAHEAD_MAX_RESULTS = int(os.environ.get('TYPEAHEAD_MAX_RESULTS') or 50)
+
+    # SQL statements allowed per request (see services/query_counter.py); 0 or empty disables the check (None).
+    # Strict mode turns an exceeded budget into an error, for development and CI.
+    SQL_STATEMENT_BUDGET = int(os.environ.get('SQL_STATEMENT_BUDGET', '20') or 0) or None
+    SQL_STATEMENT_BUDGETS = {}
+    SQL_BUDGET_STRICT = os.environ.get('SQL_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    # Requests slower than this many seconds are logged with their slowest SQL (see services/metrics.py)
+    SLOW_REQUEST_SECONDS = float(os.environ['SLOW_REQUEST_SECONDS']) if os.environ.get('SLOW_REQUEST_SECONDS') else None
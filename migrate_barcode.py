@@ -3,6 +3,7 @@ Migration script to add barcode and book code fields to existing books
 """
 from app import app, db
 from models import Book
+from collections import Counter
 
 def migrate_books():
     """Run the migration for books"""
@@ -24,22 +25,29 @@ def migrate_books():
                 
                 for book in books_without_codes:
                     # Assign default category if not present
-                    if not hasattr(book, 'category') or not book.category:
+                    if not book.work.category:
                         # Try to infer category from book_type
-                        if book.book_type == 'textbook':
-                            book.category = 'general'
+                        if book.work.book_type == 'textbook':
+                            book.work.category = 'general'
                         else:
-                            book.category = 'general'
-                    
+                            book.work.category = 'general'
+                
+                # Reserve each category's book codes in one block
+                codes_by_category = {
+                    category: iter(Book.reserve_book_codes(category, count))
+                    for category, count in Counter(book.work.category for book in books_without_codes).items()
+                }
+                
+                for book in books_without_codes:
                     # Generate book code
-                    book_code = Book.generate_book_code(book.category)
+                    book_code = next(codes_by_category[book.work.category])
                     book.book_code = book_code
                     
                     # Generate barcode
                     book.generate_barcode()
                     
-                    print(f"  Book: {book.title}")
-                    print(f"    Category: {book.category}")
+                    print(f"  Book: {book.work.title}")
+                    print(f"    Category: {book.work.category}")
                     print(f"    Code: {book_code}")
                     print(f"    Barcode: {book.barcode}")
                 
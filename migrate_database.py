@@ -2,19 +2,9 @@
 Migration script to add admission numbers to existing students
 and update database schema.
 """
-import random
 from app import app, db
 from models import Student, Issue
 
-def generate_unique_admission_number():
-    """Generate a unique 8-digit admission number"""
-    with app.app_context():
-        while True:
-            admission_number = ''.join([str(random.randint(0, 9)) for _ in range(8)])
-            existing = Student.query.filter_by(admission_number=admission_number).first()
-            if not existing:
-                return admission_number
-
 def migrate():
     """Run the migration"""
     with app.app_context():
@@ -32,8 +22,8 @@ def migrate():
             
             if students_without_admission:
                 print(f"\nFound {len(students_without_admission)} students without admission numbers")
-                for student in students_without_admission:
-                    admission_number = generate_unique_admission_number()
+                admission_numbers = Student.reserve_admission_numbers(len(students_without_admission))
+                for student, admission_number in zip(students_without_admission, admission_numbers):
                     student.admission_number = admission_number
                     print(f"  Assigned {admission_number} to {student.name}")
                 
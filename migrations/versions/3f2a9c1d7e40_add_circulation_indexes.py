@@ -0,0 +1,46 @@
+"""add circulation indexes
+
+Revision ID: 3f2a9c1d7e40
+Revises: 
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+OPEN_LOANS = {
+    'sqlite_where': sa.text('returned = 0'),
+    'postgresql_where': sa.text('returned = false'),
+}
+WITH_FINE = {
+    'sqlite_where': sa.text('fine > 0'),
+    'postgresql_where': sa.text('fine > 0'),
+}
+
+
+def upgrade():
+    # Databases created with init_db.py (create_all) may already have these
+    op.create_index('ix_issue_open', 'issue', ['id'], if_not_exists=True, **OPEN_LOANS)
+    op.create_index('ix_issue_open_book_id', 'issue', ['book_id'], if_not_exists=True, **OPEN_LOANS)
+    op.create_index('ix_issue_book_id', 'issue', ['book_id'], if_not_exists=True)
+    op.create_index('ix_issue_student_issue_date', 'issue', ['student_id', 'issue_date'], if_not_exists=True)
+    op.create_index('ix_issue_issue_date', 'issue', ['issue_date'], if_not_exists=True)
+    op.create_index('ix_issue_with_fine', 'issue', ['id'], if_not_exists=True, **WITH_FINE)
+    op.create_index('ix_student_name_lower', 'student', [sa.text('lower(name)')], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_student_name_lower', table_name='student')
+    op.drop_index('ix_issue_with_fine', table_name='issue')
+    op.drop_index('ix_issue_issue_date', table_name='issue')
+    op.drop_index('ix_issue_student_issue_date', table_name='issue')
+    op.drop_index('ix_issue_book_id', table_name='issue')
+    op.drop_index('ix_issue_open_book_id', table_name='issue')
+    op.drop_index('ix_issue_open', table_name='issue')
@@ -0,0 +1,62 @@
+"""add hold queue table
+
+Revision ID: 5d0c8e3f6b14
+Revises: e19b5f7c2a68
+Create Date: 2026-10-19 05:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c8e3f6b14'
+down_revision = 'e19b5f7c2a68'
+branch_labels = None
+depends_on = None
+
+WAITING = {
+    'sqlite_where': sa.text("status = 'waiting'"),
+    'postgresql_where': sa.text("status = 'waiting'"),
+}
+READY = {
+    'sqlite_where': sa.text("status = 'ready'"),
+    'postgresql_where': sa.text("status = 'ready'"),
+}
+ACTIVE = {
+    'sqlite_where': sa.text("status IN ('waiting', 'ready')"),
+    'postgresql_where': sa.text("status IN ('waiting', 'ready')"),
+}
+
+
+def upgrade():
+    # Earlier builds of the application created the table on startup, so it may already exist
+    if not sa.inspect(op.get_bind()).has_table('hold'):
+        op.create_table(
+            'hold',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=False),
+            sa.Column('priority', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=10), nullable=False),
+            sa.Column('placed_at', sa.DateTime(), nullable=False),
+            sa.Column('ready_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.Column('closed_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['book_id'], ['book.id']),
+            sa.ForeignKeyConstraint(['student_id'], ['student.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_hold_queue', 'hold', ['book_id', 'priority', 'placed_at', 'id'], if_not_exists=True, **WAITING)
+    op.create_index('ix_hold_ready_expires_at', 'hold', ['expires_at'], if_not_exists=True, **READY)
+    op.create_index('uq_hold_active_book_student', 'hold', ['book_id', 'student_id'], unique=True,
+                    if_not_exists=True, **ACTIVE)
+    op.create_index('ix_hold_student_id', 'hold', ['student_id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_hold_student_id', table_name='hold')
+    op.drop_index('uq_hold_active_book_student', table_name='hold')
+    op.drop_index('ix_hold_ready_expires_at', table_name='hold')
+    op.drop_index('ix_hold_queue', table_name='hold')
+    op.drop_table('hold')
@@ -0,0 +1,180 @@
+"""split the catalog into works and copies
+
+Revision ID: 7a2d4f9e1c35
+Revises: 5d0c8e3f6b14
+Create Date: 2026-10-19 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a2d4f9e1c35'
+down_revision = '5d0c8e3f6b14'
+branch_labels = None
+depends_on = None
+
+WORK_COLUMNS = ('title', 'author', 'book_type', 'category', 'course', 'duration_type', 'duration_days')
+
+WAITING = {
+    'sqlite_where': sa.text("status = 'waiting'"),
+    'postgresql_where': sa.text("status = 'waiting'"),
+}
+READY = {
+    'sqlite_where': sa.text("status = 'ready'"),
+    'postgresql_where': sa.text("status = 'ready'"),
+}
+ACTIVE = {
+    'sqlite_where': sa.text("status IN ('waiting', 'ready')"),
+    'postgresql_where': sa.text("status IN ('waiting', 'ready')"),
+}
+WITH_FREE_COPIES = {
+    'sqlite_where': sa.text('available_copies > 0'),
+    'postgresql_where': sa.text('available_copies > 0'),
+}
+
+work = sa.table(
+    'work',
+    sa.column('id', sa.Integer), *[sa.column(name) for name in WORK_COLUMNS],
+    sa.column('total_copies', sa.Integer), sa.column('available_copies', sa.Integer)
+)
+book = sa.table(
+    'book',
+    sa.column('id', sa.Integer), sa.column('work_id', sa.Integer), sa.column('available', sa.Boolean),
+    *[sa.column(name) for name in WORK_COLUMNS]
+)
+hold = sa.table(
+    'hold',
+    sa.column('id', sa.Integer), sa.column('work_id', sa.Integer), sa.column('book_id', sa.Integer),
+    sa.column('student_id', sa.Integer), sa.column('status', sa.String), sa.column('closed_at', sa.DateTime)
+)
+
+
+def _same_identity(left, right):
+    return sa.and_(left.c.title == right.c.title, left.c.author == right.c.author,
+                   sa.func.coalesce(left.c.course, '') == sa.func.coalesce(right.c.course, ''))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    op.create_table(
+        'work',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('author', sa.String(length=100), nullable=False),
+        sa.Column('book_type', sa.String(length=50), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=False),
+        sa.Column('course', sa.String(length=100), nullable=True),
+        sa.Column('duration_type', sa.String(length=50), nullable=False),
+        sa.Column('duration_days', sa.Integer(), nullable=True),
+        sa.Column('total_copies', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('available_copies', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # One work per (title, author, course); the lowest-id book's type, category and loan rules win
+    first_books = sa.select(sa.func.min(book.c.id)).group_by(
+        book.c.title, book.c.author, sa.func.coalesce(book.c.course, ''))
+    op.execute(work.insert().from_select(
+        list(WORK_COLUMNS),
+        sa.select(*[book.c[name] for name in WORK_COLUMNS]).where(book.c.id.in_(first_books)).order_by(book.c.id)
+    ))
+    op.create_index('uq_work_identity', 'work', ['title', 'author', sa.text("coalesce(course, '')")], unique=True)
+    op.create_index('ix_work_available', 'work', ['id'], **WITH_FREE_COPIES)
+
+    # Every existing book row becomes a copy of its work
+    op.add_column('book', sa.Column('work_id', sa.Integer(), nullable=True))
+    op.execute(book.update().values(
+        work_id=sa.select(work.c.id).where(_same_identity(work, book)).scalar_subquery()
+    ))
+
+    # Holds queue per work. A student queueing for several copies of one title keeps one hold:
+    # a ready one if there is one, else the oldest; copies set aside for the others go back on the shelf
+    op.add_column('hold', sa.Column('work_id', sa.Integer(), nullable=True))
+    op.execute(hold.update().values(
+        work_id=sa.select(book.c.work_id).where(book.c.id == hold.c.book_id).scalar_subquery()
+    ))
+    kept = hold.alias('kept')
+    kept_id = sa.select(kept.c.id).where(
+        kept.c.work_id == hold.c.work_id, kept.c.student_id == hold.c.student_id,
+        kept.c.status.in_(('waiting', 'ready'))
+    ).order_by(sa.case((kept.c.status == 'ready', 0), else_=1), kept.c.id).limit(1).scalar_subquery()
+    duplicate = sa.and_(hold.c.status.in_(('waiting', 'ready')), hold.c.id != kept_id)
+    op.execute(book.update().where(book.c.id.in_(
+        sa.select(hold.c.book_id).where(duplicate, hold.c.status == 'ready')
+    )).values(available=True))
+    op.execute(hold.update().where(duplicate).values(status='cancelled', closed_at=sa.func.now()))
+
+    copies = sa.select(sa.func.count(book.c.id)).where(book.c.work_id == work.c.id)
+    op.execute(work.update().values(
+        total_copies=copies.scalar_subquery(),
+        available_copies=copies.where(book.c.available == sa.true()).scalar_subquery()
+    ))
+
+    # The search index moves to the work table; revision e7b3d9f2a416 builds it
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS book_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_book_search')
+
+    with op.batch_alter_table('book') as batch_op:
+        for name in WORK_COLUMNS:
+            batch_op.drop_column(name)
+        batch_op.alter_column('work_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_book_work_id', 'work', ['work_id'], ['id'])
+    op.create_index('ix_book_work_id', 'book', ['work_id', 'available'])
+
+    op.drop_index('uq_hold_active_book_student', table_name='hold')
+    op.drop_index('ix_hold_queue', table_name='hold')
+    with op.batch_alter_table('hold') as batch_op:
+        batch_op.alter_column('work_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('book_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.create_foreign_key('fk_hold_work_id', 'work', ['work_id'], ['id'])
+    # Only ready holds carry the copy set aside for them
+    op.execute(hold.update().where(hold.c.status == 'waiting').values(book_id=None))
+    op.create_index('ix_hold_queue', 'hold', ['work_id', 'priority', 'placed_at', 'id'], **WAITING)
+    op.create_index('ix_hold_ready_book_id', 'hold', ['book_id'], **READY)
+    op.create_index('uq_hold_active_work_student', 'hold', ['work_id', 'student_id'], unique=True, **ACTIVE)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    op.drop_index('uq_hold_active_work_student', table_name='hold')
+    op.drop_index('ix_hold_ready_book_id', table_name='hold')
+    op.drop_index('ix_hold_queue', table_name='hold')
+    # Waiting holds queue on the work's first copy again
+    op.execute(hold.update().where(hold.c.book_id.is_(None)).values(
+        book_id=sa.select(sa.func.min(book.c.id)).where(book.c.work_id == hold.c.work_id).scalar_subquery()
+    ))
+    with op.batch_alter_table('hold') as batch_op:
+        batch_op.drop_constraint('fk_hold_work_id', type_='foreignkey')
+        batch_op.drop_column('work_id')
+        batch_op.alter_column('book_id', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_hold_queue', 'hold', ['book_id', 'priority', 'placed_at', 'id'], **WAITING)
+    op.create_index('uq_hold_active_book_student', 'hold', ['book_id', 'student_id'], unique=True, **ACTIVE)
+
+    op.drop_index('ix_book_work_id', table_name='book')
+    reflected = sa.Table('work', sa.MetaData(), autoload_with=op.get_bind())
+    types = {column.name: column.type for column in reflected.columns}
+    for name in WORK_COLUMNS:
+        op.add_column('book', sa.Column(name, types[name], nullable=True))
+    op.execute(book.update().values(**{
+        name: sa.select(work.c[name]).where(work.c.id == book.c.work_id).scalar_subquery()
+        for name in WORK_COLUMNS
+    }))
+    with op.batch_alter_table('book') as batch_op:
+        batch_op.drop_constraint('fk_book_work_id', type_='foreignkey')
+        batch_op.drop_column('work_id')
+        for name in WORK_COLUMNS:
+            if name not in ('course', 'duration_days'):
+                batch_op.alter_column(name, existing_type=types[name], nullable=False)
+
+    # The previous release builds its search index over the book table on startup
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS work_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_work_search')
+    op.drop_index('ix_work_available', table_name='work')
+    op.drop_index('uq_work_identity', table_name='work')
+    op.drop_table('work')
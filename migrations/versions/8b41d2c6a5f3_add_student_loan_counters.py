@@ -0,0 +1,56 @@
+"""add student loan counters and profile indexes
+
+Revision ID: 8b41d2c6a5f3
+Revises: c8f4a2e6d1b9
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d2c6a5f3'
+down_revision = 'c8f4a2e6d1b9'
+branch_labels = None
+depends_on = None
+
+OPEN_LOANS = {
+    'sqlite_where': sa.text('returned = 0'),
+    'postgresql_where': sa.text('returned = false'),
+}
+
+COUNTERS = (
+    ('active_loans', sa.Integer()),
+    ('total_loans', sa.Integer()),
+    ('outstanding_fine', sa.Float()),
+)
+
+BACKFILL = """
+UPDATE student SET
+    active_loans = (SELECT COUNT(*) FROM issue
+                    WHERE issue.student_id = student.id AND issue.returned = :open),
+    total_loans = (SELECT COUNT(*) FROM issue WHERE issue.student_id = student.id),
+    outstanding_fine = (SELECT COALESCE(SUM(issue.fine), 0) FROM issue
+                        WHERE issue.student_id = student.id AND issue.returned = :open AND issue.fine > 0)
+"""
+
+
+def upgrade():
+    # Databases created with init_db.py (create_all) may already have these
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('student')}
+    with op.batch_alter_table('student') as batch:
+        for name, column_type in COUNTERS:
+            if name not in existing:
+                batch.add_column(sa.Column(name, column_type, nullable=False, server_default='0'))
+    op.get_bind().execute(sa.text(BACKFILL).bindparams(sa.bindparam('open', False, sa.Boolean())))
+    op.create_index('ix_issue_open_student_id', 'issue', ['student_id'], if_not_exists=True, **OPEN_LOANS)
+    op.create_index('ix_issue_student_id', 'issue', ['student_id', 'id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_issue_student_id', table_name='issue')
+    op.drop_index('ix_issue_open_student_id', table_name='issue')
+    with op.batch_alter_table('student') as batch:
+        for name, _ in reversed(COUNTERS):
+            batch.drop_column(name)
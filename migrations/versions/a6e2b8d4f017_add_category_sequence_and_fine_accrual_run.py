@@ -0,0 +1,43 @@
+"""add category_sequence and fine_accrual_run
+
+Revision ID: a6e2b8d4f017
+Revises: 3f2a9c1d7e40
+Create Date: 2026-10-18 21:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e2b8d4f017'
+down_revision = '3f2a9c1d7e40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = sa.inspect(op.get_bind())
+    # Rows are seeded from the highest existing book code on first use (CategorySequence._initialize)
+    if not existing.has_table('category_sequence'):
+        op.create_table(
+            'category_sequence',
+            sa.Column('category_code', sa.String(length=2), nullable=False),
+            sa.Column('last_number', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('category_code')
+        )
+    if not existing.has_table('fine_accrual_run'):
+        op.create_table(
+            'fine_accrual_run',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('rows_touched', sa.Integer(), nullable=False),
+            sa.Column('batches', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('fine_accrual_run')
+    op.drop_table('category_sequence')
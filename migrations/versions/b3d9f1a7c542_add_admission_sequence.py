@@ -0,0 +1,71 @@
+"""add admission_sequence
+
+Revision ID: b3d9f1a7c542
+Revises: a6e2b8d4f017
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d9f1a7c542'
+down_revision = 'a6e2b8d4f017'
+branch_labels = None
+depends_on = None
+
+admission_sequence = sa.table('admission_sequence', sa.column('id', sa.Integer), sa.column('last_value', sa.Integer))
+
+# The admission number permutation as of this revision (AdmissionSequence.permute in models.py)
+MAX_VALUE = 10 ** 8 - 1
+HALF = 10 ** 4
+ROUND_KEYS = (b'shelf', b'stack', b'spine', b'index')
+
+
+def _permutation():
+    round_tables = [
+        [int.from_bytes(hashlib.blake2b(str(half).encode(), digest_size=4, key=key).digest(), 'big') % HALF
+         for half in range(HALF)]
+        for key in ROUND_KEYS
+    ]
+    
+    def permute(value):
+        left, right = divmod(value, HALF)
+        for table in round_tables:
+            left, right = right, (left + table[right]) % HALF
+        return str(left * HALF + right).zfill(8)
+    return permute
+
+
+def _last_allocated_value(connection):
+    """Highest counter value whose admission number, and every earlier one, is already in use.
+
+    The allocator skips values whose number is taken, so starting the counter
+    here only saves it from walking past numbers it handed out before.
+    """
+    taken = set(connection.execute(sa.text('SELECT admission_number FROM student')).scalars())
+    permute = _permutation()
+    last_value = 0
+    while last_value < MAX_VALUE and permute(last_value + 1) in taken:
+        last_value += 1
+    return last_value
+
+
+def upgrade():
+    connection = op.get_bind()
+    if sa.inspect(connection).has_table('admission_sequence'):
+        return
+    op.create_table(
+        'admission_sequence',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(admission_sequence, [{'id': 1, 'last_value': _last_allocated_value(connection)}])
+
+
+def downgrade():
+    op.drop_table('admission_sequence')
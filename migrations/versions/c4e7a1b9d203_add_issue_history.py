@@ -0,0 +1,60 @@
+"""add issue_history archive table
+
+Revision ID: c4e7a1b9d203
+Revises: 8b41d2c6a5f3
+Create Date: 2026-10-19 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a1b9d203'
+down_revision = '8b41d2c6a5f3'
+branch_labels = None
+depends_on = None
+
+WITH_FINE = {
+    'sqlite_where': sa.text('fine > 0'),
+    'postgresql_where': sa.text('fine > 0'),
+}
+
+
+def upgrade():
+    # Earlier builds of the application created the table on startup, so it may already exist
+    if not sa.inspect(op.get_bind()).has_table('issue_history'):
+        op.create_table(
+            'issue_history',
+            sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=False),
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('issue_date', sa.DateTime(), nullable=False),
+            sa.Column('due_date', sa.DateTime(), nullable=False),
+            sa.Column('return_date', sa.DateTime(), nullable=True),
+            sa.Column('fine', sa.Float(), nullable=True),
+            sa.Column('returned', sa.Boolean(), nullable=False),
+            sa.Column('issue_duration', sa.Integer(), nullable=True),
+            sa.Column('archived_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['book_id'], ['book.id']),
+            sa.ForeignKeyConstraint(['student_id'], ['student.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_issue_history_student_id', 'issue_history', ['student_id', 'id'], if_not_exists=True)
+    op.create_index('ix_issue_history_book_id', 'issue_history', ['book_id'], if_not_exists=True)
+    op.create_index('ix_issue_history_issue_date', 'issue_history', ['issue_date'], if_not_exists=True)
+    op.create_index('ix_issue_history_with_fine', 'issue_history', ['id'], if_not_exists=True, **WITH_FINE)
+
+
+def downgrade():
+    # Archived issues go back to the issue table before the archive is dropped
+    op.execute(
+        'INSERT INTO issue (id, student_id, book_id, issue_date, due_date, return_date, fine, returned, '
+        'issue_duration) SELECT id, student_id, book_id, issue_date, due_date, return_date, fine, returned, '
+        'issue_duration FROM issue_history'
+    )
+    op.drop_index('ix_issue_history_with_fine', table_name='issue_history')
+    op.drop_index('ix_issue_history_issue_date', table_name='issue_history')
+    op.drop_index('ix_issue_history_book_id', table_name='issue_history')
+    op.drop_index('ix_issue_history_student_id', table_name='issue_history')
+    op.drop_table('issue_history')
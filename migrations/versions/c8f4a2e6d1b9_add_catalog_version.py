@@ -0,0 +1,37 @@
+"""add catalog_version
+
+Revision ID: c8f4a2e6d1b9
+Revises: b3d9f1a7c542
+Create Date: 2026-10-18 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f4a2e6d1b9'
+down_revision = 'b3d9f1a7c542'
+branch_labels = None
+depends_on = None
+
+catalog_version = sa.table('catalog_version', sa.column('id', sa.Integer), sa.column('version', sa.Integer))
+
+
+def upgrade():
+    connection = op.get_bind()
+    # Earlier builds of the application created the table on startup, so it may already exist
+    if not sa.inspect(connection).has_table('catalog_version'):
+        op.create_table(
+            'catalog_version',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    # Create the version row up front so writers only ever UPDATE it
+    if connection.execute(sa.select(catalog_version.c.id).where(catalog_version.c.id == 1)).first() is None:
+        op.bulk_insert(catalog_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
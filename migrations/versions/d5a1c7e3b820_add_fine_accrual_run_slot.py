@@ -0,0 +1,28 @@
+"""add fine_accrual_run slot lease
+
+Revision ID: d5a1c7e3b820
+Revises: 7a2d4f9e1c35
+Create Date: 2026-10-19 07:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a1c7e3b820'
+down_revision = '7a2d4f9e1c35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Runs recorded so far were unscheduled as far as the lease is concerned
+    op.add_column('fine_accrual_run', sa.Column('slot', sa.Integer(), nullable=True))
+    op.create_index('uq_fine_accrual_run_slot', 'fine_accrual_run', ['slot'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_fine_accrual_run_slot', table_name='fine_accrual_run')
+    with op.batch_alter_table('fine_accrual_run') as batch_op:
+        batch_op.drop_column('slot')
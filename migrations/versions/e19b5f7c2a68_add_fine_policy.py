@@ -0,0 +1,35 @@
+"""add fine_policy table
+
+Revision ID: e19b5f7c2a68
+Revises: c4e7a1b9d203
+Create Date: 2026-10-19 03:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19b5f7c2a68'
+down_revision = 'c4e7a1b9d203'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Earlier builds of the application created the table on startup, so it may already exist
+    if not sa.inspect(op.get_bind()).has_table('fine_policy'):
+        op.create_table(
+            'fine_policy',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('category', sa.String(length=50), nullable=True),
+            sa.Column('book_type', sa.String(length=50), nullable=True),
+            sa.Column('rate_per_day', sa.Float(), nullable=False),
+            sa.Column('grace_period_days', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('category', 'book_type', name='uq_fine_policy_scope')
+        )
+
+
+def downgrade():
+    op.drop_table('fine_policy')
@@ -0,0 +1,41 @@
+"""add work full-text search index
+
+Revision ID: e7b3d9f2a416
+Revises: d5a1c7e3b820
+Create Date: 2026-10-19 08:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d9f2a416'
+down_revision = 'd5a1c7e3b820'
+branch_labels = None
+depends_on = None
+
+PG_VECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    # Earlier builds of the application created the index on startup, so it may already exist
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS work_fts "
+            "USING fts5(title, author, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Rebuilt whole: `flask rebuild-search-index` does the same to repair it later
+        op.execute('DELETE FROM work_fts')
+        op.execute('INSERT INTO work_fts (rowid, title, author) SELECT id, title, author FROM work')
+    elif dialect == 'postgresql':
+        op.execute(f'CREATE INDEX IF NOT EXISTS ix_work_search ON work USING GIN ({PG_VECTOR})')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS work_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_work_search')
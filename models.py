@@ -1,20 +1,94 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
+import hashlib
 
 db = SQLAlchemy()
 
 class Student(db.Model):
+    __table_args__ = (
+        # Case-insensitive name prefix search for the typeahead
+        db.Index('ix_student_name_lower', db.func.lower(db.text('name'))),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
     admission_number = db.Column(db.String(8), unique=True, nullable=False)
     course = db.Column(db.String(100), nullable=False)
+    # Maintained by services/loan_counters.py; `flask reconcile-loan-counters` rebuilds them
+    active_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_loans = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    outstanding_fine = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
     issues = db.relationship('Issue', backref='student', lazy=True)
+    holds = db.relationship('Hold', backref='student', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Student {self.name}>'
+    
+    @staticmethod
+    def generate_admission_number():
+        """Allocate a unique 8-digit admission number"""
+        return Student.reserve_admission_numbers(1)[0]
+    
+    @staticmethod
+    def reserve_admission_numbers(count, exclude=()):
+        """Allocate `count` unique 8-digit admission numbers in a few round trips.
+        
+        Numbers come from an atomically advanced counter passed through a fixed
+        permutation of the 8-digit space, so concurrent callers never get the
+        same number and nothing is probed at random. Counter values that land on
+        a number already in use (entered by hand, or from before the allocator)
+        or in `exclude` are skipped. Like book codes, the reservation belongs to
+        the current transaction.
+        """
+        exclude = set(exclude)
+        numbers = []
+        while len(numbers) < count:
+            needed = count - len(numbers)
+            last_value = AdmissionSequence.advance(needed)
+            candidates = [
+                AdmissionSequence.permute(value) for value in range(last_value - needed + 1, last_value + 1)
+            ]
+            taken = set(exclude)
+            for start in range(0, len(candidates), 500):
+                taken.update(db.session.execute(
+                    db.select(Student.admission_number)
+                    .where(Student.admission_number.in_(candidates[start:start + 500]))
+                ).scalars())
+            numbers.extend(number for number in candidates if number not in taken)
+        return numbers
+
+class Work(db.Model):
+    """A title in the catalog; its physical copies are Book rows (see services/inventory.py)"""
+    __table_args__ = (
+        # Copies of the same title, author and course belong to one work
+        db.Index('uq_work_identity', 'title', 'author', db.func.coalesce(db.text('course'), ''), unique=True),
+        # Book picker: titles with a copy on the shelf
+        db.Index('ix_work_available', 'id',
+                 sqlite_where=db.text('available_copies > 0'), postgresql_where=db.text('available_copies > 0')),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    book_type = db.Column(db.String(50), nullable=False)  # textbook or reference
+    category = db.Column(db.String(50), nullable=False, default='general')  # Book category for code generation
+    course = db.Column(db.String(100), nullable=True)  # Course correlation
+    duration_type = db.Column(db.String(50), nullable=False, default='semester')  # semester or specific
+    duration_days = db.Column(db.Integer, nullable=True)  # For specific period books
+    # Maintained by services/inventory.py; `flask reconcile-copy-counters` rebuilds them
+    total_copies = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    available_copies = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    copies = db.relationship('Book', backref=db.backref('work', lazy='joined'), lazy=True,
+                             cascade='all, delete-orphan')
+    holds = db.relationship('Hold', backref='work', lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Work {self.title}>'
 
 class Book(db.Model):
+    """One physical copy of a Work, with its own book code and barcode"""
     # Category code mapping for different book categories
     CATEGORY_CODES = {
         'technology': '01',
@@ -28,48 +102,42 @@ class Book(db.Model):
         'history': '09',
         'general': '10'
     }
+    BOOK_TYPES = ('textbook', 'reference')
+    
+    __table_args__ = (
+        # Copies of a work, free ones first: claiming any free copy, copy counts
+        db.Index('ix_book_work_id', 'work_id', 'available'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    author = db.Column(db.String(100), nullable=False)
-    book_type = db.Column(db.String(50), nullable=False)  # textbook or reference
-    category = db.Column(db.String(50), nullable=False, default='general')  # Book category for code generation
-    course = db.Column(db.String(100), nullable=True)  # Course correlation
-    duration_type = db.Column(db.String(50), nullable=False, default='semester')  # semester or specific
-    duration_days = db.Column(db.Integer, nullable=True)  # For specific period books
+    work_id = db.Column(db.Integer, db.ForeignKey('work.id'), nullable=False)
     book_code = db.Column(db.String(6), unique=True, nullable=False)  # 6-digit unique code (category + number)
     barcode = db.Column(db.String(20), unique=True, nullable=True)  # Barcode representation
     available = db.Column(db.Boolean, default=True)
     issues = db.relationship('Issue', backref='book', lazy=True)
 
     def __repr__(self):
-        return f'<Book {self.title}>'
+        return f'<Book {self.book_code}>'
     
     @staticmethod
     def generate_book_code(category):
         """Generate a unique 6-digit book code based on category and sequential number"""
-        category_code = Book.CATEGORY_CODES.get(category.lower(), '10')  # Default to general
-        
-        # Find the highest book number for this category
-        books_in_category = Book.query.filter(Book.book_code.like(f'{category_code}%')).all()
+        return Book.reserve_book_codes(category, 1)[0]
+    
+    @staticmethod
+    def reserve_book_codes(category, count):
+        """Reserve `count` consecutive book codes for a category in one round trip.
         
-        if books_in_category:
-            # Extract the numeric part (last 4 digits) and find the max
-            max_number = 0
-            for book in books_in_category:
-                if book.book_code and len(book.book_code) == 6:
-                    try:
-                        num = int(book.book_code[2:])
-                        max_number = max(max_number, num)
-                    except ValueError:
-                        continue
-            next_number = max_number + 1
-        else:
-            next_number = 1
+        The codes belong to the current transaction: they are released again if
+        it rolls back, and concurrent writers wait on the sequence row instead of
+        handing out the same code twice.
+        """
+        category_code = Book.CATEGORY_CODES.get(category.lower(), '10')  # Default to general
+        last_number = CategorySequence.advance(category_code, count)
+        first_number = last_number - count + 1
         
         # Format as 4-digit number with leading zeros
-        book_number = str(next_number).zfill(4)
-        return f'{category_code}{book_number}'
+        return [f'{category_code}{str(number).zfill(4)}' for number in range(first_number, last_number + 1)]
     
     def generate_barcode(self):
         """Generate barcode string from book code"""
@@ -77,11 +145,164 @@ class Book(db.Model):
             # Simple barcode representation - in real system would use actual barcode format
             self.barcode = f'LIB{self.book_code}'
 
+class CategorySequence(db.Model):
+    """Last book number handed out per category code, advanced atomically"""
+    MAX_NUMBER = 9999  # Book numbers are the last 4 digits of the book code
+    
+    category_code = db.Column(db.String(2), primary_key=True)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def advance(category_code, count=1):
+        """Advance the sequence by `count` and return the new last number.
+        
+        The UPDATE takes the row (or, on SQLite, database) write lock, which is
+        held until the caller's transaction ends.
+        """
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        
+        table = CategorySequence.__table__
+        increment = table.update().where(
+            table.c.category_code == category_code
+        ).values(last_number=table.c.last_number + count)
+        
+        if db.session.execute(increment).rowcount == 0:
+            CategorySequence._initialize(category_code)
+            db.session.execute(increment)
+        
+        last_number = db.session.execute(
+            db.select(table.c.last_number).where(table.c.category_code == category_code)
+        ).scalar_one()
+        if last_number > CategorySequence.MAX_NUMBER:
+            raise OverflowError(f'No book codes left in category {category_code}')
+        return last_number
+
+    @staticmethod
+    def _initialize(category_code):
+        """Create the sequence row, seeded from the highest existing code in the category"""
+        existing_max = db.session.execute(CategorySequence.highest_number_statement(category_code)).scalar()
+        try:
+            # Savepoint so losing the race to another writer doesn't abort the caller's transaction
+            with db.session.begin_nested():
+                db.session.execute(CategorySequence.__table__.insert().values(
+                    category_code=category_code, last_number=existing_max or 0
+                ))
+        except IntegrityError:
+            pass
+
+    @staticmethod
+    def highest_number_statement(category_code):
+        """SELECT of the highest number among the existing book codes in the category"""
+        # A code range rather than LIKE, which SQLite only plans on the book_code index for NOCASE columns
+        upper_bound = category_code[:-1] + chr(ord(category_code[-1]) + 1)
+        return db.select(db.func.max(db.cast(db.func.substr(Book.book_code, 3), db.Integer))) \
+            .where(Book.book_code >= category_code, Book.book_code < upper_bound)
+
+    def __repr__(self):
+        return f'<CategorySequence {self.category_code}: {self.last_number}>'
+
+class AdmissionSequence(db.Model):
+    """Counter behind allocated admission numbers (a single row), advanced atomically"""
+    MAX_VALUE = 10 ** 8 - 1  # Every 8-digit number once
+    HALF = 10 ** 4  # The permutation is a Feistel network over two 4-digit halves
+    ROUND_KEYS = (b'shelf', b'stack', b'spine', b'index')  # Never change: numbers already issued depend on them
+    _round_tables = None
+    
+    id = db.Column(db.Integer, primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def advance(count=1):
+        """Advance the counter by `count` and return the new last value"""
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        
+        table = AdmissionSequence.__table__
+        increment = table.update().where(table.c.id == 1).values(last_value=table.c.last_value + count)
+        
+        if db.session.execute(increment).rowcount == 0:
+            try:
+                # Savepoint so losing the race to another writer doesn't abort the caller's transaction
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(id=1, last_value=0))
+            except IntegrityError:
+                pass
+            db.session.execute(increment)
+        
+        last_value = db.session.execute(db.select(table.c.last_value).where(table.c.id == 1)).scalar_one()
+        if last_value > AdmissionSequence.MAX_VALUE:
+            raise OverflowError('No admission numbers left')
+        return last_value
+
+    @staticmethod
+    def permute(value):
+        """Map a counter value to its 8-digit admission number (a bijection on 0..99999999)"""
+        if AdmissionSequence._round_tables is None:
+            AdmissionSequence._round_tables = [
+                [int.from_bytes(hashlib.blake2b(str(half).encode(), digest_size=4, key=key).digest(), 'big')
+                 % AdmissionSequence.HALF for half in range(AdmissionSequence.HALF)]
+                for key in AdmissionSequence.ROUND_KEYS
+            ]
+        left, right = divmod(value, AdmissionSequence.HALF)
+        for table in AdmissionSequence._round_tables:
+            left, right = right, (left + table[right]) % AdmissionSequence.HALF
+        return str(left * AdmissionSequence.HALF + right).zfill(8)
+
+    def __repr__(self):
+        return f'<AdmissionSequence {self.last_value}>'
+
+class CatalogVersion(db.Model):
+    """Counter bumped by every committed write to books, students or issues (a single row)"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def current():
+        """The catalog version as of this transaction"""
+        table = CatalogVersion.__table__
+        return db.session.execute(db.select(table.c.version).where(table.c.id == 1)).scalar() or 0
+
+    @staticmethod
+    def bump(connection):
+        """Increment the version on `connection` (its own short transaction, after the write commits); return it"""
+        table = CatalogVersion.__table__
+        if connection.execute(table.update().where(table.c.id == 1).values(version=table.c.version + 1)).rowcount == 0:
+            connection.execute(table.insert().values(id=1, version=1))
+            return 1
+        return connection.execute(db.select(table.c.version).where(table.c.id == 1)).scalar()
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
 class Issue(db.Model):
     DEFAULT_DURATION_DAYS = 14  # Default duration for semester books
+    # Fine rules when no FinePolicy row applies (see services/fine_policy.py)
     FINE_RATE_PER_DAY = 20.0  # Fine rate in rupees per day
     GRACE_PERIOD_DAYS = 12  # Grace period for re-issue or return before fine applies
     
+    __table_args__ = (
+        # Open loans: issue page and fine accrual batches
+        db.Index('ix_issue_open', 'id',
+                 sqlite_where=db.text('returned = 0'), postgresql_where=db.text('returned = false')),
+        # Open loan of a given book: return paths
+        db.Index('ix_issue_open_book_id', 'book_id',
+                 sqlite_where=db.text('returned = 0'), postgresql_where=db.text('returned = false')),
+        # All loans of a book (Book.issues, deletes)
+        db.Index('ix_issue_book_id', 'book_id'),
+        # Student history, newest first
+        db.Index('ix_issue_student_issue_date', 'student_id', 'issue_date'),
+        # Student profile: open loans, and returned history paged by id
+        db.Index('ix_issue_open_student_id', 'student_id',
+                 sqlite_where=db.text('returned = 0'), postgresql_where=db.text('returned = false')),
+        db.Index('ix_issue_student_id', 'student_id', 'id'),
+        # Date-range exports and reports
+        db.Index('ix_issue_issue_date', 'issue_date'),
+        # Fine pages only look at issues carrying a fine
+        db.Index('ix_issue_with_fine', 'id',
+                 sqlite_where=db.text('fine > 0'), postgresql_where=db.text('fine > 0')),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
@@ -105,35 +326,29 @@ class Issue(db.Model):
             self.due_date = self.issue_date + timedelta(days=self.issue_duration)
         elif self.book_id:
             book = Book.query.get(self.book_id)
-            if book and book.duration_type == 'specific' and book.duration_days:
-                # Use book's specific duration
-                self.due_date = self.issue_date + timedelta(days=book.duration_days)
-            else:
-                # Default to standard duration for semester books
-                self.due_date = self.issue_date + timedelta(days=self.DEFAULT_DURATION_DAYS)
-
-    def calculate_fine(self):
-        if self.returned and self.return_date:
-            grace_period_end = self.due_date + timedelta(days=self.GRACE_PERIOD_DAYS)
-            if self.return_date > grace_period_end:
-                days_late = (self.return_date - grace_period_end).days
-                self.fine = days_late * self.FINE_RATE_PER_DAY
-        elif not self.returned:
-            grace_period_end = self.due_date + timedelta(days=self.GRACE_PERIOD_DAYS)
-            if datetime.utcnow() > grace_period_end:
-                days_late = (datetime.utcnow() - grace_period_end).days
-                self.fine = days_late * self.FINE_RATE_PER_DAY
-    
-    def get_days_late(self):
+            self.due_date = Issue.due_date_for(book, self.issue_date)
+    
+    @staticmethod
+    def due_date_for(book, issue_date, issue_duration=None):
+        """Due date for issuing `book` (a copy) at `issue_date`, honouring a custom duration"""
+        if issue_duration:
+            return issue_date + timedelta(days=issue_duration)
+        work = book.work if book else None
+        if work and work.duration_type == 'specific' and work.duration_days:
+            # Use the title's specific duration
+            return issue_date + timedelta(days=work.duration_days)
+        # Default to standard duration for semester books
+        return issue_date + timedelta(days=Issue.DEFAULT_DURATION_DAYS)
+
+    def calculate_fine(self, now=None):
+        """Assess the fine under the fine policy; a fine already accrued is kept if the issue is not late"""
+        from services.fine_policy import assess_fines
+        assess_fines([self], now)
+    
+    def get_days_late(self, now=None):
         """Get the number of days this issue is/was late"""
-        grace_period_end = self.due_date + timedelta(days=self.GRACE_PERIOD_DAYS)
-        if self.returned and self.return_date:
-            if self.return_date > grace_period_end:
-                return (self.return_date - grace_period_end).days
-        elif not self.returned:
-            if datetime.utcnow() > grace_period_end:
-                return (datetime.utcnow() - grace_period_end).days
-        return 0
+        from services.fine_policy import evaluate
+        return evaluate([self], now)[self.id].days_late
     
     def get_days_issued(self):
         """Get the total number of days book has been issued"""
@@ -142,13 +357,138 @@ class Issue(db.Model):
         else:
             return (datetime.utcnow() - self.issue_date).days
     
-    def get_grace_days_remaining(self):
+    def get_grace_days_remaining(self, now=None):
         """Get the number of days remaining in grace period"""
-        grace_period_end = self.due_date + timedelta(days=self.GRACE_PERIOD_DAYS)
-        if not self.returned:
-            days_remaining = (grace_period_end - datetime.utcnow()).days
-            return max(0, days_remaining)
-        return 0
+        from services.fine_policy import evaluate
+        return evaluate([self], now)[self.id].grace_days_remaining
 
     def __repr__(self):
         return f'<Issue {self.id}>'
+
+class IssueHistory(db.Model):
+    """Returned issues moved out of the issue table by services/archive.py, keeping their ids"""
+    __tablename__ = 'issue_history'
+    __table_args__ = (
+        # Student history pages, newest first
+        db.Index('ix_issue_history_student_id', 'student_id', 'id'),
+        # Book deletion checks for archived loans of the book
+        db.Index('ix_issue_history_book_id', 'book_id'),
+        # Date-range exports and reports
+        db.Index('ix_issue_history_issue_date', 'issue_date'),
+        # Fine pages only look at issues carrying a fine
+        db.Index('ix_issue_history_with_fine', 'id',
+                 sqlite_where=db.text('fine > 0'), postgresql_where=db.text('fine > 0')),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    issue_date = db.Column(db.DateTime, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=False)
+    return_date = db.Column(db.DateTime, nullable=True)
+    fine = db.Column(db.Float, default=0.0)
+    returned = db.Column(db.Boolean, nullable=False, default=True)
+    issue_duration = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<IssueHistory {self.id}>'
+
+# Columns shared by issue and issue_history, in the order the union selects them
+ISSUE_RECORD_COLUMNS = ('id', 'student_id', 'book_id', 'issue_date', 'due_date', 'return_date',
+                        'fine', 'returned', 'issue_duration')
+
+issue_records = db.union_all(
+    db.select(*[Issue.__table__.c[name] for name in ISSUE_RECORD_COLUMNS]),
+    db.select(*[IssueHistory.__table__.c[name] for name in ISSUE_RECORD_COLUMNS])
+).subquery('issue_records')
+
+class IssueRecord(db.Model):
+    """Read-only union view of current (issue) and archived (issue_history) loans"""
+    __table__ = issue_records
+    __mapper_args__ = {'primary_key': [issue_records.c.id]}
+    
+    student = db.relationship('Student', primaryjoin='foreign(IssueRecord.student_id) == Student.id',
+                              viewonly=True)
+    book = db.relationship('Book', primaryjoin='foreign(IssueRecord.book_id) == Book.id', viewonly=True)
+    
+    get_days_late = Issue.get_days_late
+    get_days_issued = Issue.get_days_issued
+
+    def __repr__(self):
+        return f'<IssueRecord {self.id}>'
+
+class FineAccrualRun(db.Model):
+    """Record of a background fine-accrual pass over open issues"""
+    __table_args__ = (
+        # One scheduled run per interval however many workers run the scheduler
+        db.Index('uq_fine_accrual_run_slot', 'slot', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slot = db.Column(db.Integer, nullable=True)  # Scheduler interval claimed by this run; NULL for manual runs
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    rows_touched = db.Column(db.Integer, nullable=False, default=0)
+    batches = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<FineAccrualRun {self.started_at}>'
+
+class FinePolicy(db.Model):
+    """Fine rate and grace period for a book category and/or type; NULL matches any"""
+    __tablename__ = 'fine_policy'
+    __table_args__ = (
+        db.UniqueConstraint('category', 'book_type', name='uq_fine_policy_scope'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), nullable=True)  # One of Book.CATEGORY_CODES, or any
+    book_type = db.Column(db.String(50), nullable=True)  # One of Book.BOOK_TYPES, or any
+    rate_per_day = db.Column(db.Float, nullable=False)
+    grace_period_days = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<FinePolicy {self.category or "*"}/{self.book_type or "*"}>'
+
+class Hold(db.Model):
+    """A student's place in the queue for a title with no copy on the shelf (see services/holds.py)"""
+    WAITING = 'waiting'  # Queued until a copy comes back
+    READY = 'ready'  # Copy `book_id` set aside for the student until expires_at
+    FULFILLED = 'fulfilled'
+    CANCELLED = 'cancelled'
+    EXPIRED = 'expired'
+    ACTIVE_STATUSES = (WAITING, READY)
+    
+    __table_args__ = (
+        # Head of a title's queue: course priority first, then first come first served
+        db.Index('ix_hold_queue', 'work_id', 'priority', 'placed_at', 'id',
+                 sqlite_where=db.text("status = 'waiting'"), postgresql_where=db.text("status = 'waiting'")),
+        # Uncollected copies whose pickup window has run out, for the expiry sweep
+        db.Index('ix_hold_ready_expires_at', 'expires_at',
+                 sqlite_where=db.text("status = 'ready'"), postgresql_where=db.text("status = 'ready'")),
+        # The hold a copy is set aside for, when it is scanned at the desk
+        db.Index('ix_hold_ready_book_id', 'book_id',
+                 sqlite_where=db.text("status = 'ready'"), postgresql_where=db.text("status = 'ready'")),
+        # One active hold per student and title
+        db.Index('uq_hold_active_work_student', 'work_id', 'student_id', unique=True,
+                 sqlite_where=db.text("status IN ('waiting', 'ready')"),
+                 postgresql_where=db.text("status IN ('waiting', 'ready')")),
+        # Student profile: the student's holds
+        db.Index('ix_hold_student_id', 'student_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    work_id = db.Column(db.Integer, db.ForeignKey('work.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=True)  # Copy set aside once ready
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=1)  # Lower is served first
+    status = db.Column(db.String(10), nullable=False, default=WAITING)
+    placed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)  # Pickup deadline once ready
+    closed_at = db.Column(db.DateTime, nullable=True)
+    book = db.relationship('Book')
+
+    def __repr__(self):
+        return f'<Hold {self.work_id} for {self.student_id} ({self.status})>'
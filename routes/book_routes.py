@@ -1,21 +1,57 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import db, Book
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify
+from models import db, Book, IssueHistory, Work
+from services.pagination import KeysetPage, RankedPage, keyset_paginate, page_args
+from services.book_search import exact_lookup, search_catalog
+from services.book_lookup import lookup_cache
+from services.availability import availability_index
+from services.inventory import SettingsConflict, add_copies, first_copy_codes, get_or_create_work
+from services.holds import allocate_new_copies
+from services.response_cache import cached_listing
 
 bp = Blueprint('books', __name__, url_prefix='/books')
 
+MAX_COPIES_PER_ADD = 500
+
+def _copies_arg():
+    """Number of copies from the form (default 1), or None if it is not a number in range"""
+    try:
+        copies = int(request.form.get('copies') or 1)
+    except ValueError:
+        return None
+    return copies if 1 <= copies <= MAX_COPIES_PER_ADD else None
+
+def _serve_holds(books):
+    """Set new copies aside for their title's waiting holds, as a return would; return their codes"""
+    db.session.flush()
+    held = allocate_new_copies([book.id for book in books])
+    return [book.book_code for book in books if book.id in held]
+
+def _flash_held(codes):
+    if codes:
+        flash(f'{len(codes)} of the new copies are on hold (Code: {", ".join(codes)}): '
+              f'set them aside for the next students in the queue.', 'warning')
+
 @bp.route('/')
+@cached_listing
 def manage_books():
     search_query = request.args.get('search', '')
-    if search_query:
-        books = Book.query.filter(
-            (Book.title.ilike(f'%{search_query}%')) |
-            (Book.author.ilike(f'%{search_query}%')) |
-            (Book.book_code.ilike(f'%{search_query}%')) |
-            (Book.barcode.ilike(f'%{search_query}%'))
-        ).all()
+    paging = page_args()
+    
+    if search_query.strip():
+        exact_book = exact_lookup(search_query)
+        if exact_book:
+            # Exact book code or barcode: served straight from the unique index
+            page = KeysetPage([exact_book.work], paging['per_page'])
+        else:
+            # Titles with a copy whose code starts with the query, then ranked full-text search
+            offset = max(0, request.args.get('offset', 0, type=int))
+            works = search_catalog(search_query, limit=paging['per_page'] + 1, offset=offset)
+            page = RankedPage(works[:paging['per_page']], paging['per_page'], offset=offset,
+                              has_next=len(works) > paging['per_page'])
     else:
-        books = Book.query.all()
-    return render_template('manage_books.html', books=books, search_query=search_query)
+        page = keyset_paginate(Work.query, Work.id, **paging)
+    return render_template('manage_books.html', works=page.items, page=page, search_query=search_query,
+                           first_codes=first_copy_codes(work.id for work in page.items))
 
 @bp.route('/add', methods=['POST'])
 def add_book():
@@ -36,27 +72,36 @@ def add_book():
                 if duration_days_value < 1:
                     flash('Duration days must be a positive number!', 'error')
                     return redirect(url_for('books.manage_books'))
+            copies = _copies_arg()
+            if copies is None:
+                flash(f'Copies must be a number from 1 to {MAX_COPIES_PER_ADD}!', 'error')
+                return redirect(url_for('books.manage_books'))
             
-            # Generate unique book code
-            book_code = Book.generate_book_code(category)
-            
-            book = Book(
-                title=title, 
-                author=author, 
-                book_type=book_type,
-                category=category,
-                course=course,
-                duration_type=duration_type,
-                duration_days=duration_days_value,
-                book_code=book_code
-            )
-            
-            # Generate barcode
-            book.generate_barcode()
-            
-            db.session.add(book)
+            # Copies of a title already in the catalog are added to its work
+            work, created = get_or_create_work({
+                'title': title,
+                'author': author,
+                'book_type': book_type,
+                'category': category,
+                'course': course or None,
+                'duration_type': duration_type,
+                'duration_days': duration_days_value
+            })
+            books = add_copies(work, copies)
+            # A new title has no queue yet; copies of an existing one serve its holds first
+            held = [] if created else _serve_holds(books)
             db.session.commit()
-            flash(f'Book added successfully! Book Code: {book_code}, Barcode: {book.barcode}', 'success')
+            codes = ', '.join(book.book_code for book in books)
+            if created:
+                flash(f'Book added successfully! Book Code: {codes}, Barcode: {books[0].barcode}', 'success')
+            else:
+                flash(f'"{work.title}" is already in the catalog: added {copies} copies (Book Code: {codes})',
+                      'success')
+            _flash_held(held)
+        except SettingsConflict as e:
+            db.session.rollback()
+            flash(f'{e}: no copies were added. Use Add Copies on the existing title to add copies with its '
+                  f'settings.', 'error')
         except ValueError:
             db.session.rollback()
             flash('Invalid duration days. Please enter a valid number!', 'error')
@@ -68,11 +113,35 @@ def add_book():
     
     return redirect(url_for('books.manage_books'))
 
+@bp.route('/<int:id>/copies', methods=['POST'])
+def add_book_copies(id):
+    work = Work.query.get_or_404(id)
+    copies = _copies_arg()
+    if copies is None:
+        flash(f'Copies must be a number from 1 to {MAX_COPIES_PER_ADD}!', 'error')
+        return redirect(url_for('books.manage_books'))
+    try:
+        books = add_copies(work, copies)
+        held = _serve_holds(books)
+        db.session.commit()
+        flash(f'Added {len(books)} copies of "{work.title}" '
+              f'(Book Code: {", ".join(book.book_code for book in books)})', 'success')
+        _flash_held(held)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error adding copies: {str(e)}', 'error')
+    
+    return redirect(url_for('books.manage_books'))
+
 @bp.route('/delete/<int:id>', methods=['POST'])
 def delete_book(id):
-    book = Book.query.get_or_404(id)
+    work = Work.query.get_or_404(id)
+    # Archived loans still reference the copies (SQLite does not enforce the foreign key)
+    if IssueHistory.query.join(Book, Book.id == IssueHistory.book_id).filter(Book.work_id == id).first():
+        flash('Cannot delete a book with archived loans!', 'error')
+        return redirect(url_for('books.manage_books'))
     try:
-        db.session.delete(book)
+        db.session.delete(work)
         db.session.commit()
         flash('Book deleted successfully!', 'success')
     except Exception as e:
@@ -80,3 +149,34 @@ def delete_book(id):
         flash(f'Error deleting book: {str(e)}', 'error')
     
     return redirect(url_for('books.manage_books'))
+
+@bp.route('/available')
+def available_books():
+    """Book picker: a page of titles with free copies matching `q` after work id `after`, as JSON"""
+    query_text = request.args.get('q', '')
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit, current_app.config['TYPEAHEAD_MAX_RESULTS']))
+    
+    availability_index.ensure_current()
+    rows, has_more = availability_index.page(query_text, after=after, limit=limit)
+    return jsonify({
+        'books': [{
+            'id': work_id,
+            'title': title,
+            'author': author,
+            'book_type': book_type,
+            'available_copies': count
+        } for work_id, title, author, book_type, count in rows],
+        'next_after': rows[-1][0] if has_more else None
+    })
+
+@bp.route('/availability-index')
+def availability_index_stats():
+    """Size, version and rebuild counters for the available-books index in this worker"""
+    return jsonify(availability_index.stats())
+
+@bp.route('/lookup-cache')
+def lookup_cache_stats():
+    """Hit/miss counters for the barcode lookup cache in this worker"""
+    return jsonify(lookup_cache.stats())
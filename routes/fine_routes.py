@@ -1,52 +1,31 @@
-from flask import Blueprint, render_template, request
-from models import db, Issue, Student, Book
-from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, jsonify, current_app
+from services.fine_engine import fine_summary, issues_with_fines
+from services.fine_scheduler import last_accrual_run
+from services.fine_policy import current_policy
+from services.exporter import export_response
+from datetime import datetime
 
 bp = Blueprint('fines', __name__, url_prefix='/fines')
 
+def _fine_context():
+    """Build the shared fine page context from stored fines (accrued in the background)"""
+    now = datetime.utcnow()
+    
+    context = fine_summary()
+    context['issues'] = issues_with_fines(now)
+    context['current_time'] = now
+    context['last_accrual'] = last_accrual_run()
+    context['fine_policy'] = current_policy()
+    return context
+
 @bp.route('/')
 def fine_calculator():
-    # Get all issues with fines
-    all_issues = Issue.query.all()
-    
-    # Calculate current fines
-    for issue in all_issues:
-        issue.calculate_fine()
-    db.session.commit()
-    
-    # Get issues with fines
-    issues_with_fines = [issue for issue in all_issues if issue.fine > 0]
-    
-    # Calculate total fines
-    total_fines = sum(issue.fine for issue in issues_with_fines)
-    total_outstanding = sum(issue.fine for issue in issues_with_fines if not issue.returned)
-    total_collected = sum(issue.fine for issue in issues_with_fines if issue.returned)
-    
-    return render_template('fine_calculator.html', 
-                         issues=issues_with_fines,
-                         total_fines=total_fines,
-                         total_outstanding=total_outstanding,
-                         total_collected=total_collected,
-                         current_time=datetime.utcnow())
+    return render_template('fine_calculator.html', **_fine_context())
 
 @bp.route('/calculate', methods=['POST'])
 def calculate_fine():
     """Calculate fine based on manual input"""
-    # Get all issues with fines for the template
-    all_issues = Issue.query.all()
-    
-    # Calculate current fines
-    for issue in all_issues:
-        issue.calculate_fine()
-    db.session.commit()
-    
-    # Get issues with fines
-    issues_with_fines = [issue for issue in all_issues if issue.fine > 0]
-    
-    # Calculate total fines
-    total_fines = sum(issue.fine for issue in issues_with_fines)
-    total_outstanding = sum(issue.fine for issue in issues_with_fines if not issue.returned)
-    total_collected = sum(issue.fine for issue in issues_with_fines if issue.returned)
+    context = _fine_context()
     
     try:
         days_late = int(request.form.get('days_late', 0))
@@ -55,21 +34,33 @@ def calculate_fine():
         calculated_fine = days_late * fine_rate
         
         return render_template('fine_calculator.html',
-                             issues=issues_with_fines,
-                             total_fines=total_fines,
-                             total_outstanding=total_outstanding,
-                             total_collected=total_collected,
-                             current_time=datetime.utcnow(),
                              manual_calculation={
                                  'days_late': days_late,
                                  'fine_rate': fine_rate,
                                  'calculated_fine': calculated_fine
-                             })
+                             },
+                             **context)
     except (ValueError, TypeError):
         return render_template('fine_calculator.html',
-                             issues=issues_with_fines,
-                             total_fines=total_fines,
-                             total_outstanding=total_outstanding,
-                             total_collected=total_collected,
-                             current_time=datetime.utcnow(),
-                             error="Invalid input. Please enter valid numbers.")
+                             error="Invalid input. Please enter valid numbers.",
+                             **context)
+
+@bp.route('/accrual-status')
+def accrual_status():
+    """Report the state of background fine accrual"""
+    status = current_app.extensions['fine_scheduler'].status()
+    
+    # The last run may have happened in another process (e.g. `flask accrue-fines`)
+    run = last_accrual_run()
+    status['last_recorded_run'] = {
+        'started_at': run.started_at.isoformat(),
+        'finished_at': run.finished_at.isoformat(),
+        'rows_touched': run.rows_touched,
+        'batches': run.batches
+    } if run else None
+    return jsonify(status)
+
+@bp.route('/export')
+def export_fines():
+    """Stream fine history as CSV or JSONL (?from=&to=&status=&format=)"""
+    return export_response('fines', fines_only=True)
@@ -1,6 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import db, Issue, Student, Book
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from models import db, Issue, Student, Book, Work
+from services.book_lookup import find_book_by_code
+from services.exporter import export_response
+from services.circulation import batch_issue, batch_return, claim_book, claim_title
+from services.fine_policy import current_policy, evaluate
+from services.holds import allocate_holds, ready_copy
+import re
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('issues', __name__, url_prefix='/issues')
 
@@ -16,43 +23,43 @@ def issue_books():
             # Redirect to student profile for exact admission number match
             return redirect(url_for('students.student_profile', admission_number=student.admission_number))
     
-    # Load all students for client-side filtering
-    students = Student.query.all()
+    # Students and books are looked up incrementally through the typeahead and picker endpoints
+    # Fines are accrued in the background; render the stored values without writing
+    # Student and book are joined in up front; the template shows both for every row
+    issues = Issue.query.filter_by(returned=False).options(
+        joinedload(Issue.student), joinedload(Issue.book)
+    ).all()
+    # Days issued and grace left for every row, against one clock reading
+    assessments = evaluate(issues)
     
-    books = Book.query.filter_by(available=True).all()
-    issues = Issue.query.filter_by(returned=False).all()
-    
-    # Calculate fines for all active issues
-    for issue in issues:
-        issue.calculate_fine()
-    db.session.commit()
-    
-    return render_template('issue_books.html', students=students, books=books, issues=issues, search_query=search_query)
+    return render_template('issue_books.html', issues=issues, assessments=assessments,
+                           fine_policy=current_policy(), search_query=search_query)
 
 @bp.route('/issue', methods=['POST'])
 def issue_book():
     student_id = request.form.get('student_id')
-    book_id = request.form.get('book_id')
+    work_id = request.form.get('work_id')
+    book_id = None
     barcode_input = request.form.get('barcode_scan')
     issue_duration = request.form.get('issue_duration')
     
-    # If barcode is provided, find the book by barcode
+    # If barcode is provided, find the book by barcode; that exact copy is issued
     if barcode_input:
-        book = Book.query.filter(
-            (Book.barcode == barcode_input) | 
-            (Book.book_code == barcode_input)
-        ).first()
+        book = find_book_by_code(barcode_input)
         if book:
             book_id = book.id
         else:
             flash(f'No book found with barcode/code: {barcode_input}', 'error')
             return redirect(url_for('issues.issue_books'))
     
-    if student_id and book_id:
+    if student_id and (book_id or work_id):
         student = Student.query.get(student_id)
-        book = Book.query.get(book_id)
+        book = Book.query.get(book_id) if book_id else None
+        work = book.work if book else Work.query.get(work_id)
         
-        if student and book and book.available:
+        # A copy on hold for this student is issued to them even though it is off the shelf;
+        # from the picker any free copy of the title will do, claimed below
+        if student and work and (book is None or book.available or ready_copy(work.id, student.id) == book.id):
             # Create issue with custom duration if provided
             duration = None
             if issue_duration and issue_duration != 'default':
@@ -66,15 +73,25 @@ def issue_book():
                     flash('Invalid duration value!', 'error')
                     return redirect(url_for('issues.issue_books'))
             
-            issue = Issue(student_id=student_id, book_id=book_id, issue_duration=duration)
-            book.available = False
-            
             try:
+                # Claim the copy in the database: another desk may have issued it since it was loaded
+                if book is not None and not claim_book(book.id, student.id):
+                    db.session.rollback()
+                    flash(f'Book "{work.title}" (Code: {book.book_code}) has just been issued elsewhere!', 'error')
+                    return redirect(url_for('issues.issue_books'))
+                if book is None:
+                    claimed = claim_title(work.id, student.id)
+                    if claimed is None:
+                        db.session.rollback()
+                        flash(f'No copy of "{work.title}" is available: all copies have just been issued!', 'error')
+                        return redirect(url_for('issues.issue_books'))
+                    book = Book.query.get(claimed)
+                issue = Issue(student_id=student_id, book_id=book.id, issue_duration=duration)
                 db.session.add(issue)
                 db.session.flush()  # Flush to assign ID but don't commit yet
                 issue.set_due_date_from_book()  # Set due date based on book
                 db.session.commit()
-                flash(f'Book "{book.title}" (Code: {book.book_code}) issued to {student.name} successfully!', 'success')
+                flash(f'Book "{work.title}" (Code: {book.book_code}) issued to {student.name} successfully!', 'success')
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error issuing book: {str(e)}', 'error')
@@ -85,24 +102,136 @@ def issue_book():
     
     return redirect(url_for('issues.issue_books'))
 
+@bp.route('/batch-issue', methods=['POST'])
+def batch_issue_books():
+    """Issue a list of scanned books to one student in a single transaction.
+
+    Accepts a form (admission_number or student_id, newline-separated `barcodes`)
+    or JSON ({"admission_number": ..., "barcodes": [...], "issue_duration": ...}).
+    JSON requests get per-item results back; form posts are redirected to the profile.
+    """
+    data = request.get_json(silent=True) if request.is_json else request.form
+    data = data or {}
+    barcodes = data.get('barcodes') or []
+    if isinstance(barcodes, str):
+        barcodes = re.split(r'[\s,]+', barcodes)
+    
+    if data.get('admission_number'):
+        student = Student.query.filter_by(admission_number=str(data['admission_number']).strip()).first()
+    elif data.get('student_id'):
+        student = Student.query.get(data['student_id'])
+    else:
+        student = None
+
+    def fail(message, status=400):
+        if request.is_json:
+            return jsonify({'error': message}), status
+        flash(message, 'error')
+        if student:
+            return redirect(url_for('students.student_profile', admission_number=student.admission_number))
+        return redirect(url_for('issues.issue_books'))
+    
+    if not student:
+        return fail('Student not found!', 404)
+    
+    duration = None
+    issue_duration = data.get('issue_duration')
+    if issue_duration and issue_duration != 'default':
+        try:
+            duration = int(issue_duration)
+        except (TypeError, ValueError):
+            return fail('Invalid duration value!')
+        if duration < 1 or duration > 365:
+            return fail('Duration must be between 1 and 365 days!')
+    
+    try:
+        results = batch_issue(student, barcodes, issue_duration=duration)
+    except Exception as e:
+        db.session.rollback()
+        return fail(f'Error issuing books: {str(e)}', 500)
+    
+    issued = [result for result in results if result.ok]
+    failed = [result for result in results if not result.ok]
+    if request.is_json:
+        return jsonify({
+            'student': student.admission_number,
+            'issued': len(issued),
+            'failed': len(failed),
+            'items': [result.to_dict() for result in results]
+        })
+    
+    if issued:
+        flash(f'Issued {len(issued)} book(s) to {student.name}: ' +
+              ', '.join(result.book_code for result in issued), 'success')
+    for result in failed:
+        flash(f'{result.code}: {result.message}', 'error')
+    if not results:
+        flash('Please scan at least one barcode!', 'error')
+    return redirect(url_for('students.student_profile', admission_number=student.admission_number))
+
+@bp.route('/batch-return', methods=['POST'])
+def batch_return_books():
+    """Close the open issues for a list of scanned books (e.g. a book-drop bin) at once.
+
+    Accepts a form with newline-separated `barcodes` or JSON ({"barcodes": [...]}).
+    JSON requests get the per-item results and fine summary back.
+    """
+    data = (request.get_json(silent=True) if request.is_json else request.form) or {}
+    barcodes = data.get('barcodes') or []
+    if isinstance(barcodes, str):
+        barcodes = re.split(r'[\s,]+', barcodes)
+    
+    try:
+        results, summary = batch_return(barcodes)
+    except Exception as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': f'Error returning books: {str(e)}'}), 500
+        flash(f'Error returning books: {str(e)}', 'error')
+        return redirect(url_for('issues.issue_books'))
+    
+    if request.is_json:
+        return jsonify(dict(summary, items=[result.to_dict() for result in results]))
+    
+    if not results:
+        flash('Please scan at least one barcode!', 'error')
+    elif summary['returned']:
+        flash(f'Returned {summary["returned"]} book(s); {summary["fined"]} with fines totalling '
+              f'₹{summary["total_fine"]:.2f}', 'warning' if summary['total_fine'] > 0 else 'success')
+        if summary['held']:
+            flash(f'{summary["held"]} returned book(s) are on hold: ' +
+                  ', '.join(result.book_code for result in results if result.held) +
+                  ' - set them aside for the students queueing', 'warning')
+    failed = [result for result in results if not result.ok]
+    if failed:
+        flash(f'{len(failed)} scan(s) not returned: ' +
+              '; '.join(f'{result.code} ({result.message})' for result in failed[:20]) +
+              (' ...' if len(failed) > 20 else ''), 'error')
+    return redirect(url_for('issues.issue_books'))
+
 @bp.route('/return/<int:id>', methods=['POST'])
 def return_book(id):
     issue = Issue.query.get_or_404(id)
     
     if not issue.returned:
+        now = datetime.utcnow()
         issue.returned = True
-        issue.return_date = datetime.utcnow()
-        issue.calculate_fine()
+        issue.return_date = now
+        issue.calculate_fine(now)
         
         book = Book.query.get(issue.book_id)
-        book.available = True
+        # A book someone is queueing for is set aside for them instead of shelved
+        held = bool(allocate_holds([book.id], now))
+        book.available = not held
         
         try:
             db.session.commit()
             if issue.fine > 0:
-                flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
             else:
-                flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully!', 'success')
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully!', 'success')
+            if held:
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) is on hold: set it aside for the next student in the queue.', 'warning')
         except Exception as e:
             db.session.rollback()
             flash(f'Error returning book: {str(e)}', 'error')
@@ -120,10 +249,7 @@ def return_book_by_barcode():
         return redirect(url_for('issues.issue_books'))
     
     # Find the book by barcode or book code
-    book = Book.query.filter(
-        (Book.barcode == barcode_input) | 
-        (Book.book_code == barcode_input)
-    ).first()
+    book = find_book_by_code(barcode_input)
     
     if not book:
         flash(f'No book found with barcode/code: {barcode_input}', 'error')
@@ -133,23 +259,32 @@ def return_book_by_barcode():
     issue = Issue.query.filter_by(book_id=book.id, returned=False).first()
     
     if not issue:
-        flash(f'Book "{book.title}" (Code: {book.book_code}) is not currently issued!', 'error')
+        flash(f'Book "{book.work.title}" (Code: {book.book_code}) is not currently issued!', 'error')
         return redirect(url_for('issues.issue_books'))
     
     # Return the book
+    now = datetime.utcnow()
     issue.returned = True
-    issue.return_date = datetime.utcnow()
-    issue.calculate_fine()
-    book.available = True
+    issue.return_date = now
+    issue.calculate_fine(now)
+    held = bool(allocate_holds([book.id], now))
+    book.available = not held
     
     try:
         db.session.commit()
         if issue.fine > 0:
-            flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
+            flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
         else:
-            flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully!', 'success')
+            flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully!', 'success')
+        if held:
+            flash(f'Book "{book.work.title}" (Code: {book.book_code}) is on hold: set it aside for the next student in the queue.', 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error returning book: {str(e)}', 'error')
     
     return redirect(url_for('issues.issue_books'))
+
+@bp.route('/export')
+def export_issues():
+    """Stream circulation history as CSV or JSONL (?from=&to=&status=&format=)"""
+    return export_response('issues')
@@ -1,30 +1,71 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import db, Student, Issue
-import random
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from models import db, Student, Issue, IssueHistory, IssueRecord, Hold
+from services.pagination import keyset_paginate, page_args
+from services.book_lookup import find_book_by_code
+from services.circulation import claim_book, claim_title
+from services.fine_policy import current_policy, evaluate
+from services.holds import allocate_holds, cancel_hold, place_hold, queue_positions, ready_copy
+from services.response_cache import cached_listing
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('students', __name__, url_prefix='/students')
 
 @bp.route('/')
+@cached_listing
 def manage_students():
     search_query = request.args.get('search', '')
+    paging = page_args()
+    query = Student.query
     if search_query:
-        students = Student.query.filter(
-            (Student.name.ilike(f'%{search_query}%')) |
-            (Student.admission_number.ilike(f'%{search_query}%')) |
-            (Student.course.ilike(f'%{search_query}%'))
-        ).all()
-        
+        query = query.filter(search_condition(search_query))
+    page = keyset_paginate(query, Student.id, **paging)
+    
+    if search_query and paging['after'] is None and paging['before'] is None:
         # Redirect to student profile if exactly one match or exact admission number match
-        if len(students) == 1:
-            return redirect(url_for('students.student_profile', admission_number=students[0].admission_number))
+        if len(page.items) == 1 and not page.has_next:
+            return redirect(url_for('students.student_profile', admission_number=page.items[0].admission_number))
         
         # Check for exact admission number match
         exact_match = Student.query.filter_by(admission_number=search_query).first()
         if exact_match:
             return redirect(url_for('students.student_profile', admission_number=exact_match.admission_number))
+    return render_template('manage_students.html', students=page.items, page=page, search_query=search_query)
+
+def search_condition(search_query):
+    """Students whose name, admission number or course contains `search_query`"""
+    pattern = f'%{search_query}%'
+    return Student.name.ilike(pattern) | Student.admission_number.ilike(pattern) | Student.course.ilike(pattern)
+
+def typeahead_statement(query_text, limit):
+    """SELECT of students whose admission number or name starts with `query_text`"""
+    # Prefix ranges rather than LIKE so the admission number and lower(name) indexes are used
+    if query_text.isdigit():
+        column, prefix = Student.admission_number, query_text
     else:
-        students = Student.query.all()
-    return render_template('manage_students.html', students=students, search_query=search_query)
+        column, prefix = db.func.lower(Student.name), query_text.lower()
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    
+    return db.select(Student.id, Student.name, Student.admission_number, Student.course) \
+        .where(column >= prefix, column < upper_bound) \
+        .order_by(column, Student.id) \
+        .limit(limit)
+
+@bp.route('/search')
+def search_students():
+    """Typeahead: students whose admission number or name starts with `q`, as JSON"""
+    query_text = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 10, type=int)
+    limit = max(1, min(limit, current_app.config['TYPEAHEAD_MAX_RESULTS']))
+    if not query_text:
+        return jsonify([])
+    
+    students = db.session.execute(typeahead_statement(query_text, limit)).all()
+    return jsonify([{
+        'id': student.id,
+        'name': student.name,
+        'admission_number': student.admission_number,
+        'course': student.course
+    } for student in students])
 
 @bp.route('/add', methods=['POST'])
 def add_student():
@@ -33,14 +74,9 @@ def add_student():
     course = request.form.get('course')
     admission_number = request.form.get('admission_number')
     
-    # Generate a random 8-digit admission number if not provided
+    # Allocate an 8-digit admission number if not provided
     if not admission_number:
-        while True:
-            admission_number = ''.join([str(random.randint(0, 9)) for _ in range(8)])
-            # Check if this admission number already exists
-            existing = Student.query.filter_by(admission_number=admission_number).first()
-            if not existing:
-                break
+        admission_number = Student.generate_admission_number()
     
     if name and course and admission_number:
         # Validate admission number is 8 digits
@@ -77,6 +113,10 @@ def add_student():
 @bp.route('/delete/<int:id>', methods=['POST'])
 def delete_student(id):
     student = Student.query.get_or_404(id)
+    # Archived loans still reference the student (SQLite does not enforce the foreign key)
+    if IssueHistory.query.filter_by(student_id=id).first():
+        flash('Cannot delete a student with archived loans!', 'error')
+        return redirect(url_for('students.manage_students'))
     try:
         db.session.delete(student)
         db.session.commit()
@@ -92,60 +132,61 @@ def student_profile(admission_number):
     """View detailed profile of a student by admission number"""
     student = Student.query.filter_by(admission_number=admission_number).first_or_404()
     
-    # Get all issues for this student
-    issues = Issue.query.filter_by(student_id=student.id).order_by(Issue.issue_date.desc()).all()
-    
-    # Calculate fines for all active issues
-    for issue in issues:
-        issue.calculate_fine()
-    db.session.commit()
+    # Counts and the outstanding fine come from the counters on the student row
+    # Open loans are few; books are joined in up front
+    current_issues = Issue.query.filter_by(student_id=student.id, returned=False).options(
+        joinedload(Issue.book)
+    ).order_by(Issue.issue_date.desc()).all()
+    assessments = evaluate(current_issues)
     
-    # Separate current and returned issues
-    current_issues = [issue for issue in issues if not issue.returned]
-    returned_issues = [issue for issue in issues if issue.returned]
+    holds = Hold.query.filter(Hold.student_id == student.id, Hold.status.in_(Hold.ACTIVE_STATUSES)).options(
+        joinedload(Hold.work), joinedload(Hold.book)
+    ).order_by(Hold.placed_at).all()
     
-    # Calculate total outstanding fine
-    total_fine = sum(issue.fine for issue in current_issues if issue.fine > 0)
-    
-    # Get all available books for issuing
-    from models import Book
-    available_books = Book.query.filter_by(available=True).all()
+    # Returned history, archived loans included, is paged newest first instead of loaded in full
+    history = keyset_paginate(
+        IssueRecord.query.filter_by(student_id=student.id, returned=True).options(joinedload(IssueRecord.book)),
+        IssueRecord.id, descending=True, **page_args()
+    )
     
+    # Books to issue are picked through /books/available rather than listed here
     return render_template('student_profile.html', 
                          student=student, 
-                         issues=issues,
                          current_issues=current_issues,
-                         returned_issues=returned_issues,
-                         total_fine=total_fine,
-                         available_books=available_books)
+                         assessments=assessments,
+                         fine_policy=current_policy(),
+                         holds=holds,
+                         positions=queue_positions(holds),
+                         history=history)
 
 @bp.route('/profile/<admission_number>/issue', methods=['POST'])
 def issue_book_to_student(admission_number):
     """Issue a book to a student from their profile page"""
     student = Student.query.filter_by(admission_number=admission_number).first_or_404()
     
-    book_id = request.form.get('book_id')
+    work_id = request.form.get('work_id')
+    book_id = None
     barcode_input = request.form.get('barcode_scan')
     issue_duration = request.form.get('issue_duration')
     
-    from models import Book
+    from models import Book, Work
     
-    # If barcode is provided, find the book by barcode
+    # If barcode is provided, find the book by barcode; that exact copy is issued
     if barcode_input:
-        book = Book.query.filter(
-            (Book.barcode == barcode_input) | 
-            (Book.book_code == barcode_input)
-        ).first()
+        book = find_book_by_code(barcode_input)
         if book:
             book_id = book.id
         else:
             flash(f'No book found with barcode/code: {barcode_input}', 'error')
             return redirect(url_for('students.student_profile', admission_number=admission_number))
     
-    if book_id:
-        book = Book.query.get(book_id)
+    if book_id or work_id:
+        book = Book.query.get(book_id) if book_id else None
+        work = book.work if book else Work.query.get(work_id)
         
-        if book and book.available:
+        # A copy on hold for this student is issued to them even though it is off the shelf;
+        # from the picker any free copy of the title will do, claimed below
+        if work and (book is None or book.available or ready_copy(work.id, student.id) == book.id):
             # Create issue with custom duration if provided
             duration = None
             if issue_duration and issue_duration != 'default':
@@ -158,15 +199,25 @@ def issue_book_to_student(admission_number):
                     flash('Invalid duration value!', 'error')
                     return redirect(url_for('students.student_profile', admission_number=admission_number))
             
-            issue = Issue(student_id=student.id, book_id=book_id, issue_duration=duration)
-            book.available = False
-            
             try:
+                # Claim the copy in the database: another desk may have issued it since it was loaded
+                if book is not None and not claim_book(book.id, student.id):
+                    db.session.rollback()
+                    flash(f'Book "{work.title}" (Code: {book.book_code}) has just been issued elsewhere!', 'error')
+                    return redirect(url_for('students.student_profile', admission_number=admission_number))
+                if book is None:
+                    claimed = claim_title(work.id, student.id)
+                    if claimed is None:
+                        db.session.rollback()
+                        flash(f'No copy of "{work.title}" is available: all copies have just been issued!', 'error')
+                        return redirect(url_for('students.student_profile', admission_number=admission_number))
+                    book = Book.query.get(claimed)
+                issue = Issue(student_id=student.id, book_id=book.id, issue_duration=duration)
                 db.session.add(issue)
                 db.session.flush()
                 issue.set_due_date_from_book()
                 db.session.commit()
-                flash(f'Book "{book.title}" (Code: {book.book_code}) issued to {student.name} successfully!', 'success')
+                flash(f'Book "{work.title}" (Code: {book.book_code}) issued to {student.name} successfully!', 'success')
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error issuing book: {str(e)}', 'error')
@@ -192,19 +243,24 @@ def return_book_from_profile(admission_number, issue_id):
         return redirect(url_for('students.student_profile', admission_number=admission_number))
     
     if not issue.returned:
+        now = datetime.utcnow()
         issue.returned = True
-        issue.return_date = datetime.utcnow()
-        issue.calculate_fine()
+        issue.return_date = now
+        issue.calculate_fine(now)
         
         book = Book.query.get(issue.book_id)
-        book.available = True
+        # A book someone is queueing for is set aside for them instead of shelved
+        held = bool(allocate_holds([book.id], now))
+        book.available = not held
         
         try:
             db.session.commit()
             if issue.fine > 0:
-                flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully! Fine: ₹{issue.fine:.2f}', 'warning')
             else:
-                flash(f'Book "{book.title}" (Code: {book.book_code}) returned successfully!', 'success')
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) returned successfully!', 'success')
+            if held:
+                flash(f'Book "{book.work.title}" (Code: {book.book_code}) is on hold: set it aside for the next student in the queue.', 'warning')
         except Exception as e:
             db.session.rollback()
             flash(f'Error returning book: {str(e)}', 'error')
@@ -212,3 +268,47 @@ def return_book_from_profile(admission_number, issue_id):
         flash('Book already returned!', 'error')
     
     return redirect(url_for('students.student_profile', admission_number=admission_number))
+
+@bp.route('/profile/<admission_number>/hold', methods=['POST'])
+def place_hold_for_student(admission_number):
+    """Queue a student for a title whose copies are all out, given the code of any copy"""
+    student = Student.query.filter_by(admission_number=admission_number).first_or_404()
+    code = request.form.get('hold_code', '').strip()
+    
+    book = find_book_by_code(code) if code else None
+    if not book:
+        flash(f'No book found with barcode/code: {code}', 'error')
+        return redirect(url_for('students.student_profile', admission_number=admission_number))
+    
+    try:
+        place_hold(student, book.work)
+        db.session.commit()
+        flash(f'Hold placed on "{book.work.title}" for {student.name}', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error placing hold: {str(e)}', 'error')
+    
+    return redirect(url_for('students.student_profile', admission_number=admission_number))
+
+@bp.route('/profile/<admission_number>/holds/<int:hold_id>/cancel', methods=['POST'])
+def cancel_hold_for_student(admission_number, hold_id):
+    """Cancel a student's hold; a book already set aside passes to the next in the queue"""
+    student = Student.query.filter_by(admission_number=admission_number).first_or_404()
+    hold = Hold.query.get_or_404(hold_id)
+    
+    if hold.student_id != student.id or hold.status not in Hold.ACTIVE_STATUSES:
+        flash('Invalid operation!', 'error')
+        return redirect(url_for('students.student_profile', admission_number=admission_number))
+    
+    try:
+        cancel_hold(hold)
+        db.session.commit()
+        flash('Hold cancelled.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error cancelling hold: {str(e)}', 'error')
+    
+    return redirect(url_for('students.student_profile', admission_number=admission_number))
@@ -3,9 +3,9 @@ Seed data script for Library Management System
 This script populates the database with initial book and student data
 """
 from app import app
-from models import db, Book, Student
+from models import db, Work, Student
 from datetime import datetime
-import random
+from services.inventory import add_copies
 
 # Initial book data
 INITIAL_BOOKS = [
@@ -265,7 +265,7 @@ def seed_database():
     """Populate database with initial data"""
     with app.app_context():
         # Check if data already exists
-        if Book.query.first() is not None:
+        if Work.query.first() is not None:
             print("Database already contains books. Skipping book seeding.")
         else:
             print("Seeding books...")
@@ -273,32 +273,22 @@ def seed_database():
                 # Ensure category is set
                 if 'category' not in book_data:
                     book_data['category'] = 'general'
-                
-                # Generate book code
-                # Note: In a real app, strict sequential generation might need locking, 
-                # but for seeding it's fine.
-                book_code = Book.generate_book_code(book_data['category'])
-                
-                book = Book(**book_data)
-                book.book_code = book_code
-                book.generate_barcode()
-                
-                db.session.add(book)
-                # Commit strictly to ensure sequential numbering works if it queries DB
-                db.session.commit()
+            
+            for book_data in INITIAL_BOOKS:
+                work = Work(**book_data)
+                db.session.add(work)
+                # One copy per title; more are added from the Manage Books page
+                add_copies(work, 1)
+            db.session.commit()
             print(f"Added {len(INITIAL_BOOKS)} books to the database.")
         
         if Student.query.first() is not None:
             print("Database already contains students. Skipping student seeding.")
         else:
             print("Seeding students...")
-            for student_data in INITIAL_STUDENTS:
-                # Generate random 8-digit admission number
-                while True:
-                    admission_number = ''.join([str(random.randint(0, 9)) for _ in range(8)])
-                    if not Student.query.filter_by(admission_number=admission_number).first():
-                        break
-                
+            # Allocate all admission numbers in one block
+            admission_numbers = Student.reserve_admission_numbers(len(INITIAL_STUDENTS))
+            for student_data, admission_number in zip(INITIAL_STUDENTS, admission_numbers):
                 student = Student(**student_data)
                 student.admission_number = admission_number
                 db.session.add(student)
@@ -0,0 +1,84 @@
+"""
+Archival of returned issues into issue_history.
+
+Returned issues whose return date is older than ARCHIVE_AFTER_DAYS are
+moved (same id and columns) from the issue table into issue_history,
+a batch of ids per transaction, so the issue table and its indexes stay
+sized to active circulation. A returned issue's fine is settled: it
+counts as collected on the fines page and nothing writes to it again.
+
+Readers that need the whole history (student profile history, exports,
+fine reports, loan counter reconciliation) go through IssueRecord, the
+union view of both tables in models.py; circulation and fine accrual
+only ever touch open loans in the issue table.
+
+The newest issue row is never archived: SQLite hands out max(id) + 1 for
+new rows, so moving it would let a new issue reuse an archived id.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal
+from models import db, Issue, IssueHistory, ISSUE_RECORD_COLUMNS
+
+
+class ArchiveReport:
+    """Progress of one archival pass"""
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.archived = 0
+        self.batches = 0
+        self.started = datetime.utcnow()
+        self.elapsed = 0.0
+
+
+def archivable_batch(cutoff, last_id, newest_id, batch_size):
+    """SELECT of the next `batch_size` archivable issue ids after `last_id`"""
+    return db.select(Issue.id).where(
+        Issue.returned == True,
+        Issue.return_date < cutoff,
+        Issue.id > last_id,
+        Issue.id < newest_id
+    ).order_by(Issue.id).limit(batch_size)
+
+
+def archive_batch(issue_ids, now):
+    """Copy the given returned issues into issue_history and delete them from issue; the caller commits"""
+    columns = [Issue.__table__.c[name] for name in ISSUE_RECORD_COLUMNS]
+    db.session.execute(
+        insert(IssueHistory).from_select(
+            list(ISSUE_RECORD_COLUMNS) + ['archived_at'],
+            db.select(*columns, literal(now, IssueHistory.archived_at.type))
+            .where(Issue.id.in_(issue_ids), Issue.returned == True)
+        )
+    )
+    db.session.execute(
+        delete(Issue).where(Issue.id.in_(issue_ids), Issue.returned == True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def archive_returned_issues(older_than_days, batch_size, now=None, progress=None):
+    """Move returned issues older than `older_than_days` into issue_history, one transaction per batch"""
+    now = now or datetime.utcnow()
+    report = ArchiveReport(now - timedelta(days=older_than_days))
+    newest_id = db.session.execute(db.select(func.max(Issue.id))).scalar()
+    if newest_id is None:
+        return report
+    
+    last_id = 0
+    while True:
+        batch_ids = db.session.execute(
+            archivable_batch(report.cutoff, last_id, newest_id, batch_size)
+        ).scalars().all()
+        if not batch_ids:
+            break
+        archive_batch(batch_ids, now)
+        db.session.commit()
+        report.archived += len(batch_ids)
+        report.batches += 1
+        last_id = batch_ids[-1]
+        if progress:
+            progress(report)
+    
+    report.elapsed = (datetime.utcnow() - report.started).total_seconds()
+    return report
@@ -0,0 +1,275 @@
+"""
+In-memory index of titles with a copy on the shelf, for the book picker.
+
+The circulation desk and student profile used to render every available
+book as an <option>; they now page and search through /books/available,
+served from this per-process index: a bytearray bitmap of work id -> has a
+free copy, the number of free copies per work, and a cached (title,
+author, type) tuple per work. A title with sixty copies is one entry.
+
+The index is maintained incrementally. ORM writes are picked up from the
+session's flushes, and the bulk UPDATEs on copies (claims, batch returns,
+hold releases) report the change in free copies per work through
+record_bulk_availability(), called by services/inventory.py. On commit the
+changes are applied, and if the catalog version bump that follows the
+commit (services/response_cache.py) lands straight on from the version the
+index was at, the index moves to the new version. Anything else (a write by
+another worker, an unreported bulk statement, a rolled back savepoint)
+leaves it behind, and the next lookup rebuilds it from one scan of the
+works with free copies, fetching details only for works it has not seen.
+
+Details of works already indexed are refreshed only by this process's
+own writes; the picker submits work ids, so a title retitled out of band
+shows stale details until the next restart but still issues the right
+title. Only details of works with free copies are loaded; a rebuild
+fetches those of works that have gained one since.
+"""
+import threading
+from sqlalchemy import event, inspect
+from models import db, Book, CatalogVersion, Work
+from services.response_cache import committed_version
+
+DETAIL_CHUNK = 500  # Ids per IN (...) when fetching details of new works
+DEFAULT_PAGE_SIZE = 20
+TRACKED_TABLES = {Book.__tablename__, Work.__tablename__}
+
+
+def _details(work):
+    return (work.title, work.author, work.book_type)
+
+
+def _search_key(details):
+    return ' '.join(value or '' for value in details[:2]).lower()
+
+
+class AvailabilityIndex:
+    """Thread-safe bitmap of work ids with free copies, with free-copy counts and cached picker details"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._available = bytearray()  # Indexed by work id; 1 = a copy is free
+        self._counts = {}  # work id -> free copies, for works with any
+        self._works = {}  # id -> (title, author, book_type)
+        self._keys = {}  # id -> lowercased "title author" for searching
+        self.version = None  # Catalog version the index reflects; None until built
+        self.rebuilds = 0
+        self.commits_applied = 0
+
+    def _set(self, work_id, count):
+        if work_id >= len(self._available):
+            self._available.extend(bytes(work_id + 1 - len(self._available)))
+        self._available[work_id] = 1 if count > 0 else 0
+        if count > 0:
+            self._counts[work_id] = count
+        else:
+            self._counts.pop(work_id, None)
+
+    def _put(self, work_id, details):
+        self._works[work_id] = details
+        self._keys[work_id] = _search_key(details)
+
+    def _drop(self, work_id):
+        self._works.pop(work_id, None)
+        self._keys.pop(work_id, None)
+        self._counts.pop(work_id, None)
+        if work_id < len(self._available):
+            self._available[work_id] = 0
+
+    def ensure_current(self):
+        """Bring the index up to the committed catalog version; one primary-key read when current"""
+        version = CatalogVersion.current()
+        if version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                self._rebuild(version)
+
+    def _rebuild(self, version):
+        if not self._works:
+            rows = db.session.execute(
+                db.select(Work.id, Work.available_copies, Work.title, Work.author, Work.book_type)
+                .where(Work.available_copies > 0)
+            ).all()
+            for row in rows:
+                self._put(row.id, tuple(row[2:]))
+            counts = {row.id: row.available_copies for row in rows}
+        else:
+            # Details of works seen before are kept; only the free-copy counts are re-read
+            counts = dict(db.session.execute(
+                db.select(Work.id, Work.available_copies).where(Work.available_copies > 0)
+            ).all())
+            missing = [work_id for work_id in counts if work_id not in self._works]
+            for start in range(0, len(missing), DETAIL_CHUNK):
+                rows = db.session.execute(
+                    db.select(Work.id, Work.title, Work.author, Work.book_type)
+                    .where(Work.id.in_(missing[start:start + DETAIL_CHUNK]))
+                ).all()
+                for row in rows:
+                    self._put(row.id, tuple(row[1:]))
+        
+        available = bytearray(max(counts, default=0) + 1)
+        for work_id in counts:
+            available[work_id] = 1
+        self._available = available
+        self._counts = counts
+        self.version = version
+        self.rebuilds += 1
+
+    def apply(self, changes, version, complete):
+        """Apply a committed transaction's changes; advance to `version` if nothing was missed"""
+        with self._lock:
+            if self.version is None:
+                return
+            for change in changes:
+                if change[0] == 'put':
+                    self._put(*change[1:])
+                elif change[0] == 'adjust':
+                    work_id, delta = change[1:]
+                    count = self._counts.get(work_id, 0) + delta
+                    if work_id not in self._works and count > 0:
+                        # Gained a free copy but never indexed: the details have to be fetched
+                        complete = False
+                    elif count < 0:
+                        complete = False
+                    else:
+                        self._set(work_id, count)
+                else:
+                    self._drop(change[1])
+            self.commits_applied += 1
+            if complete and version is not None and version - 1 == self.version:
+                self.version = version
+            elif version is not None:
+                # Someone else wrote in between, or this commit wrote something unreported
+                self.version = -1
+
+    def page(self, text='', after=0, limit=DEFAULT_PAGE_SIZE):
+        """Works with free copies, id > `after`, matching `text`, in id order: (rows, has_more)"""
+        text = text.strip().lower()
+        rows = []
+        with self._lock:
+            available = self._available
+            work_id = available.find(1, max(after, 0) + 1)
+            while work_id != -1:
+                if not text or text in self._keys.get(work_id, ''):
+                    if len(rows) == limit:
+                        return rows, True
+                    rows.append((work_id,) + self._works[work_id] + (self._counts[work_id],))
+                work_id = available.find(1, work_id + 1)
+        return rows, False
+
+    def clear(self):
+        with self._lock:
+            self._available = bytearray()
+            self._counts.clear()
+            self._works.clear()
+            self._keys.clear()
+            self.version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'works': len(self._works),
+                'available': len(self._counts),
+                'free_copies': sum(self._counts.values()),
+                'rebuilds': self.rebuilds,
+                'commits_applied': self.commits_applied
+            }
+
+
+availability_index = AvailabilityIndex()
+
+
+def init_app(app):
+    availability_index.clear()
+
+
+def _changes(session):
+    return session.info.setdefault('availability_changes', [])
+
+
+def record_bulk_availability(session, deltas):
+    """Report the change in free copies per work ({work_id: delta}) of a bulk UPDATE on `session`"""
+    _changes(session).extend(('adjust', work_id, delta) for work_id, delta in deltas.items() if delta)
+    session.info['book_writes_recorded'] = session.info.get('book_writes_recorded', 0) + 1
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _count_bulk_write(orm_execute_state):
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if getattr(statement, 'table', None) is not None and statement.table.name in TRACKED_TABLES:
+            session = orm_execute_state.session
+            session.info['book_writes'] = session.info.get('book_writes', 0) + 1
+
+
+def _was_available(book):
+    """Whether a copy was free as last flushed; None if the old value was never loaded"""
+    history = inspect(book).attrs.available.history
+    if history.deleted:
+        return bool(history.deleted[0])
+    if history.unchanged:
+        return bool(history.unchanged[0])
+    return None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_flush(session, flush_context):
+    changes = _changes(session)
+    for work in session.new:
+        if isinstance(work, Work):
+            changes.append(('put', work.id, _details(work)))
+    for work in session.dirty:
+        if isinstance(work, Work) and session.is_modified(work, include_collections=False):
+            changes.append(('put', work.id, _details(work)))
+    for book in session.new:
+        if isinstance(book, Book) and book.available:
+            if book.work is not None:
+                # A new copy may put a title back in the picker that was never indexed
+                changes.append(('put', book.work_id, _details(book.work)))
+            changes.append(('adjust', book.work_id, 1))
+    for book in session.dirty:
+        if isinstance(book, Book) and inspect(book).attrs.available.history.has_changes():
+            was_available = _was_available(book)
+            if was_available is None:
+                session.info['availability_unreliable'] = True
+            elif was_available != bool(book.available):
+                changes.append(('adjust', book.work_id, 1 if book.available else -1))
+    for book in session.deleted:
+        if isinstance(book, Book):
+            was_available = _was_available(book)
+            if was_available is None:
+                session.info['availability_unreliable'] = True
+            elif was_available:
+                changes.append(('adjust', book.work_id, -1))
+    for work in session.deleted:
+        if isinstance(work, Work):
+            changes.append(('drop', work.id))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _distrust_transaction(session):
+    # A rolled back savepoint may have undone changes already recorded
+    session.info['availability_unreliable'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_commit(session):
+    if session.in_nested_transaction():
+        # A released savepoint; its changes are applied with the outer transaction
+        return
+    info = session.info
+    changes = info.get('availability_changes', ())
+    version = committed_version(session)
+    if not changes and version is None:
+        return
+    complete = (info.get('book_writes', 0) == info.get('book_writes_recorded', 0)
+                and not info.get('availability_unreliable'))
+    availability_index.apply(changes, version, complete)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_transaction(session, transaction):
+    if transaction.parent is None:
+        for key in ('availability_changes', 'book_writes', 'book_writes_recorded', 'availability_unreliable'):
+            session.info.pop(key, None)
@@ -0,0 +1,395 @@
+"""
+Route and CLI benchmark suite.
+
+Times every GET page of the books, students, issues and fines blueprints
+through the Flask test client, plus the maintenance CLI commands, against
+whatever data is in the configured database (see `flask generate-data`).
+Each case records wall-clock timings and the number of SQL statements it
+ran. Results are plain JSON so runs from different commits can be compared
+with `flask benchmark --baseline old.json`.
+
+Page timings are cold: the per-process caches (rendered listings, the
+picker's availability index, the barcode lookup cache) are emptied before
+every timed request, so each run does the queries and rendering of a first
+visit. The `[warm]` cases time the cached listing pages as a terminal
+revisiting them sees them. The circulation cases post single and batch
+issues and returns of free copies for a student with no loans, returning
+everything they issue, so each run adds returned issues to the database.
+
+`flask benchmark-engine` instead compares engine profiles: concurrent
+reader threads (fine totals and a catalog page) against writer threads
+rewriting accrual-sized batches of open issues, reporting throughput,
+latency percentiles and lock errors for each profile.
+"""
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, func, update
+from sqlalchemy.exc import OperationalError
+from models import db, Book, Student, Issue, Work
+from services.engine_profiles import PROFILES, apply_sqlite_pragmas, pool_options, sqlite_pragmas
+from services.availability import availability_index
+from services.book_lookup import lookup_cache
+from services.fine_engine import fine_summary_statement
+from services.query_counter import count_statements
+from services.response_cache import response_cache
+
+DEFAULT_REPEAT = 5
+BATCH_CASE_SIZE = 10  # Copies per batch issue / batch return case
+DEFAULT_READERS = 8
+DEFAULT_WRITERS = 2
+DEFAULT_SECONDS = 5.0
+WRITE_BATCH_SIZE = 200  # Open issues rewritten per writer transaction, like one accrual batch
+DEFAULT_THRESHOLD = 0.2  # Median slowdown reported as a regression
+MIN_REGRESSION_MS = 1.0  # Ignore slowdowns smaller than timer noise
+
+
+def busiest_admission_number():
+    """Admission number of the student with the longest history: the worst-case profile page"""
+    return db.session.execute(
+        db.select(Student.admission_number).order_by(Student.total_loans.desc()).limit(1)
+    ).scalar()
+
+
+def route_cases():
+    """(name, path) for every GET page, with parameters taken from the current data"""
+    book = db.session.execute(db.select(Book).order_by(Book.id).limit(1)).scalar()
+    student = db.session.execute(db.select(Student).order_by(Student.id).limit(1)).scalar()
+    cases = [
+        ('books.manage_books', '/books/'),
+        ('books.lookup_cache_stats', '/books/lookup-cache'),
+        ('books.available_books', '/books/available'),
+        ('students.manage_students', '/students/'),
+        ('issues.issue_books', '/issues/'),
+        ('issues.export_issues', '/issues/export'),
+        ('fines.fine_calculator', '/fines/'),
+        ('fines.accrual_status', '/fines/accrual-status'),
+        ('fines.export_fines', '/fines/export'),
+    ]
+    if book:
+        title_word = book.work.title.split()[-1]
+        cases += [
+            ('books.manage_books[title]', f'/books/?search={title_word}'),
+            ('books.manage_books[code]', f'/books/?search={book.book_code}'),
+            ('books.manage_books[page 2]', f'/books/?after={book.work_id + 50}'),
+            ('books.available_books[title]', f'/books/available?q={title_word}'),
+        ]
+    if student:
+        prefix = student.name[:3]
+        cases += [
+            ('students.manage_students[name]', f'/students/?search={prefix}'),
+            ('students.search_students', f'/students/search?q={prefix}'),
+        ]
+    busiest = busiest_admission_number()
+    if busiest:
+        cases.append(('students.student_profile', f'/students/profile/{busiest}'))
+    return cases
+
+
+def warm_route_cases():
+    """(name, path) for the pages served from per-process caches once visited"""
+    return [
+        ('books.manage_books[warm]', '/books/'),
+        ('books.available_books[warm]', '/books/available'),
+        ('students.manage_students[warm]', '/students/'),
+    ]
+
+
+def circulation_fixture(copies=BATCH_CASE_SIZE):
+    """(student, barcodes of `copies` free copies) for the circulation cases, or (None, []) if there are none"""
+    student = db.session.execute(
+        db.select(Student).where(Student.active_loans == 0, Student.outstanding_fine == 0)
+        .order_by(Student.id).limit(1)
+    ).scalar()
+    barcodes = db.session.execute(
+        db.select(Book.barcode).where(Book.available == True, Book.barcode.isnot(None))
+        .order_by(Book.id).limit(copies)
+    ).scalars().all()
+    if student is None or len(barcodes) < copies:
+        return None, []
+    return student, barcodes
+
+
+def cli_cases():
+    """(name, args) for the maintenance commands; exports are written to the null device"""
+    return [
+        ('accrue-fines', ['accrue-fines']),
+        ('rebuild-search-index', ['rebuild-search-index']),
+        ('export-issues', ['export-issues', '--output', os.devnull]),
+        ('export-fines', ['export-fines', '--output', os.devnull]),
+        ('check-query-plans', ['check-query-plans']),
+    ]
+
+
+def _summarize(name, kind, timings, statements, extra):
+    result = {
+        'name': name,
+        'kind': kind,
+        'runs': len(timings),
+        'min_ms': round(min(timings) * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+        'statements': statements
+    }
+    result.update(extra)
+    return result
+
+
+def clear_caches():
+    """Empty the per-process caches so the next request does the work of a first visit"""
+    response_cache.clear()
+    availability_index.clear()
+    lookup_cache.clear()
+
+
+def time_route(client, name, path, repeat, warm=False):
+    client.get(path).get_data()  # Warm-up: imports, template compilation, caches
+    timings = []
+    for _ in range(repeat):
+        if not warm:
+            clear_caches()
+        with count_statements() as statements:
+            started = time.perf_counter()
+            response = client.get(path)
+            body = response.get_data()  # Drains streamed responses
+            timings.append(time.perf_counter() - started)
+    return _summarize(name, 'route', timings, len(statements), {
+        'path': path,
+        'status': response.status_code,
+        'bytes': len(body)
+    })
+
+
+def _time_post(client, path, kwargs):
+    with count_statements() as statements:
+        started = time.perf_counter()
+        response = client.post(path, **kwargs)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+    return elapsed, len(statements), response.status_code
+
+
+def time_circulation(client, student, barcodes, repeat):
+    """Time single and batch issue/return round trips; every copy issued is returned again"""
+    steps = [
+        ('issues.issue_book', '/issues/issue', {'data': {'student_id': student.id, 'barcode_scan': barcodes[0]}}),
+        ('issues.return_book_by_barcode', '/issues/return-by-barcode', {'data': {'return_barcode': barcodes[0]}}),
+        ('issues.batch_issue_books', '/issues/batch-issue',
+         {'json': {'admission_number': student.admission_number, 'barcodes': barcodes}}),
+        ('issues.batch_return_books', '/issues/batch-return', {'json': {'barcodes': barcodes}}),
+    ]
+    timings = {name: [] for name, _, _ in steps}
+    statements = {}
+    statuses = {}
+    for _ in range(repeat + 1):
+        for name, path, kwargs in steps:
+            with count_statements() as executed:
+                started = time.perf_counter()
+                response = client.post(path, **kwargs)
+                response.get_data()
+                timings[name].append(time.perf_counter() - started)
+            statements[name] = len(executed)
+            statuses[name] = response.status_code
+    # The first round of each step is the warm-up
+    return [
+        _summarize(name, 'route', timings[name][1:], statements[name], {
+            'path': path,
+            'method': 'POST',
+            'status': statuses[name]
+        })
+        for name, path, _ in steps
+    ]
+
+
+def time_command(runner, name, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        with count_statements() as statements:
+            started = time.perf_counter()
+            outcome = runner.invoke(args=args)
+            timings.append(time.perf_counter() - started)
+    return _summarize(name, 'cli', timings, len(statements), {
+        'args': args,
+        'exit_code': outcome.exit_code
+    })
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_summary():
+    return {
+        'works': db.session.execute(db.select(func.count(Work.id))).scalar(),
+        'books': db.session.execute(db.select(func.count(Book.id))).scalar(),
+        'students': db.session.execute(db.select(func.count(Student.id))).scalar(),
+        'issues': db.session.execute(db.select(func.count(Issue.id))).scalar(),
+        'open_issues': db.session.execute(
+            db.select(func.count(Issue.id)).where(Issue.returned == False)
+        ).scalar()
+    }
+
+
+def run_benchmark(app, repeat=DEFAULT_REPEAT, include_cli=True, progress=None):
+    """Run every case and return the results document"""
+    document = {
+        'commit': _git_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': db.engine.dialect.name,
+        'repeat': repeat,
+        'dataset': dataset_summary(),
+        'results': []
+    }
+    
+    client = app.test_client()
+    for name, path in route_cases():
+        document['results'].append(time_route(client, name, path, repeat))
+        if progress:
+            progress(document['results'][-1])
+    for name, path in warm_route_cases():
+        document['results'].append(time_route(client, name, path, repeat, warm=True))
+        if progress:
+            progress(document['results'][-1])
+    
+    student, barcodes = circulation_fixture()
+    if student:
+        for result in time_circulation(client, student, barcodes, repeat):
+            document['results'].append(result)
+            if progress:
+                progress(result)
+    
+    if include_cli:
+        runner = app.test_cli_runner()
+        for name, args in cli_cases():
+            document['results'].append(time_command(runner, name, args, repeat))
+            if progress:
+                progress(document['results'][-1])
+    return document
+
+
+def compare(document, baseline, threshold=DEFAULT_THRESHOLD):
+    """(name, baseline median, current median, relative change, regressed) per case in both runs"""
+    previous = {result['name']: result for result in baseline.get('results', [])}
+    changes = []
+    for result in document['results']:
+        before = previous.get(result['name'])
+        if not before or not before['median_ms']:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms']
+        regressed = change > threshold and result['median_ms'] - before['median_ms'] > MIN_REGRESSION_MS
+        changes.append((result['name'], before['median_ms'], result['median_ms'], change, regressed))
+    return changes
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _read(connection, rng, max_work_id):
+    """One page view's worth of reads: fine totals plus a page of the catalog"""
+    connection.execute(fine_summary_statement()).one()
+    connection.execute(
+        db.select(Work).where(Work.id > rng.randint(0, max_work_id)).order_by(Work.id).limit(50)
+    ).all()
+
+
+def _write(connection, rng, open_ids):
+    """One accrual-sized write transaction over a block of open issues"""
+    start = rng.randrange(max(len(open_ids) - WRITE_BATCH_SIZE, 1))
+    batch = open_ids[start:start + WRITE_BATCH_SIZE]
+    connection.execute(update(Issue).where(Issue.id.in_(batch)).values(fine=Issue.fine))
+
+
+def _worker(engine, role, deadline, seed, context, stats):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'read':
+                with engine.connect() as connection:
+                    _read(connection, rng, context['max_work_id'])
+            else:
+                with engine.begin() as connection:
+                    _write(connection, rng, context['open_ids'])
+        except OperationalError:
+            errors += 1  # e.g. "database is locked" once the busy timeout runs out
+            continue
+        latencies.append(time.perf_counter() - started)
+    stats.append((role, latencies, errors))
+
+
+def run_engine_profile(app, profile, readers=DEFAULT_READERS, writers=DEFAULT_WRITERS,
+                       seconds=DEFAULT_SECONDS):
+    """Run concurrent readers and writers against a fresh engine set up with `profile`"""
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    # The journal mode can only change with no other connections open
+    db.session.remove()
+    db.engine.dispose()
+    engine = create_engine(url, **pool_options(app.config, profile, url))
+    if engine.dialect.name == 'sqlite' and profile == 'baseline':
+        # WAL is persistent in the database file; put it back to the rollback journal
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode = DELETE')
+    apply_sqlite_pragmas(engine, sqlite_pragmas(app.config, profile))
+
+    with engine.connect() as connection:
+        context = {
+            'max_work_id': connection.execute(db.select(func.max(Work.id))).scalar() or 0,
+            'open_ids': connection.execute(
+                db.select(Issue.id).where(Issue.returned == False).order_by(Issue.id)
+            ).scalars().all()
+        }
+
+    stats = []
+    deadline = time.perf_counter() + seconds
+    roles = ['read'] * readers + (['write'] * writers if context['open_ids'] else [])
+    threads = [
+        threading.Thread(target=_worker, args=(engine, role, deadline, number, context, stats))
+        for number, role in enumerate(roles)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    result = {'profile': profile, 'readers': readers, 'writers': writers, 'seconds': seconds}
+    for role in ('read', 'write'):
+        latencies = [value for kind, values, _ in stats if kind == role for value in values]
+        result[role] = {
+            'ops': len(latencies),
+            'ops_per_second': round(len(latencies) / seconds, 1),
+            'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'errors': sum(errors for kind, _, errors in stats if kind == role)
+        }
+    return result
+
+
+def run_engine_benchmark(app, profiles=PROFILES, **options):
+    """Compare engine profiles under the same concurrent read/write load"""
+    return {
+        'commit': _git_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'database': db.engine.dialect.name,
+        'dataset': dataset_summary(),
+        'results': [run_engine_profile(app, profile, **options) for profile in profiles]
+    }
+
@@ -0,0 +1,128 @@
+"""
+Cached barcode / book-code lookup for the scan-heavy issue and return paths.
+
+Maps a scanned barcode or book code to a book id in a bounded LRU cache,
+so a scan costs one primary-key fetch instead of an OR across two unique
+columns. Entries are evicted by mapper events when books are added,
+deleted or re-coded, and every hit is re-checked against the loaded row,
+so an entry left stale by another worker process is simply dropped.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from models import db, Book
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class BookLookupCache:
+    """Thread-safe LRU map of barcode/book code -> book id with hit/miss counters"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def get(self, code):
+        with self._lock:
+            book_id = self._entries.get(code)
+            if book_id is not None:
+                self._entries.move_to_end(code)
+            return book_id
+
+    def put(self, code, book_id):
+        with self._lock:
+            self._entries[code] = book_id
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, *codes):
+        with self._lock:
+            for code in codes:
+                if code:
+                    self._entries.pop(code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.lookup_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'avg_lookup_ms': self.lookup_seconds * 1000 / lookups if lookups else 0.0
+            }
+
+
+lookup_cache = BookLookupCache()
+
+
+def init_app(app):
+    lookup_cache.maxsize = app.config.get('BOOK_LOOKUP_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+
+def find_book_by_code(code):
+    """Return the Book whose barcode or book code equals `code`, or None"""
+    code = (code or '').strip()
+    if not code:
+        return None
+    started = time.perf_counter()
+    
+    book_id = lookup_cache.get(code)
+    if book_id is not None:
+        book = db.session.get(Book, book_id)
+        if book is not None and code in (book.barcode, book.book_code):
+            lookup_cache.record(True, time.perf_counter() - started)
+            return book
+        lookup_cache.evict(code)
+    
+    # Two single-column lookups so each one can use its unique index
+    book = Book.query.filter_by(barcode=code).first() or Book.query.filter_by(book_code=code).first()
+    if book is not None:
+        lookup_cache.put(code, book.id)
+    lookup_cache.record(False, time.perf_counter() - started)
+    return book
+
+
+def _evict_book_codes(book):
+    codes = {book.barcode, book.book_code}
+    state = inspect(book)
+    for attr in (state.attrs.barcode, state.attrs.book_code):
+        codes.update(attr.history.deleted)
+    lookup_cache.evict(*codes)
+
+
+@event.listens_for(Book, 'after_insert')
+def _evict_on_insert(mapper, connection, book):
+    _evict_book_codes(book)
+
+
+@event.listens_for(Book, 'after_update')
+def _evict_on_update(mapper, connection, book):
+    # Availability flips on every issue and return; only re-coding affects the cache
+    state = inspect(book)
+    if state.attrs.barcode.history.has_changes() or state.attrs.book_code.history.has_changes():
+        _evict_book_codes(book)
+
+
+@event.listens_for(Book, 'after_delete')
+def _evict_on_delete(mapper, connection, book):
+    _evict_book_codes(book)
@@ -0,0 +1,173 @@
+"""
+Full-text catalog search.
+
+Titles and authors live on the work (services/inventory.py), so search
+finds works, one result per title however many copies it has. SQLite keeps
+an FTS5 shadow table (work_fts) whose rowid is the work id; it is created
+alongside the work table (by create_all or the e7b3d9f2a416 revision) and
+kept in sync by mapper events on Work inserts, updates and deletes. PostgreSQL uses a GIN expression index over
+a tsvector of title and author, which the database maintains itself.
+Queries that look like a partial book code or barcode also read the unique
+indexes on the copies' columns: titles with a matching copy come first,
+followed by the full-text matches, since a number may as well be a title.
+"""
+import re
+from sqlalchemy import DDL, bindparam, event, inspect, text
+from models import db, Book, Work
+from services.book_lookup import find_book_by_code
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+CODE_RE = re.compile(r'^\d{1,6}$')
+BARCODE_RE = re.compile(r'^LIB\d{0,6}$', re.IGNORECASE)
+
+PG_VECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))"
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS work_fts "
+    "USING fts5(title, author, tokenize='unicode61 remove_diacritics 2')"
+)
+PG_CREATE = f"CREATE INDEX IF NOT EXISTS ix_work_search ON work USING GIN ({PG_VECTOR})"
+
+event.listen(Work.__table__, 'after_create', DDL(SQLITE_CREATE).execute_if(dialect='sqlite'))
+event.listen(Work.__table__, 'after_create', DDL(PG_CREATE).execute_if(dialect='postgresql'))
+
+
+def ensure_search_index(rebuild=False):
+    """Create the search index if it is missing and backfill it if empty (or always, with `rebuild`).
+
+    Used by `flask rebuild-search-index` to repair the index. Returns the
+    number of works (re)indexed.
+    """
+    engine = db.engine
+    if not inspect(engine).has_table(Work.__tablename__):
+        return 0
+    
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text(PG_CREATE))
+            return 0
+        if engine.dialect.name != 'sqlite':
+            return 0
+        
+        conn.execute(text(SQLITE_CREATE))
+        indexed = conn.execute(text('SELECT count(*) FROM work_fts')).scalar()
+        if indexed and not rebuild:
+            return 0
+        conn.execute(text('DELETE FROM work_fts'))
+        result = conn.execute(text(
+            'INSERT INTO work_fts (rowid, title, author) SELECT id, title, author FROM work'
+        ))
+        return result.rowcount
+
+
+@event.listens_for(Work, 'after_insert')
+def _index_work(mapper, connection, work):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(
+            text('INSERT INTO work_fts (rowid, title, author) VALUES (:id, :title, :author)'),
+            {'id': work.id, 'title': work.title, 'author': work.author}
+        )
+
+
+@event.listens_for(Work, 'after_update')
+def _reindex_work(mapper, connection, work):
+    if connection.dialect.name != 'sqlite':
+        return
+    state = inspect(work)
+    if state.attrs.title.history.has_changes() or state.attrs.author.history.has_changes():
+        connection.execute(text('DELETE FROM work_fts WHERE rowid = :id'), {'id': work.id})
+        _index_work(mapper, connection, work)
+
+
+@event.listens_for(Work, 'after_delete')
+def _unindex_work(mapper, connection, work):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DELETE FROM work_fts WHERE rowid = :id'), {'id': work.id})
+
+
+def index_works(work_ids):
+    """Add bulk-inserted works (which bypass the mapper events) to the search index"""
+    work_ids = list(work_ids)
+    if not work_ids or db.session.get_bind().dialect.name != 'sqlite':
+        return
+    db.session.execute(
+        text('INSERT INTO work_fts (rowid, title, author) '
+             'SELECT id, title, author FROM work WHERE id IN :ids')
+        .bindparams(bindparam('ids', expanding=True)),
+        {'ids': work_ids}
+    )
+
+
+def exact_lookup(query_text):
+    """Return the copy whose book_code or barcode equals the query, using each unique index"""
+    query_text = query_text.strip()
+    if BARCODE_RE.match(query_text):
+        query_text = query_text.upper()
+    return find_book_by_code(query_text)
+
+
+def code_prefix_filter(query_text):
+    """Index range filter on copies for a partial book code or barcode, or None if the query isn't code-like"""
+    query_text = query_text.strip()
+    if CODE_RE.match(query_text):
+        column, prefix = Book.book_code, query_text
+    elif BARCODE_RE.match(query_text):
+        column, prefix = Book.barcode, query_text.upper()
+    else:
+        return None
+    # A half-open range instead of LIKE 'prefix%' so the unique index is always usable
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (column >= prefix) & (column < upper_bound)
+
+
+def code_matches(query_text, limit):
+    """Query for up to `limit` works with a copy whose code or barcode starts with the query, or None"""
+    code_filter = code_prefix_filter(query_text)
+    if code_filter is None:
+        return None
+    return Work.query.filter(Work.id.in_(db.select(Book.work_id).where(code_filter))).order_by(Work.id).limit(limit)
+
+
+def search_catalog(query_text, limit=50, offset=0):
+    """Works matching a partial book code or barcode, then full-text matches without repeats"""
+    window = offset + limit
+    code_query = code_matches(query_text, window)
+    if code_query is None:
+        return search_works(query_text, limit=limit, offset=offset)
+    works = code_query.all()
+    seen = {work.id for work in works}
+    # Every repeat is one of `works`, so this many full-text matches always fill the window
+    works += [work for work in search_works(query_text, limit=window + len(works)) if work.id not in seen]
+    return works[offset:window]
+
+
+def _terms(query_text):
+    return [term.lower() for term in TOKEN_RE.findall(query_text)]
+
+
+def search_works(query_text, limit=50, offset=0):
+    """Return up to `limit` works matching every search term (prefix match), best match first"""
+    terms = _terms(query_text)
+    if not terms:
+        return []
+    
+    if db.session.get_bind().dialect.name == 'postgresql':
+        ts_query = ' & '.join(f'{term}:*' for term in terms)
+        return Work.query.filter(
+            text(f"{PG_VECTOR} @@ to_tsquery('simple', :ts_query)").bindparams(ts_query=ts_query)
+        ).order_by(
+            text(f"ts_rank({PG_VECTOR}, to_tsquery('simple', :ts_query)) DESC").bindparams(ts_query=ts_query),
+            Work.id
+        ).limit(limit).offset(offset).all()
+    
+    # FTS5: quote every term so user input can't inject query syntax, then prefix-match it
+    match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    ids = db.session.execute(
+        text('SELECT rowid FROM work_fts WHERE work_fts MATCH :match '
+             'ORDER BY bm25(work_fts, 2.0, 1.0), rowid LIMIT :limit OFFSET :offset'),
+        {'match': match, 'limit': limit, 'offset': offset}
+    ).scalars().all()
+    if not ids:
+        return []
+    works = {work.id: work for work in Work.query.filter(Work.id.in_(ids))}
+    return [works[work_id] for work_id in ids if work_id in works]
@@ -0,0 +1,236 @@
+"""
+Set-based circulation operations for the circulation desk.
+
+Each operation handles a whole list of scanned codes with a fixed number of
+statements and a single commit, instead of one request and transaction per
+book.
+"""
+from datetime import datetime
+from sqlalchemy import case, insert, literal, update
+from models import db, Book, Issue, Work
+from services.fine_engine import elapsed_days_late, fine_expression
+from services.fine_policy import current_policy
+from services.holds import claim_hold, claim_holds, ready_copy, release_books
+from services.inventory import claim_copy, copies_flipped
+from services.loan_counters import record_issued, release_open_issues
+
+
+class ItemResult:
+    """Outcome for one scanned code in a batch operation.
+
+    Book details are copied rather than referenced so results stay usable
+    after the commit expires the session's objects.
+    """
+
+    def __init__(self, code, ok, message, book=None, fine=0.0, held=False):
+        self.code = code
+        self.ok = ok
+        self.message = message
+        self.book_id = book.id if book else None
+        self.book_code = book.book_code if book else None
+        self.fine = fine
+        self.held = held  # Returned book set aside for a hold
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'ok': self.ok,
+            'message': self.message,
+            'book_id': self.book_id,
+            'book_code': self.book_code,
+            'fine': self.fine,
+            'held': self.held
+        }
+
+
+def _unique_codes(codes):
+    """Strip blanks; return (unique codes in scan order, duplicate codes)"""
+    seen, unique, duplicates = set(), [], []
+    for code in codes:
+        code = (code or '').strip()
+        if not code:
+            continue
+        if code in seen:
+            duplicates.append(code)
+        else:
+            seen.add(code)
+            unique.append(code)
+    return unique, duplicates
+
+
+def resolve_books(codes):
+    """Map each code to its Book (by barcode or book code) with one query; works are joined in"""
+    if not codes:
+        return {}
+    books = Book.query.filter(Book.barcode.in_(codes) | Book.book_code.in_(codes)).all()
+    by_code = {}
+    for book in books:
+        by_code[book.barcode] = book
+        by_code[book.book_code] = book
+    return {code: by_code.get(code) for code in codes}
+
+
+def claim_book(book_id, student_id=None):
+    """Mark one available book as issued with a conditional UPDATE; True if this caller got it.
+
+    The availability check and the write are one statement, so of several
+    desks issuing the same copy at once exactly one sees a row updated.
+    A book set aside by a hold can only be claimed for its student.
+    """
+    claim = update(Book).where(Book.id == book_id, Book.available == True) \
+        .values(available=False).execution_options(synchronize_session=False)
+    claimed = db.session.execute(claim).rowcount == 1
+    copies_flipped([book_id] if claimed else [], False)
+    if not claimed and student_id is not None:
+        return claim_hold(book_id, student_id)
+    return claimed
+
+
+def claim_title(work_id, student_id=None):
+    """Issue any free copy of a work; return the copy's id, or None if none is free.
+
+    A copy set aside for this student by a hold is taken first; otherwise
+    any free copy is claimed with one conditional UPDATE (claim_copy()).
+    """
+    if student_id is not None:
+        book_id = ready_copy(work_id, student_id)
+        if book_id is not None and claim_hold(book_id, student_id):
+            return book_id
+    return claim_copy(work_id)
+
+
+def claim_books(book_ids):
+    """Mark available books as issued with one conditional UPDATE; return the ids claimed"""
+    if not book_ids:
+        return set()
+    statement = update(Book).where(Book.id.in_(book_ids), Book.available == True) \
+        .values(available=False).execution_options(synchronize_session=False)
+    
+    if db.session.get_bind().dialect.update_returning:
+        claimed = set(db.session.execute(statement.returning(Book.id)).scalars())
+        copies_flipped(claimed, False)
+    else:
+        # No UPDATE ... RETURNING: claim one row at a time and check the rowcount
+        claimed = {book_id for book_id in book_ids if claim_book(book_id)}
+    return claimed
+
+
+def batch_issue(student, codes, issue_duration=None, now=None):
+    """Issue every scanned book to `student` in one transaction.
+
+    Returns a list of ItemResult in scan order. Books that are unknown or
+    already issued are reported and skipped; the rest are committed together.
+    """
+    now = now or datetime.utcnow()
+    unique, duplicates = _unique_codes(codes)
+    books = resolve_books(unique)
+    
+    # Several codes (barcode and book code) may name the same book
+    wanted = {}
+    for code in unique:
+        book = books[code]
+        if book is not None and book.id not in wanted:
+            wanted[book.id] = book
+    
+    claimed = claim_books(list(wanted))
+    claimed |= claim_holds([book_id for book_id in wanted if book_id not in claimed], student.id, now)
+    issued_rows = [{
+        'student_id': student.id,
+        'book_id': book_id,
+        'issue_date': now,
+        'due_date': Issue.due_date_for(wanted[book_id], now, issue_duration),
+        'issue_duration': issue_duration,
+        'fine': 0.0,
+        'returned': False
+    } for book_id in wanted if book_id in claimed]
+    if issued_rows:
+        db.session.execute(insert(Issue), issued_rows)
+        record_issued(student.id, len(issued_rows))
+    
+    results, reported = [], set()
+    for code in unique:
+        book = books[code]
+        if book is None:
+            results.append(ItemResult(code, False, 'No book found with this barcode/code'))
+        elif book.id in reported:
+            results.append(ItemResult(code, False, 'Duplicate scan', book))
+        elif book.id in claimed:
+            reported.add(book.id)
+            results.append(ItemResult(code, True, f'Issued "{book.work.title}"', book))
+        else:
+            reported.add(book.id)
+            results.append(ItemResult(code, False, f'"{book.work.title}" is not available', book))
+    results.extend(ItemResult(code, False, 'Duplicate scan') for code in duplicates)
+    db.session.commit()
+    return results
+
+
+def batch_return(codes, now=None):
+    """Return every scanned book in one transaction, assessing fines in the same UPDATE.
+
+    Returns (results, summary): ItemResult per scan in scan order, and totals
+    for the batch including the fines assessed.
+    """
+    now = now or datetime.utcnow()
+    unique, duplicates = _unique_codes(codes)
+    books = resolve_books(unique)
+    book_ids = list({book.id for book in books.values() if book is not None})
+    
+    open_issues = dict(db.session.execute(
+        db.select(Issue.book_id, Issue.id).where(Issue.book_id.in_(book_ids), Issue.returned == False)
+    ).all()) if book_ids else {}
+    
+    if open_issues:
+        release_open_issues(Issue.id.in_(list(open_issues.values())))
+        returned_at = literal(now, Issue.return_date.type)
+        terms = current_policy().sql_terms()
+        days_late = elapsed_days_late(returned_at, terms.grace_period_days)
+        db.session.execute(
+            update(Issue)
+            .where(Issue.id.in_(list(open_issues.values())), Issue.returned == False,
+                   Issue.book_id == Book.id, Book.work_id == Work.id)
+            .values(
+                returned=True,
+                return_date=returned_at,
+                fine=case((days_late > 0, fine_expression(days_late, terms.rate_per_day)), else_=Issue.fine)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        # Books with a queue are set aside for the next hold instead of shelved
+        held, _ = release_books(list(open_issues), now)
+        fines = dict(db.session.execute(
+            db.select(Issue.book_id, Issue.fine).where(Issue.id.in_(list(open_issues.values())))
+        ).all())
+    else:
+        fines, held = {}, set()
+    
+    results, reported = [], set()
+    for code in unique:
+        book = books[code]
+        if book is None:
+            results.append(ItemResult(code, False, 'No book found with this barcode/code'))
+        elif book.id in reported:
+            results.append(ItemResult(code, False, 'Duplicate scan', book))
+        elif book.id in open_issues:
+            reported.add(book.id)
+            fine = fines.get(book.id) or 0.0
+            message = f'Returned "{book.work.title}"' + (f' (fine ₹{fine:.2f})' if fine > 0 else '')
+            if book.id in held:
+                message += ', set aside for the next hold'
+            results.append(ItemResult(code, True, message, book, fine=fine, held=book.id in held))
+        else:
+            reported.add(book.id)
+            results.append(ItemResult(code, False, f'"{book.work.title}" is not currently issued', book))
+    results.extend(ItemResult(code, False, 'Duplicate scan') for code in duplicates)
+    db.session.commit()
+    
+    returned = [result for result in results if result.ok]
+    summary = {
+        'scanned': len(results),
+        'returned': len(returned),
+        'failed': len(results) - len(returned),
+        'fined': sum(1 for result in returned if result.fine > 0),
+        'total_fine': sum(result.fine for result in returned),
+        'held': len(held)
+    }
+    return results, summary
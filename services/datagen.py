@@ -0,0 +1,310 @@
+"""
+Deterministic synthetic library data for scaling and benchmark runs.
+
+Builds titles and their copies, students and a circulation history whose
+shape resembles a real library: textbooks come in several copies, a few
+students and titles account for most loans, most returns are on time, and a tail of open loans is overdue far enough to
+carry fines. On an empty database the same seed and as-of date always
+produce the same rows. Everything is bulk-inserted a chunk at a time, so
+even the 1M preset runs in bounded memory.
+"""
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from models import db, Book, Student, Issue
+from services.inventory import record_copies_added, work_ids_for
+from services.loan_counters import reconcile
+
+DEFAULT_SEED = 42
+DEFAULT_CHUNK_SIZE = 5000
+HISTORY_DAYS = 730  # Returned loans are spread over the two years before the as-of date
+
+# Preset sizes by total row count (book codes allow at most 9,999 books per category)
+SIZES = {
+    '10k': {'books': 1000, 'students': 1000, 'issues': 8000},
+    '100k': {'books': 10000, 'students': 10000, 'issues': 80000},
+    '1m': {'books': 50000, 'students': 100000, 'issues': 850000},
+}
+
+OPEN_LOAN_RATIO = 0.3  # Share of books out on loan at the as-of date
+TEXTBOOK_COPIES = (1, 2, 3, 5, 8)  # Copies bought of each textbook title; reference titles get one
+
+# (weight, lower, upper) bounds on days relative to the due date
+RETURN_PROFILE = [
+    (0.75, -10, 0),   # Returned on time
+    (0.15, 1, Issue.GRACE_PERIOD_DAYS),  # Within the grace period
+    (0.10, Issue.GRACE_PERIOD_DAYS + 1, Issue.GRACE_PERIOD_DAYS + 60),  # Late, fined
+]
+OPEN_PROFILE = [
+    (0.60, -14, 0),   # Not yet due
+    (0.15, 1, Issue.GRACE_PERIOD_DAYS),  # Overdue but within the grace period
+    (0.25, Issue.GRACE_PERIOD_DAYS + 1, Issue.GRACE_PERIOD_DAYS + 180),  # Accruing fines
+]
+
+CATEGORY_WEIGHTS = {
+    'technology': 14, 'engineering': 14, 'science': 12, 'mathematics': 10, 'business': 10,
+    'medical': 9, 'literature': 9, 'arts': 8, 'history': 7, 'general': 7
+}
+COURSES = {
+    'technology': ['Computer Science', 'Software Engineering', 'Data Science', 'Information Systems'],
+    'engineering': ['Mechanical Engineering', 'Electrical Engineering', 'Civil Engineering'],
+    'science': ['Physics', 'Chemistry', 'Biology'],
+    'mathematics': ['Mathematics', 'Statistics'],
+    'business': ['Business Administration', 'Accounting', 'Economics'],
+    'medical': ['Medicine', 'Nursing', 'Pharmacy'],
+    'literature': ['English Literature', 'Linguistics'],
+    'arts': ['Fine Arts', 'Design', 'Music'],
+    'history': ['History', 'Political Science'],
+    'general': [None],
+}
+SUBJECTS = {
+    'technology': ['Algorithms', 'Databases', 'Operating Systems', 'Networks', 'Compilers', 'Machine Learning'],
+    'engineering': ['Thermodynamics', 'Circuits', 'Structures', 'Fluid Mechanics', 'Control Systems'],
+    'science': ['Quantum Mechanics', 'Organic Chemistry', 'Genetics', 'Optics', 'Ecology'],
+    'mathematics': ['Linear Algebra', 'Calculus', 'Probability', 'Number Theory', 'Topology'],
+    'business': ['Marketing', 'Finance', 'Accounting', 'Management', 'Microeconomics'],
+    'medical': ['Anatomy', 'Physiology', 'Pharmacology', 'Pathology', 'Immunology'],
+    'literature': ['Poetry', 'the Novel', 'Drama', 'Rhetoric', 'Modernism'],
+    'arts': ['Drawing', 'Colour Theory', 'Art History', 'Harmony', 'Typography'],
+    'history': ['the Ancient World', 'Modern Europe', 'the Industrial Revolution', 'Empires'],
+    'general': ['Study Skills', 'Research Methods', 'Critical Thinking', 'Writing'],
+}
+TITLE_PATTERNS = [
+    'Introduction to {subject}', 'Principles of {subject}', 'Advanced {subject}',
+    'Foundations of {subject}', '{subject}: A Practical Guide', 'Essentials of {subject}',
+    'Topics in {subject}', 'A First Course in {subject}', '{subject} in Practice',
+]
+FIRST_NAMES = [
+    'Aarav', 'Ananya', 'Priya', 'Rahul', 'Sneha', 'Vikram', 'Meera', 'Arjun', 'Kavya', 'Rohan',
+    'John', 'Emma', 'Michael', 'Sarah', 'James', 'Emily', 'Daniel', 'Jessica', 'David', 'Laura',
+    'Wei', 'Mei', 'Hiroshi', 'Yuki', 'Omar', 'Fatima', 'Carlos', 'Lucia', 'Ivan', 'Olga',
+]
+LAST_NAMES = [
+    'Sharma', 'Patel', 'Gupta', 'Singh', 'Iyer', 'Reddy', 'Nair', 'Khan', 'Das', 'Mehta',
+    'Smith', 'Johnson', 'Brown', 'Davis', 'Wilson', 'Taylor', 'Anderson', 'Thomas', 'Moore', 'Clark',
+    'Wang', 'Li', 'Tanaka', 'Sato', 'Hassan', 'Ali', 'Garcia', 'Lopez', 'Petrov', 'Ivanova',
+]
+
+
+class GenerationReport:
+    """Row counts and timing for one generator run"""
+
+    def __init__(self, seed, as_of):
+        self.seed = seed
+        self.as_of = as_of
+        self.books = 0
+        self.students = 0
+        self.issues = 0
+        self.open_issues = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            'seed': self.seed,
+            'as_of': self.as_of.isoformat(),
+            'books': self.books,
+            'students': self.students,
+            'issues': self.issues,
+            'open_issues': self.open_issues,
+            'elapsed_seconds': round(self.elapsed, 3)
+        }
+
+
+def _pick(rng, profile):
+    """Days relative to the due date, drawn from a (weight, lower, upper) profile"""
+    _, lower, upper = rng.choices(profile, weights=[weight for weight, _, _ in profile])[0]
+    return rng.randint(lower, upper)
+
+
+def _skewed_weights(rng, count):
+    """Cumulative popularity weights: a few rows get most of the activity"""
+    cumulative, total = [], 0.0
+    for _ in range(count):
+        total += rng.paretovariate(1.2)
+        cumulative.append(total)
+    return cumulative
+
+
+def _loan_days(book):
+    if book['duration_type'] == 'specific' and book['duration_days']:
+        return book['duration_days']
+    return Issue.DEFAULT_DURATION_DAYS
+
+
+def _fine(due_date, reference):
+    grace_period_end = due_date + timedelta(days=Issue.GRACE_PERIOD_DAYS)
+    if reference > grace_period_end:
+        return (reference - grace_period_end).days * Issue.FINE_RATE_PER_DAY
+    return 0.0
+
+
+def _book_rows(rng, count):
+    """Yield the work values of each of `count` copies; copies of one title come together"""
+    categories = list(CATEGORY_WEIGHTS)
+    weights = [CATEGORY_WEIGHTS[category] for category in categories]
+    produced = 0
+    while produced < count:
+        category = rng.choices(categories, weights=weights)[0]
+        subject = rng.choice(SUBJECTS[category])
+        specific = rng.random() < 0.4
+        title = rng.choice(TITLE_PATTERNS).format(subject=subject)
+        if rng.random() < 0.2:
+            title += f', Volume {rng.randint(2, 5)}'
+        work = {
+            'title': title,
+            'author': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'book_type': 'reference' if specific else 'textbook',
+            'category': category,
+            'course': rng.choice(COURSES[category]),
+            'duration_type': 'specific' if specific else 'semester',
+            'duration_days': rng.choice([7, 14, 21, 30]) if specific else None
+        }
+        copies = 1 if specific else min(rng.choice(TEXTBOOK_COPIES), count - produced)
+        for _ in range(copies):
+            yield work
+        produced += copies
+
+
+def _insert_books(rng, count, open_positions, chunk_size, report, progress):
+    """Insert `count` copies and their works; returns (id, loan days) per copy in insertion order"""
+    first_id = (db.session.execute(db.select(func.max(Book.id))).scalar() or 0) + 1
+    books = []
+    rows = _book_rows(rng, count)
+    for start in range(0, count, chunk_size):
+        chunk = [next(rows) for _ in range(min(chunk_size, count - start))]
+        work_ids = work_ids_for(chunk)
+        codes = {
+            category: iter(Book.reserve_book_codes(category, number))
+            for category, number in Counter(work['category'] for work in chunk).items()
+        }
+        copies = []
+        for position, (work, work_id) in enumerate(zip(chunk, work_ids), start=start):
+            book_code = next(codes[work['category']])
+            copies.append({'work_id': work_id, 'book_code': book_code, 'barcode': f'LIB{book_code}',
+                           'available': position not in open_positions})
+        db.session.execute(insert(Book), copies)
+        record_copies_added(copies)
+        db.session.commit()
+        books.extend(_loan_days(work) for work in chunk)
+        report.books += len(chunk)
+        if progress:
+            progress(report)
+    
+    ids = db.session.execute(
+        db.select(Book.id).where(Book.id >= first_id).order_by(Book.id)
+    ).scalars().all()
+    return list(zip(ids, books))
+
+
+def _insert_students(rng, count, chunk_size, report, progress):
+    """Insert `count` students; returns their ids in insertion order"""
+    first_id = (db.session.execute(db.select(func.max(Student.id))).scalar() or 0) + 1
+    numbers = Student.reserve_admission_numbers(count)
+    course_names = [course for courses in COURSES.values() for course in courses if course]
+    for start in range(0, count, chunk_size):
+        chunk = []
+        for number in numbers[start:start + chunk_size]:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            chunk.append({
+                'name': f'{first} {last}',
+                'email': f'{first.lower()}.{last.lower()}.{number}@university.edu',
+                'admission_number': number,
+                'course': rng.choice(course_names)
+            })
+        db.session.execute(insert(Student), chunk)
+        db.session.commit()
+        report.students += len(chunk)
+        if progress:
+            progress(report)
+    
+    return db.session.execute(
+        db.select(Student.id).where(Student.id >= first_id).order_by(Student.id)
+    ).scalars().all()
+
+
+def _issue_rows(rng, books, student_ids, open_positions, count, as_of):
+    """Yield issue rows in issue-date order: returned history first, then open loans"""
+    student_weights = _skewed_weights(rng, len(student_ids))
+    book_weights = _skewed_weights(rng, len(books))
+    history_start = as_of - timedelta(days=HISTORY_DAYS)
+    returned_count = max(count - len(open_positions), 0)
+    
+    # Issue dates follow a Poisson process, so rows stream out already sorted
+    issue_date = history_start
+    mean_gap = (HISTORY_DAYS - 90) * 86400 / max(returned_count, 1)
+    for _ in range(returned_count):
+        issue_date += timedelta(seconds=rng.expovariate(1 / mean_gap))
+        book_id, loan_days = rng.choices(books, cum_weights=book_weights)[0]
+        due_date = issue_date + timedelta(days=loan_days)
+        return_date = due_date + timedelta(days=_pick(rng, RETURN_PROFILE), seconds=rng.randint(0, 86399))
+        return_date = max(min(return_date, as_of), issue_date)
+        yield {
+            'student_id': rng.choices(student_ids, cum_weights=student_weights)[0],
+            'book_id': book_id,
+            'issue_date': issue_date,
+            'due_date': due_date,
+            'return_date': return_date,
+            'returned': True,
+            'fine': _fine(due_date, return_date)
+        }
+    
+    open_loans = []
+    for position in open_positions:
+        book_id, loan_days = books[position]
+        # Loans not yet due were still issued before the as-of date
+        days_overdue = max(_pick(rng, OPEN_PROFILE), 1 - loan_days)
+        due_date = as_of - timedelta(days=days_overdue, seconds=rng.randint(0, 86399))
+        open_loans.append((due_date - timedelta(days=loan_days), book_id, due_date))
+    for issue_date, book_id, due_date in sorted(open_loans):
+        yield {
+            'student_id': rng.choices(student_ids, cum_weights=student_weights)[0],
+            'book_id': book_id,
+            'issue_date': issue_date,
+            'due_date': due_date,
+            'return_date': None,
+            'returned': False,
+            'fine': _fine(due_date, as_of)
+        }
+
+
+def generate_library(books, students, issues, seed=DEFAULT_SEED, as_of=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Bulk-insert a synthetic library and return its GenerationReport.
+
+    Rows are added to whatever is already in the database. `as_of` is the
+    date the circulation history leads up to (default: today, midnight UTC);
+    pass it explicitly to reproduce an earlier dataset exactly.
+    """
+    as_of = as_of or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(seed)
+    report = GenerationReport(seed, as_of)
+    
+    open_count = min(int(books * OPEN_LOAN_RATIO), issues)
+    open_positions = set(rng.sample(range(books), open_count))
+    book_rows = _insert_books(rng, books, open_positions, chunk_size, report, progress)
+    student_ids = _insert_students(rng, students, chunk_size, report, progress)
+    if not book_rows or not student_ids:
+        return report
+    
+    rows = _issue_rows(rng, book_rows, student_ids, sorted(open_positions), issues, as_of)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        db.session.execute(insert(Issue), chunk)
+        db.session.commit()
+        report.issues += len(chunk)
+        report.open_issues += sum(1 for row in chunk if not row['returned'])
+        if progress:
+            progress(report)
+    
+    # Issues went in as bulk inserts, past the loan counter hooks
+    reconcile(student_ids)
+    db.session.commit()
+    return report
@@ -0,0 +1,78 @@
+"""
+Database engine profiles.
+
+DATABASE_PROFILE selects how the engine is set up:
+
+- ``production`` (default): SQLite connections switch to WAL with
+  synchronous=NORMAL, a busy timeout and a larger page cache and mmap
+  window, so readers keep going while fine accrual and circulation writes
+  commit. PostgreSQL gets a sized connection pool with pre-ping and
+  recycling, so connections dropped by the server or a proxy are replaced
+  transparently.
+- ``baseline``: driver and SQLAlchemy defaults, kept for comparison
+  (`flask benchmark-engine`).
+
+Pool options have to be in place before db.init_app() creates the engine,
+so configure() runs first; init_app() then installs the SQLite connect hook.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+
+PROFILES = ('production', 'baseline')
+
+
+def sqlite_pragmas(config, profile):
+    """PRAGMA name -> value run on every new SQLite connection"""
+    if profile != 'production':
+        return {}
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'cache_size': -config['SQLITE_CACHE_SIZE_KB'],  # Negative values are in KiB
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+    }
+
+
+def pool_options(config, profile, url):
+    """create_engine() pool arguments for server databases"""
+    if profile != 'production' or make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run `pragmas` on every connection the engine opens"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+
+def configure(app):
+    """Merge the profile's pool options into SQLALCHEMY_ENGINE_OPTIONS (before db.init_app)"""
+    profile = app.config['DATABASE_PROFILE']
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown DATABASE_PROFILE {profile!r}; expected one of {", ".join(PROFILES)}')
+    options = pool_options(app.config, profile, app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def init_app(app):
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, sqlite_pragmas(app.config, app.config['DATABASE_PROFILE']))
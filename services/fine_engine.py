@@ -0,0 +1,122 @@
+"""
+Set-based fine engine.
+
+Computes days late and fine amounts inside the database so the fine pages
+no longer load every Issue and call Issue.calculate_fine() row by row.
+Accrual works on the issue table; the fine reports read IssueRecord, the
+union of current and archived issues. Rates and grace periods come from the
+fine policy (services/fine_policy.py) as CASE expressions over the
+category and type of the book's work, so every statement here joins Book
+and Work.
+"""
+from datetime import datetime
+from sqlalchemy import Integer, and_, case, cast, func, or_, update
+from sqlalchemy.orm import contains_eager, joinedload
+from models import db, Book, Issue, IssueRecord, Work
+from services.fine_policy import current_policy
+from services.loan_counters import record_fine_changes
+
+MS_PER_DAY = 86400000
+
+
+def _dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def _reference_date(now, loans=Issue):
+    """Date the lateness is measured against: return date, or now for open issues"""
+    return case(
+        (and_(loans.returned == True, loans.return_date.isnot(None)), loans.return_date),
+        (loans.returned == False, now),
+        else_=None
+    )
+
+
+def elapsed_days_late(reference, grace_period_days, loans=Issue):
+    """SQL expression for whole days from the end of the grace period to `reference`"""
+    if _dialect_name() == 'postgresql':
+        elapsed_days = func.floor(func.extract('epoch', reference - loans.due_date) / 86400)
+        return cast(elapsed_days, Integer) - grace_period_days
+    # SQLite: julianday() differences rounded to the millisecond to avoid float drift
+    elapsed_ms = cast(
+        func.round((func.julianday(reference) - func.julianday(loans.due_date)) * MS_PER_DAY),
+        Integer
+    )
+    return elapsed_ms // MS_PER_DAY - grace_period_days
+
+
+def days_late_expression(now, grace_period_days, loans=Issue):
+    """SQL expression for whole days past the grace period (negative when not late).
+
+    `loans` is Issue (current loans) or IssueRecord (current and archived).
+    """
+    return elapsed_days_late(_reference_date(now, loans), grace_period_days, loans)
+
+
+def fine_expression(days_late, rate_per_day):
+    """SQL expression for the fine owed for the given days-late expression"""
+    return days_late * rate_per_day
+
+
+def refresh_fines(now=None, *criteria):
+    """Recalculate stored fines in a single UPDATE, touching only rows whose fine changes.
+
+    Extra criteria narrow the rows considered (e.g. one batch of open issues).
+    Returns the number of rows written. The caller is responsible for committing.
+    """
+    now = now or datetime.utcnow()
+    terms = current_policy().sql_terms()
+    days_late = days_late_expression(now, terms.grace_period_days)
+    new_fine = fine_expression(days_late, terms.rate_per_day)
+    # The policy terms read the category and type of the book's work
+    criteria = (*criteria, Issue.book_id == Book.id, Book.work_id == Work.id)
+    changed = (days_late > 0, or_(Issue.fine.is_(None), Issue.fine != new_fine))
+    # Open issues' fines count towards their students' outstanding totals
+    record_fine_changes(new_fine, *criteria, *changed)
+    result = db.session.execute(
+        update(Issue)
+        .where(*criteria)
+        .where(*changed)
+        .values(fine=new_fine)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        # Stored fines changed underneath any Issue objects already in the session
+        db.session.expire_all()
+    return result.rowcount
+
+
+def fine_summary_statement():
+    """Aggregate SELECT of total, outstanding and collected fines, archived issues included"""
+    return db.select(
+        func.coalesce(func.sum(IssueRecord.fine), 0.0),
+        func.coalesce(func.sum(case((IssueRecord.returned == False, IssueRecord.fine), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((IssueRecord.returned == True, IssueRecord.fine), else_=0.0)), 0.0)
+    ).where(IssueRecord.fine > 0)
+
+
+def fine_summary():
+    """Return total, outstanding and collected fines from one aggregate query"""
+    total, outstanding, collected = db.session.execute(fine_summary_statement()).one()
+    return {
+        'total_fines': float(total),
+        'total_outstanding': float(outstanding),
+        'total_collected': float(collected)
+    }
+
+
+def issues_with_fines_statement(now):
+    """SELECT of every issue carrying a fine, archived ones included, with its days late"""
+    days_late = days_late_expression(now, current_policy().sql_terms().grace_period_days, IssueRecord)
+    return db.select(IssueRecord, case((days_late > 0, days_late), else_=0).label('days_late')) \
+        .join(Book, Book.id == IssueRecord.book_id) \
+        .join(Work, Work.id == Book.work_id) \
+        .options(joinedload(IssueRecord.student), contains_eager(IssueRecord.book).contains_eager(Book.work)) \
+        .where(IssueRecord.fine > 0) \
+        .order_by(IssueRecord.id)
+
+
+def issues_with_fines(now=None):
+    """Return (issue record, days_late) rows for every issue carrying a fine"""
+    rows = db.session.execute(issues_with_fines_statement(now or datetime.utcnow())).all()
+    return [(row.IssueRecord, row.days_late) for row in rows]
@@ -0,0 +1,214 @@
+"""
+Fine policy: rate per day and grace period by book category and type.
+
+Rules live in the fine_policy table. A rule names a category, a book type,
+both or neither (NULL matches any), and the most specific rule for a book
+wins: category and type, then category, then type, then the catch-all.
+Without a catch-all rule, Issue.FINE_RATE_PER_DAY and
+Issue.GRACE_PERIOD_DAYS apply.
+
+The table is read once per process and compiled into a CompiledPolicy, a
+dict of (category, book_type) -> Rule resolved for every known category and
+type. It is evaluated in two forms:
+
+- sql_terms(): CASE expressions over the work's category and type for the
+  set-based fine engine (accrual, batch returns, the fines page);
+- evaluate(): a whole batch of loaded issues scored against one captured
+  `now`, for the single-issue return paths and the open-loan tables.
+
+The process that edits the policy (`flask fine-policy`) recompiles it at
+once; other worker processes re-read it after FINE_POLICY_RELOAD_SECONDS.
+Stored fines follow a policy change at the next accrual; fines of returned
+issues are not reassessed.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, literal
+from models import db, Book, FinePolicy, Issue, Work
+
+DEFAULT_RELOAD_SECONDS = 60
+
+Rule = namedtuple('Rule', ['rate_per_day', 'grace_period_days'])
+Assessment = namedtuple('Assessment', ['days_late', 'fine', 'grace_days_remaining', 'days_issued'])
+PolicyTerms = namedtuple('PolicyTerms', ['rate_per_day', 'grace_period_days'])
+
+
+class CompiledPolicy:
+    """Fine rules resolved for lookup by (category, book_type)"""
+
+    def __init__(self, rules):
+        self.rules = dict(rules)  # (category or None, book_type or None) -> Rule
+        self.default = self.rules.get((None, None)) or Rule(Issue.FINE_RATE_PER_DAY, Issue.GRACE_PERIOD_DAYS)
+        self._resolved = {
+            (category, book_type): self._match(category, book_type)
+            for category in Book.CATEGORY_CODES for book_type in Book.BOOK_TYPES
+        }
+        self._grace = {
+            rule: timedelta(days=rule.grace_period_days) for rule in set(self.rules.values()) | {self.default}
+        }
+
+    def _match(self, category, book_type):
+        for key in ((category, book_type), (category, None), (None, book_type)):
+            if key in self.rules:
+                return self.rules[key]
+        return self.default
+
+    def rule_for(self, category, book_type):
+        """The rule that applies to a book of this category and type"""
+        rule = self._resolved.get((category, book_type))
+        return rule if rule is not None else self._match(category, book_type)
+
+    @property
+    def uniform(self):
+        """True when every book gets the default rule"""
+        return all(rule == self.default for rule in self.rules.values())
+
+    def scoped_rules(self):
+        """(category, book_type, Rule) for every rule but the catch-all, most specific first as in _match()"""
+        scopes = sorted(
+            (key for key in self.rules if key != (None, None)),
+            key=lambda key: (key[0] is None, key[1] is None, key)
+        )
+        return [(category, book_type, self.rules[(category, book_type)]) for category, book_type in scopes]
+
+    def _case(self, field, category, book_type):
+        default = getattr(self.default, field)
+        if self.uniform:
+            return literal(default)
+        whens = []
+        for rule_category, rule_book_type, rule in self.scoped_rules():
+            conditions = []
+            if rule_category is not None:
+                conditions.append(category == rule_category)
+            if rule_book_type is not None:
+                conditions.append(book_type == rule_book_type)
+            whens.append((and_(*conditions), getattr(rule, field)))
+        return case(*whens, else_=default)
+
+    def sql_terms(self, category=Work.category, book_type=Work.book_type):
+        """SQL rate and grace expressions over the work columns; the statement must join Book and Work"""
+        return PolicyTerms(self._case('rate_per_day', category, book_type),
+                           self._case('grace_period_days', category, book_type))
+
+    def assess(self, loans, now):
+        """Yield (loan, Assessment) for every loan, all measured against `now`; loans need their book"""
+        for loan in loans:
+            work = loan.book.work if loan.book is not None else None
+            rule = self.rule_for(work.category, work.book_type) if work is not None else self.default
+            grace_period_end = loan.due_date + self._grace[rule]
+            if loan.returned:
+                reference = loan.return_date
+                grace_days_remaining = 0
+            else:
+                reference = now
+                grace_days_remaining = max(0, (grace_period_end - now).days)
+            days_late = (reference - grace_period_end).days if reference and reference > grace_period_end else 0
+            days_issued = ((reference or now) - loan.issue_date).days
+            yield loan, Assessment(days_late, days_late * rule.rate_per_day, grace_days_remaining, days_issued)
+
+
+class PolicyStore:
+    """Compiled fine policy of this process, re-read from the table after `reload_seconds`"""
+
+    def __init__(self, reload_seconds=DEFAULT_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._policy = None
+        self._loaded_at = 0.0
+        self.loads = 0
+
+    def current(self):
+        policy = self._policy
+        if policy is not None and time.monotonic() - self._loaded_at < self.reload_seconds:
+            return policy
+        with self._lock:
+            if self._policy is None or time.monotonic() - self._loaded_at >= self.reload_seconds:
+                self._policy = CompiledPolicy(load_rules())
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            return self._policy
+
+    def invalidate(self):
+        with self._lock:
+            self._policy = None
+
+
+policy_store = PolicyStore()
+
+
+def init_app(app):
+    policy_store.reload_seconds = app.config.get('FINE_POLICY_RELOAD_SECONDS', DEFAULT_RELOAD_SECONDS)
+    policy_store.invalidate()
+
+
+def load_rules():
+    """{(category, book_type): Rule} from the fine_policy table"""
+    rows = db.session.execute(db.select(
+        FinePolicy.category, FinePolicy.book_type, FinePolicy.rate_per_day, FinePolicy.grace_period_days
+    )).all()
+    return {(row.category, row.book_type): Rule(row.rate_per_day, row.grace_period_days) for row in rows}
+
+
+def current_policy():
+    return policy_store.current()
+
+
+def evaluate(loans, now=None):
+    """{loan id: Assessment} for a batch of loaded issues (or issue records), against one captured `now`"""
+    return {loan.id: assessment for loan, assessment in current_policy().assess(loans, now or datetime.utcnow())}
+
+
+def assess_fines(issues, now=None):
+    """Set the fine of each late issue from the policy; a fine already accrued is kept otherwise"""
+    for issue, assessment in current_policy().assess(issues, now or datetime.utcnow()):
+        if assessment.days_late > 0:
+            issue.fine = assessment.fine
+
+
+def _validate_scope(category, book_type):
+    if category is not None and category not in Book.CATEGORY_CODES:
+        raise ValueError(f'unknown category {category!r}')
+    if book_type is not None and book_type not in Book.BOOK_TYPES:
+        raise ValueError(f'book type must be one of {", ".join(Book.BOOK_TYPES)}')
+
+
+def _scope_filter(category, book_type):
+    return and_(
+        FinePolicy.category.is_(None) if category is None else FinePolicy.category == category,
+        FinePolicy.book_type.is_(None) if book_type is None else FinePolicy.book_type == book_type
+    )
+
+
+def set_rule(category=None, book_type=None, rate_per_day=None, grace_period_days=None):
+    """Create or update the rule for a scope (None = any); unset values are taken from the rule it replaces.
+
+    Commits, and recompiles this process's policy.
+    """
+    _validate_scope(category, book_type)
+    if (rate_per_day is not None and rate_per_day < 0) or (grace_period_days is not None and grace_period_days < 0):
+        raise ValueError('rate and grace period must not be negative')
+    
+    rule = FinePolicy.query.filter(_scope_filter(category, book_type)).first()
+    if rule is None:
+        inherited = CompiledPolicy(load_rules()).rule_for(category, book_type)
+        rule = FinePolicy(category=category, book_type=book_type,
+                          rate_per_day=inherited.rate_per_day, grace_period_days=inherited.grace_period_days)
+        db.session.add(rule)
+    if rate_per_day is not None:
+        rule.rate_per_day = rate_per_day
+    if grace_period_days is not None:
+        rule.grace_period_days = grace_period_days
+    db.session.commit()
+    policy_store.invalidate()
+    return rule
+
+
+def remove_rule(category=None, book_type=None):
+    """Delete the rule for a scope; return whether there was one. Commits."""
+    _validate_scope(category, book_type)
+    removed = FinePolicy.query.filter(_scope_filter(category, book_type)).delete(synchronize_session=False)
+    db.session.commit()
+    policy_store.invalidate()
+    return bool(removed)
@@ -0,0 +1,149 @@
+"""
+Background fine accrual.
+
+Open issues have their fines accrued once per interval (daily by default) in
+bounded batches, so the read routes can render stored fines without writing.
+The scheduler can run as a daemon thread inside the app or be launched from
+the CLI with `flask fine-scheduler` / `flask accrue-fines`.
+
+Every web worker starts its own scheduler with the first request it serves
+(FINE_SCHEDULER_ENABLED, on by default), so each interval is leased through fine_accrual_run: a scheduled run first
+inserts its row with the interval's slot number, the unique index lets one
+insert win, and the other workers skip that interval. A run that dies part
+way keeps its slot; the next interval accrues again. `flask accrue-fines`
+takes no slot and always runs.
+"""
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import db, Issue, FineAccrualRun
+from services.fine_engine import refresh_fines
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INTERVAL_SECONDS = 24 * 60 * 60
+SLOT_EPOCH = datetime(1970, 1, 1)
+
+
+def open_issue_batch(last_id, batch_size):
+    """SELECT of the next `batch_size` open issue ids after `last_id`"""
+    return db.select(Issue.id) \
+        .where(Issue.returned == False, Issue.id > last_id) \
+        .order_by(Issue.id) \
+        .limit(batch_size)
+
+
+def claim_accrual_slot(interval, now=None):
+    """Start the FineAccrualRun for the `interval`-second slot containing `now`.
+
+    Returns None if another process has already claimed the slot.
+    """
+    now = now or datetime.utcnow()
+    slot = int((now - SLOT_EPOCH).total_seconds() // interval)
+    run = FineAccrualRun(started_at=now, slot=slot, rows_touched=0, batches=0)
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return run
+
+
+def accrue_fines(batch_size=DEFAULT_BATCH_SIZE, now=None, run=None):
+    """Accrue fines for all open issues, committing after each batch of ids.
+
+    Every batch is evaluated against the same captured `now` (the start of
+    `run`, if one was claimed). Returns the FineAccrualRun recorded for this pass.
+    """
+    if run is None:
+        now = now or datetime.utcnow()
+        run = FineAccrualRun(started_at=now, rows_touched=0, batches=0)
+    else:
+        now = run.started_at
+    last_id = 0
+    
+    while True:
+        batch_ids = db.session.execute(open_issue_batch(last_id, batch_size)).scalars().all()
+        if not batch_ids:
+            break
+        
+        run.rows_touched += refresh_fines(
+            now,
+            Issue.returned == False,
+            Issue.id > last_id,
+            Issue.id <= batch_ids[-1]
+        )
+        run.batches += 1
+        db.session.commit()
+        last_id = batch_ids[-1]
+    
+    run.finished_at = datetime.utcnow()
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def last_accrual_run():
+    """Return the most recent completed FineAccrualRun, or None"""
+    return FineAccrualRun.query.filter(
+        FineAccrualRun.finished_at.isnot(None)
+    ).order_by(FineAccrualRun.started_at.desc()).first()
+
+
+class FineAccrualScheduler:
+    """Runs accrue_fines() on a fixed interval in a daemon thread"""
+
+    def __init__(self, app, interval=DEFAULT_INTERVAL_SECONDS, batch_size=DEFAULT_BATCH_SIZE):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_run_at = None
+        self.last_rows_touched = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='fine-accrual', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def run_once(self):
+        with self.app.app_context():
+            run = claim_accrual_slot(self.interval)
+            if run is None:
+                logger.info('Fine accrual for this interval already claimed by another process')
+                return None
+            run = accrue_fines(self.batch_size, run=run)
+            self.last_run_at = run.finished_at
+            self.last_rows_touched = run.rows_touched
+            logger.info('Accrued fines: %d rows touched in %d batches', run.rows_touched, run.batches)
+            return run
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Fine accrual run failed')
+            self._stop.wait(self.interval)
+
+    def status(self):
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval_seconds': self.interval,
+            'batch_size': self.batch_size,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'rows_touched': self.last_rows_touched
+        }
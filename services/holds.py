@@ -0,0 +1,258 @@
+"""
+Hold queues for titles with no copy on the shelf.
+
+A student places a hold on a title (a work, services/inventory.py) whose
+copies are all out and joins its queue: students whose course matches the
+title's go first when HOLD_COURSE_PRIORITY is on, otherwise holds are first
+come first served. The queue is read through the partial index
+ix_hold_queue, so finding the next students in line is an index range read
+however long the queues or the hold table grow.
+
+Every return path calls allocate_holds() in the returning transaction. A
+returned copy of a title with waiting holds is not made available; the
+next hold becomes ready and that copy is set aside for the student for
+HOLD_PICKUP_DAYS. Only that student can then issue it (claim_book,
+claim_title and batch_issue fulfil the hold). Copies added to a title with
+a queue go through allocate_new_copies() the same way. `flask expire-holds`
+sweeps uncollected holds in batches, passing each copy on to the next in
+its title's queue or back to the shelf.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, func, tuple_, update
+from models import db, Book, Hold, Issue
+from services.inventory import copies_flipped
+
+DEFAULT_PICKUP_DAYS = 3
+DEFAULT_SWEEP_BATCH_SIZE = 500
+COURSE_MATCH_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+
+
+class HoldSweep:
+    """Progress of one expiry sweep"""
+
+    def __init__(self, now):
+        self.now = now
+        self.expired = 0
+        self.passed_on = 0
+        self.released = 0
+        self.batches = 0
+
+
+def _pickup_days():
+    return current_app.config.get('HOLD_PICKUP_DAYS', DEFAULT_PICKUP_DAYS)
+
+
+def hold_priority(work, student):
+    """Queue priority of a hold by `student` on `work`: course matches first if enabled"""
+    if current_app.config.get('HOLD_COURSE_PRIORITY', True) and work.course and student.course \
+            and work.course.strip().lower() == student.course.strip().lower():
+        return COURSE_MATCH_PRIORITY
+    return DEFAULT_PRIORITY
+
+
+def place_hold(student, work, now=None):
+    """Queue `student` for `work`; raise ValueError if the hold makes no sense. The caller commits."""
+    if work.available_copies > 0:
+        raise ValueError(f'"{work.title}" is on the shelf; issue it instead')
+    if Issue.query.join(Book, Book.id == Issue.book_id).filter(
+            Book.work_id == work.id, Issue.student_id == student.id, Issue.returned == False).first():
+        raise ValueError(f'{student.name} already has "{work.title}"')
+    if active_hold(work.id, student.id):
+        raise ValueError(f'{student.name} already has a hold on "{work.title}"')
+    
+    hold = Hold(work_id=work.id, student_id=student.id, priority=hold_priority(work, student),
+                status=Hold.WAITING, placed_at=now or datetime.utcnow())
+    db.session.add(hold)
+    db.session.flush()
+    return hold
+
+
+def active_hold(work_id, student_id, status=None):
+    """The student's waiting or ready hold on a work (only `status` if given), or None"""
+    statuses = (status,) if status else Hold.ACTIVE_STATUSES
+    return Hold.query.filter(
+        Hold.work_id == work_id, Hold.student_id == student_id, Hold.status.in_(statuses)
+    ).first()
+
+
+def queue_statement(work_ids):
+    """SELECT of the waiting holds on `work_ids` with their place in their work's queue (1 = next)"""
+    place = func.row_number().over(
+        partition_by=Hold.work_id, order_by=(Hold.priority, Hold.placed_at, Hold.id)
+    )
+    return db.select(Hold.id, Hold.work_id, place.label('place')) \
+        .where(Hold.work_id.in_(work_ids), Hold.status == Hold.WAITING)
+
+
+def allocate_holds(book_ids, now=None):
+    """Set each returned copy aside for the next hold on its work; return the ids of copies allocated.
+
+    Call it in the returning transaction. Allocated copies must stay
+    unavailable; the caller puts the rest back on the shelf (release_books()
+    does both). Several copies of one title returned together go to as many
+    students, in queue order.
+    
+    The queue is read without a lock, so each hold is made ready by its own
+    UPDATE guarded on the hold still waiting. A hold another desk allocated
+    in between matches no row; the queues are then read again for the copies
+    still unallocated. Copies with no hold left to serve are left out of the
+    result, for the caller to shelve.
+    """
+    if not book_ids:
+        return set()
+    now = now or datetime.utcnow()
+    copies = {}
+    for book_id, work_id in db.session.execute(
+            db.select(Book.id, Book.work_id).where(Book.id.in_(set(book_ids))).order_by(Book.id)):
+        copies.setdefault(work_id, []).append(book_id)
+    
+    table = Hold.__table__
+    make_ready = update(table).where(table.c.id == bindparam('b_id'), table.c.status == Hold.WAITING).values(
+        status=Hold.READY, book_id=bindparam('b_book_id'), ready_at=now,
+        expires_at=now + timedelta(days=_pickup_days())
+    )
+    connection = db.session.connection()
+    allocated = set()
+    while copies:
+        # Only the first len(copies) places of each queue are read back
+        queue = queue_statement(list(copies)).subquery()
+        heads = db.session.execute(
+            db.select(queue.c.id, queue.c.work_id).where(queue.c.place <= max(map(len, copies.values())))
+            .order_by(queue.c.work_id, queue.c.place)
+        ).all()
+        missed = False
+        for hold_id, work_id in heads:
+            if not copies[work_id]:
+                continue
+            if connection.execute(make_ready, {'b_id': hold_id, 'b_book_id': copies[work_id][0]}).rowcount == 1:
+                allocated.add(copies[work_id].pop(0))
+            else:
+                missed = True
+        # Every miss is a hold that stopped waiting, so re-reading the queues ends
+        copies = {work_id: ids for work_id, ids in copies.items() if ids} if missed else {}
+    return allocated
+
+
+def release_books(book_ids, now=None):
+    """Pass each copy to the next hold on its work, or back on the shelf; return (allocated, released)"""
+    book_ids = list(dict.fromkeys(book_ids))
+    allocated = allocate_holds(book_ids, now)
+    released = [book_id for book_id in book_ids if book_id not in allocated]
+    if released:
+        db.session.execute(
+            update(Book).where(Book.id.in_(released))
+            .values(available=True).execution_options(synchronize_session=False)
+        )
+        copies_flipped(released, True)
+    return allocated, released
+
+
+def waiting_work_ids(work_ids):
+    """The works among `work_ids` with at least one waiting hold"""
+    work_ids = set(work_ids)
+    if not work_ids:
+        return set()
+    return set(db.session.execute(
+        db.select(Hold.work_id).where(Hold.work_id.in_(work_ids), Hold.status == Hold.WAITING).distinct()
+    ).scalars())
+
+
+def allocate_new_copies(book_ids, now=None):
+    """Set copies just added to the shelf aside for waiting holds on their works; return the ids set aside.
+
+    New copies are inserted available. Like returned copies, the ones a queue
+    takes come off the shelf again in the same transaction, so a title with
+    waiting holds never has a free copy the queue has not seen.
+    """
+    allocated = allocate_holds(book_ids, now)
+    if allocated:
+        db.session.execute(update(Book).where(Book.id.in_(allocated)).values(available=False))
+        copies_flipped(allocated, False)
+    return allocated
+
+
+def claim_hold(book_id, student_id, now=None):
+    """Issue a copy set aside for this student: close the ready hold; True if there was one"""
+    statement = update(Hold) \
+        .where(Hold.book_id == book_id, Hold.student_id == student_id, Hold.status == Hold.READY) \
+        .values(status=Hold.FULFILLED, closed_at=now or datetime.utcnow()) \
+        .execution_options(synchronize_session=False)
+    return db.session.execute(statement).rowcount == 1
+
+
+def claim_holds(book_ids, student_id, now=None):
+    """claim_hold() for several copies with one UPDATE; return the ids of copies claimed"""
+    if not book_ids:
+        return set()
+    statement = update(Hold) \
+        .where(Hold.book_id.in_(book_ids), Hold.student_id == student_id, Hold.status == Hold.READY) \
+        .values(status=Hold.FULFILLED, closed_at=now or datetime.utcnow()) \
+        .execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.update_returning:
+        return set(db.session.execute(statement.returning(Hold.book_id)).scalars())
+    return {book_id for book_id in book_ids if claim_hold(book_id, student_id, now)}
+
+
+def ready_copy(work_id, student_id):
+    """Id of the copy of a work set aside for this student, or None"""
+    hold = active_hold(work_id, student_id, Hold.READY)
+    return hold.book_id if hold else None
+
+
+def cancel_hold(hold, now=None):
+    """Cancel a waiting or ready hold; a copy set aside goes to the next in line. The caller commits."""
+    now = now or datetime.utcnow()
+    was_ready = hold.status == Hold.READY
+    hold.status = Hold.CANCELLED
+    hold.closed_at = now
+    db.session.flush()
+    if was_ready:
+        release_books([hold.book_id], now)
+
+
+def queue_positions(holds):
+    """{hold id: place in its work's queue (1 = next)} for waiting holds"""
+    positions = {}
+    for hold in holds:
+        if hold.status != Hold.WAITING:
+            continue
+        ahead = db.session.execute(
+            db.select(func.count(Hold.id)).where(
+                Hold.work_id == hold.work_id,
+                Hold.status == Hold.WAITING,
+                tuple_(Hold.priority, Hold.placed_at, Hold.id) < tuple_(hold.priority, hold.placed_at, hold.id)
+            )
+        ).scalar()
+        positions[hold.id] = ahead + 1
+    return positions
+
+
+def expired_batch(now, batch_size):
+    """SELECT of the next `batch_size` ready holds whose pickup window closed before `now`"""
+    return db.select(Hold.id, Hold.book_id) \
+        .where(Hold.status == Hold.READY, Hold.expires_at <= now) \
+        .order_by(Hold.expires_at, Hold.id) \
+        .limit(batch_size)
+
+
+def expire_holds(batch_size=DEFAULT_SWEEP_BATCH_SIZE, now=None):
+    """Expire uncollected holds in batches, one transaction each, passing their copies on; return a HoldSweep"""
+    sweep = HoldSweep(now or datetime.utcnow())
+    while True:
+        rows = db.session.execute(expired_batch(sweep.now, batch_size)).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(Hold).where(Hold.id.in_([row.id for row in rows]), Hold.status == Hold.READY)
+            .values(status=Hold.EXPIRED, closed_at=sweep.now)
+            .execution_options(synchronize_session=False)
+        )
+        allocated, released = release_books([row.book_id for row in rows], sweep.now)
+        db.session.commit()
+        sweep.expired += len(rows)
+        sweep.passed_on += len(allocated)
+        sweep.released += len(released)
+        sweep.batches += 1
+    return sweep
@@ -0,0 +1,280 @@
+"""
+Streaming bulk import of books and students from CSV or JSONL files.
+
+Rows are read lazily, validated a chunk at a time, given book codes or
+admission numbers in blocks, and bulk-inserted with one commit per chunk,
+so memory use depends on the chunk size rather than the file size.
+
+A book row describes a title; its `copies` column (default 1) says how many
+physical copies to add. Rows for a title already in the catalog add copies
+to its work instead of creating a second one (services/inventory.py), and
+are rejected if they give the title different loan settings; new copies of
+a title with waiting holds are set aside for them first.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+from sqlalchemy import insert
+from models import db, Book, Student, Work
+from services.holds import allocate_new_copies, waiting_work_ids
+from services.inventory import LOAN_SETTINGS, describe_conflicts, record_copies_added, settings_conflicts, work_ids_for
+
+DEFAULT_CHUNK_SIZE = 1000
+BOOK_TYPES = Book.BOOK_TYPES
+DURATION_TYPES = ('semester', 'specific')
+MAX_COPIES = 500  # Per row; a larger number is more likely a typo than a delivery
+
+
+class ImportReport:
+    """Running totals for one import"""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.rejected = []  # (line number, reason, row)
+        self.started = time.perf_counter()
+
+    def reject(self, line_number, reason, row):
+        self.rejected.append((line_number, reason, row))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.inserted / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(path, file_format=None):
+    """Yield (line number, row dict) pairs from a CSV or JSONL file"""
+    file_format = file_format or ('jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json') else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f'invalid JSON: {e}'}
+                if not isinstance(row, dict):
+                    row = {'__error__': 'expected a JSON object'}
+                yield line_number, row
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _clean(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_book(row):
+    """Return (book values, None) for a valid row or (None, reason)"""
+    if '__error__' in row:
+        return None, row['__error__']
+    title, author = _clean(row, 'title'), _clean(row, 'author')
+    if not title or not author:
+        return None, 'title and author are required'
+    book_type = (_clean(row, 'book_type') or '').lower()
+    if book_type not in BOOK_TYPES:
+        return None, f'book_type must be one of {", ".join(BOOK_TYPES)}'
+    category = (_clean(row, 'category') or 'general').lower()
+    if category not in Book.CATEGORY_CODES:
+        return None, f'unknown category {category!r}'
+    duration_type = (_clean(row, 'duration_type') or 'semester').lower()
+    if duration_type not in DURATION_TYPES:
+        return None, f'duration_type must be one of {", ".join(DURATION_TYPES)}'
+    duration_days = _clean(row, 'duration_days')
+    if duration_days is not None:
+        try:
+            duration_days = int(duration_days)
+        except ValueError:
+            return None, 'duration_days must be a number'
+        if duration_days < 1:
+            return None, 'duration_days must be positive'
+    elif duration_type == 'specific':
+        return None, 'duration_days is required for specific-duration books'
+    copies = _clean(row, 'copies')
+    try:
+        copies = int(copies) if copies is not None else 1
+    except ValueError:
+        return None, 'copies must be a number'
+    if not 1 <= copies <= MAX_COPIES:
+        return None, f'copies must be between 1 and {MAX_COPIES}'
+    return {
+        'title': title[:200],
+        'author': author[:100],
+        'book_type': book_type,
+        'category': category,
+        'course': _clean(row, 'course'),
+        'duration_type': duration_type,
+        'duration_days': duration_days,
+        'copies': copies
+    }, None
+
+
+def validate_student(row):
+    """Return (student values, None) for a valid row or (None, reason)"""
+    if '__error__' in row:
+        return None, row['__error__']
+    name, course = _clean(row, 'name'), _clean(row, 'course')
+    if not name or not course:
+        return None, 'name and course are required'
+    admission_number = _clean(row, 'admission_number')
+    if admission_number is not None and (not admission_number.isdigit() or len(admission_number) != 8):
+        return None, 'admission_number must be exactly 8 digits'
+    return {
+        'name': name[:100],
+        'email': _clean(row, 'email'),
+        'course': course[:100],
+        'admission_number': admission_number
+    }, None
+
+
+def _matching_settings(valid, work_ids):
+    """Split rows from their works' loan settings: (rows, work ids, [(line number, row, reason)] of the rest)"""
+    columns = [getattr(Work, field) for field in LOAN_SETTINGS]
+    works = {work.id: work for work in db.session.execute(
+        db.select(Work.id, *columns).where(Work.id.in_(set(work_ids)))
+    )}
+    kept, kept_ids, conflicting = [], [], []
+    for (line_number, row, values), work_id in zip(valid, work_ids):
+        conflicts = settings_conflicts(works[work_id], values)
+        if conflicts:
+            reason = f'title is already in the catalog as {describe_conflicts(conflicts)}'
+            conflicting.append((line_number, row, reason))
+        else:
+            kept.append((line_number, row, values))
+            kept_ids.append(work_id)
+    return kept, kept_ids, conflicting
+
+
+def import_books(rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Validate and bulk-insert titles and their copies from (line number, row) pairs"""
+    report = ImportReport()
+    for chunk in chunked(rows, chunk_size):
+        valid = []
+        for line_number, row in chunk:
+            report.read += 1
+            values, reason = validate_book(row)
+            if reason:
+                report.reject(line_number, reason, row)
+            else:
+                valid.append((line_number, row, values))
+        if not valid:
+            continue
+        
+        conflicting = []
+        try:
+            work_ids = work_ids_for([values for _, _, values in valid])
+            valid, work_ids, conflicting = _matching_settings(valid, work_ids)
+            # One block of book codes per category in this chunk
+            counts = Counter()
+            for _, _, values in valid:
+                counts[values['category']] += values['copies']
+            codes = {category: iter(Book.reserve_book_codes(category, count)) for category, count in counts.items()}
+            copies = []
+            for (_, _, values), work_id in zip(valid, work_ids):
+                for _ in range(values['copies']):
+                    book_code = next(codes[values['category']])
+                    copies.append({'work_id': work_id, 'book_code': book_code,
+                                   'barcode': f'LIB{book_code}', 'available': True})
+            
+            if copies:
+                db.session.execute(insert(Book), copies)
+                record_copies_added(copies)
+            # Copies of titles with a queue serve its holds before the shelf
+            held_works = waiting_work_ids(work_ids)
+            if held_works:
+                held_codes = [copy['book_code'] for copy in copies if copy['work_id'] in held_works]
+                allocate_new_copies(db.session.execute(
+                    db.select(Book.id).where(Book.book_code.in_(held_codes))
+                ).scalars().all())
+            db.session.commit()
+            report.inserted += len(valid)
+        except Exception as e:
+            db.session.rollback()
+            for line_number, row, _ in valid:
+                report.reject(line_number, f'chunk failed: {e}', row)
+        for line_number, row, reason in conflicting:
+            report.reject(line_number, reason, row)
+        if progress:
+            progress(report)
+    return report
+
+
+def import_students(rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Validate and bulk-insert students from (line number, row) pairs"""
+    report = ImportReport()
+    for chunk in chunked(rows, chunk_size):
+        valid = []
+        for line_number, row in chunk:
+            report.read += 1
+            values, reason = validate_student(row)
+            if reason:
+                report.reject(line_number, reason, row)
+            else:
+                valid.append((line_number, row, values))
+        if not valid:
+            continue
+        
+        # Duplicate checks for the whole chunk in one query per unique column
+        given_numbers = {values['admission_number'] for _, _, values in valid if values['admission_number']}
+        given_emails = {values['email'] for _, _, values in valid if values['email']}
+        taken_numbers = set(db.session.execute(
+            db.select(Student.admission_number).where(Student.admission_number.in_(given_numbers))
+        ).scalars()) if given_numbers else set()
+        taken_emails = set(db.session.execute(
+            db.select(Student.email).where(Student.email.in_(given_emails))
+        ).scalars()) if given_emails else set()
+        
+        accepted = []
+        for line_number, row, values in valid:
+            if values['admission_number'] in taken_numbers:
+                report.reject(line_number, 'admission_number already exists', row)
+            elif values['email'] and values['email'] in taken_emails:
+                report.reject(line_number, 'email already exists', row)
+            else:
+                if values['admission_number']:
+                    taken_numbers.add(values['admission_number'])
+                if values['email']:
+                    taken_emails.add(values['email'])
+                accepted.append((line_number, row, values))
+        if not accepted:
+            continue
+        
+        try:
+            missing = [values for _, _, values in accepted if not values['admission_number']]
+            numbers = Student.reserve_admission_numbers(len(missing), exclude=taken_numbers)
+            for values, number in zip(missing, numbers):
+                values['admission_number'] = number
+            
+            db.session.execute(insert(Student), [values for _, _, values in accepted])
+            db.session.commit()
+            report.inserted += len(accepted)
+        except Exception as e:
+            db.session.rollback()
+            for line_number, row, _ in accepted:
+                report.reject(line_number, f'chunk failed: {e}', row)
+        if progress:
+            progress(report)
+    return report
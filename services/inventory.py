@@ -0,0 +1,319 @@
+"""
+Titles and their copies.
+
+A Work is a title in the catalog (title, author, course and loan rules);
+each Book row is one physical copy of it with its own book code and
+barcode. Copies with the same title, author and course belong to one work,
+so a textbook with sixty copies is one search result and one picker entry.
+A work's loan settings (type, category and loan duration) are fixed by its
+first copy: adding a title already in the catalog with different settings
+is refused (SettingsConflict) rather than silently keeping the old ones.
+
+Work.total_copies and Work.available_copies are maintained counters:
+"is any copy on the shelf?" and the copy counts on the listing pages read
+one row instead of counting copies. They are adjusted inside the
+transaction that changes the copies:
+
+- ORM writes to Book (adding and deleting copies, single returns) are
+  picked up by session flush hooks, from each copy's old and new values.
+- Bulk statements report what they did: claims, batch returns and hold
+  releases through copies_flipped(), bulk inserts through
+  record_copies_added().
+
+claim_copy() issues any free copy of a work with one conditional UPDATE.
+`flask reconcile-copy-counters` recounts every work's copies and reports
+how many counters had drifted.
+"""
+from collections import defaultdict
+from sqlalchemy import bindparam, case, event, func, inspect, insert, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Book, Work
+from services.availability import record_bulk_availability
+from services.book_search import index_works
+
+WORK_FIELDS = ('title', 'author', 'book_type', 'category', 'course', 'duration_type', 'duration_days')
+LOAN_SETTINGS = ('book_type', 'category', 'duration_type', 'duration_days')  # Shared by every copy of a work
+LOOKUP_CHUNK = 500  # Titles per IN (...) when matching rows to existing works
+RECONCILE_CHUNK = 500
+CLAIM_ATTEMPTS = 3  # Without UPDATE ... RETURNING a free copy can be taken between the SELECT and the UPDATE
+
+
+class SettingsConflict(Exception):
+    """A title already in the catalog was added again with different loan settings"""
+
+    def __init__(self, work, conflicts):
+        self.work = work
+        self.conflicts = conflicts
+        super().__init__(f'"{work.title}" is already in the catalog as {describe_conflicts(conflicts)}')
+
+
+def settings_conflicts(work, values):
+    """{field: (kept, given)} for each loan setting in `values` that differs from the work's (or a row of it)"""
+    return {field: (getattr(work, field), values.get(field)) for field in LOAN_SETTINGS
+            if getattr(work, field) != values.get(field)}
+
+
+def describe_conflicts(conflicts):
+    return ', '.join(f'{field} {kept} (not {given})' for field, (kept, given) in conflicts.items())
+
+
+def work_key(title, author, course):
+    """The identity copies are grouped by, as the unique index uq_work_identity compares it"""
+    return title, author, course or ''
+
+
+def _identity_filter(title, author, course):
+    return (Work.title == title, Work.author == author, func.coalesce(Work.course, '') == (course or ''))
+
+
+def find_work(title, author, course):
+    """The work with this title, author and course, or None"""
+    return Work.query.filter(*_identity_filter(title, author, course)).first()
+
+
+def find_works(keys):
+    """{work_key: work id} for the keys already in the catalog"""
+    keys = set(keys)
+    titles = sorted({key[0] for key in keys})
+    found = {}
+    for start in range(0, len(titles), LOOKUP_CHUNK):
+        rows = db.session.execute(
+            db.select(Work.id, Work.title, Work.author, Work.course)
+            .where(Work.title.in_(titles[start:start + LOOKUP_CHUNK]))
+        ).all()
+        for row in rows:
+            key = work_key(row.title, row.author, row.course)
+            if key in keys:
+                found[key] = row.id
+    return found
+
+
+def get_or_create_work(values):
+    """(work, created) for a dict of work values, matched on title, author and course; the caller commits.
+
+    Raises SettingsConflict if the work exists with different loan settings.
+    """
+    work = find_work(values['title'], values['author'], values.get('course'))
+    if work is None:
+        work = Work(**{field: values.get(field) for field in WORK_FIELDS})
+        try:
+            # Savepoint so losing the race to another desk doesn't abort the caller's transaction
+            with db.session.begin_nested():
+                db.session.add(work)
+            return work, True
+        except IntegrityError:
+            work = find_work(values['title'], values['author'], values.get('course'))
+    
+    conflicts = settings_conflicts(work, values)
+    if conflicts:
+        raise SettingsConflict(work, conflicts)
+    return work, False
+
+
+def work_ids_for(rows):
+    """Work id for each dict of work values, bulk-inserting works not yet in the catalog; the caller commits"""
+    keys = [work_key(row['title'], row['author'], row.get('course')) for row in rows]
+    found = find_works(keys)
+    new = {}
+    for key, row in zip(keys, rows):
+        if key not in found and key not in new:
+            new[key] = {field: row.get(field) for field in WORK_FIELDS}
+    if new:
+        db.session.execute(insert(Work), list(new.values()))
+        added = find_works(new)
+        # Bulk inserts bypass the search index's mapper events
+        index_works(added.values())
+        found.update(added)
+    return [found[key] for key in keys]
+
+
+def add_copies(work, count):
+    """Add `count` copies of a work, each with its own book code and barcode; the caller commits"""
+    copies = []
+    for book_code in Book.reserve_book_codes(work.category, count):
+        book = Book(work=work, book_code=book_code, available=True)
+        book.generate_barcode()
+        db.session.add(book)
+        copies.append(book)
+    return copies
+
+
+def _adjust_statement():
+    table = Work.__table__
+    return table.update().where(table.c.id == bindparam('b_id')).values(
+        total_copies=table.c.total_copies + bindparam('b_total'),
+        available_copies=table.c.available_copies + bindparam('b_available')
+    )
+
+
+def apply_deltas(connection, deltas):
+    """Add {work_id: [total, available]} to the works' counters with one executemany"""
+    rows = [
+        {'b_id': work_id, 'b_total': total, 'b_available': available}
+        for work_id, (total, available) in deltas.items()
+        if work_id is not None and (total or available)
+    ]
+    if rows:
+        connection.execute(_adjust_statement(), rows)
+
+
+def record_copies_added(copies):
+    """Count bulk-inserted copies (dicts with work_id and available) on their works"""
+    deltas = defaultdict(lambda: [0, 0])
+    for copy in copies:
+        deltas[copy['work_id']][0] += 1
+        deltas[copy['work_id']][1] += 1 if copy.get('available', True) else 0
+    apply_deltas(db.session.connection(), deltas)
+
+
+def copies_flipped(book_ids, available):
+    """Report copies a bulk UPDATE on the session just set to `available`: counters and the picker index"""
+    book_ids = list(book_ids)
+    rows = db.session.execute(
+        db.select(Book.work_id, func.count(Book.id)).where(Book.id.in_(book_ids)).group_by(Book.work_id)
+    ).all() if book_ids else []
+    sign = 1 if available else -1
+    apply_deltas(db.session.connection(), {work_id: [0, sign * count] for work_id, count in rows})
+    record_bulk_availability(db.session, {work_id: sign * count for work_id, count in rows})
+
+
+def free_copy(work_id):
+    """Scalar subquery: id of a free copy of the work, skipping copies another transaction is claiming"""
+    return db.select(Book.id) \
+        .where(Book.work_id == work_id, Book.available == True) \
+        .order_by(Book.id).limit(1) \
+        .with_for_update(skip_locked=True) \
+        .scalar_subquery()
+
+
+def claim_copy(work_id):
+    """Mark any free copy of a work as issued with one conditional UPDATE; return its id, or None if none is free.
+
+    Picking the copy and taking it are one statement, so desks issuing the
+    same title at once each get a different copy, and the last copy goes to
+    exactly one of them.
+    """
+    statement = update(Book).where(Book.id == free_copy(work_id), Book.available == True) \
+        .values(available=False).execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.update_returning:
+        book_id = db.session.execute(statement.returning(Book.id)).scalar()
+        record_bulk_availability(db.session, {work_id: -1} if book_id is not None else {})
+    else:
+        book_id = None
+        for _ in range(CLAIM_ATTEMPTS):
+            candidate = db.session.execute(
+                db.select(Book.id).where(Book.work_id == work_id, Book.available == True).order_by(Book.id).limit(1)
+            ).scalar()
+            if candidate is None:
+                break
+            claim = update(Book).where(Book.id == candidate, Book.available == True) \
+                .values(available=False).execution_options(synchronize_session=False)
+            claimed = db.session.execute(claim).rowcount == 1
+            record_bulk_availability(db.session, {work_id: -1} if claimed else {})
+            if claimed:
+                book_id = candidate
+                break
+    
+    if book_id is not None:
+        apply_deltas(db.session.connection(), {work_id: [0, -1]})
+    return book_id
+
+
+def first_copy_codes(work_ids):
+    """{work id: lowest book code among its copies} for a page of works, in one query"""
+    work_ids = list(work_ids)
+    if not work_ids:
+        return {}
+    return dict(db.session.execute(
+        db.select(Book.work_id, func.min(Book.book_code)).where(Book.work_id.in_(work_ids)).group_by(Book.work_id)
+    ).all())
+
+
+def reconcile(work_ids=None):
+    """Recount copies of every work (or of `work_ids`); return (checked, corrected). The caller commits."""
+    if work_ids is not None:
+        work_ids = list(work_ids)
+        chunks = [work_ids[start:start + RECONCILE_CHUNK] for start in range(0, len(work_ids), RECONCILE_CHUNK)]
+    else:
+        chunks = [None]
+    
+    table = Work.__table__
+    checked, corrections = 0, []
+    for chunk in chunks:
+        statement = db.select(
+            Book.work_id, func.count(Book.id), func.coalesce(func.sum(case((Book.available == True, 1), else_=0)), 0)
+        ).group_by(Book.work_id)
+        if chunk is not None:
+            statement = statement.where(Book.work_id.in_(chunk))
+        actual = {row[0]: (row[1], int(row[2])) for row in db.session.execute(statement)}
+        
+        statement = db.select(table.c.id, table.c.total_copies, table.c.available_copies)
+        if chunk is not None:
+            statement = statement.where(table.c.id.in_(chunk))
+        for work_id, total, available in db.session.execute(statement):
+            checked += 1
+            expected = actual.get(work_id, (0, 0))
+            if (total, available) != expected:
+                corrections.append({'b_id': work_id, 'b_total': expected[0], 'b_available': expected[1]})
+    
+    if corrections:
+        db.session.connection().execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(
+                total_copies=bindparam('b_total'),
+                available_copies=bindparam('b_available')
+            ),
+            corrections
+        )
+    return checked, len(corrections)
+
+
+def _previous_values(book):
+    """(work_id, available) as last flushed, or None if an old value was never loaded"""
+    state = inspect(book)
+    values = []
+    for name in ('work_id', 'available'):
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            return None
+    return tuple(values)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_previous_values(session, flush_context, instances):
+    # Old values have to be read before the flush writes the new ones
+    previous = []
+    for book in list(session.dirty) + list(session.deleted):
+        if isinstance(book, Book) and inspect(book).persistent:
+            previous.append((book, _previous_values(book)))
+    session.info['copy_counter_previous'] = previous
+
+
+@event.listens_for(db.session, 'after_flush')
+def _adjust_counters(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0])
+    recount = set()
+    
+    for book in session.new:
+        if isinstance(book, Book):
+            deltas[book.work_id][0] += 1
+            deltas[book.work_id][1] += 1 if book.available else 0
+    for book, previous in session.info.pop('copy_counter_previous', ()):
+        if previous is None:
+            # An old value was overwritten without being loaded: count this work afresh
+            recount.add(book.work_id)
+            continue
+        deltas[previous[0]][0] -= 1
+        deltas[previous[0]][1] -= 1 if previous[1] else 0
+        if book not in session.deleted:
+            deltas[book.work_id][0] += 1
+            deltas[book.work_id][1] += 1 if book.available else 0
+    
+    for work_id in recount:
+        deltas.pop(work_id, None)
+    apply_deltas(session.connection(), deltas)
+    if recount - {None}:
+        reconcile(recount - {None})
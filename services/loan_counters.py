@@ -0,0 +1,195 @@
+"""
+Denormalized per-student loan counters.
+
+Student.active_loans, total_loans and outstanding_fine (fines on loans
+not yet returned) let the profile header render without reading the
+student's issues. They are adjusted inside the transaction that changes
+the issues:
+
+- ORM writes to Issue (single issues and returns, calculate_fine) are
+  picked up by session flush hooks, from each issue's old and new values.
+- Bulk statements call the helpers here before they run: batch_issue
+  (record_issued), batch_return (release_open_issues) and fine accrual
+  (record_fine_changes).
+
+`flask reconcile-loan-counters` recomputes every student's counters from
+the issue and issue_history tables and reports how many had drifted
+(e.g. after writes made outside the application).
+"""
+from collections import defaultdict
+from sqlalchemy import and_, bindparam, case, event, func, inspect
+from models import db, Student, Issue, IssueRecord
+
+FINE_TOLERANCE = 0.005  # Float sums may differ from the stored counter by rounding only
+RECONCILE_CHUNK = 500
+
+
+def _outstanding(fine=None):
+    fine = Issue.fine if fine is None else fine
+    return case((fine > 0, fine), else_=0.0)
+
+
+def _contribution(returned, fine):
+    """(active, total, outstanding fine) one issue adds to its student's counters"""
+    if returned:
+        return 0, 1, 0.0
+    return 1, 1, fine if fine and fine > 0 else 0.0
+
+
+def _adjust_statement():
+    table = Student.__table__
+    return table.update().where(table.c.id == bindparam('b_id')).values(
+        active_loans=table.c.active_loans + bindparam('b_active'),
+        total_loans=table.c.total_loans + bindparam('b_total'),
+        outstanding_fine=table.c.outstanding_fine + bindparam('b_fine')
+    )
+
+
+def apply_deltas(connection, deltas):
+    """Add {student_id: [active, total, fine]} to the students' counters with one executemany"""
+    rows = [
+        {'b_id': student_id, 'b_active': active, 'b_total': total, 'b_fine': fine}
+        for student_id, (active, total, fine) in deltas.items()
+        if student_id is not None and (active or total or fine)
+    ]
+    if rows:
+        connection.execute(_adjust_statement(), rows)
+
+
+def record_issued(student_id, count):
+    """Count `count` new open loans for a student (bulk inserts bypass the flush hooks)"""
+    apply_deltas(db.session.connection(), {student_id: [count, count, 0.0]})
+
+
+def release_open_issues(*criteria):
+    """Take the open issues matching `criteria` off their students' active loans and outstanding fine.
+
+    Call it in the returning transaction, before the UPDATE that marks them returned.
+    """
+    rows = db.session.execute(
+        db.select(Issue.student_id, func.count(Issue.id), func.coalesce(func.sum(_outstanding()), 0.0))
+        .where(Issue.returned == False, *criteria)
+        .group_by(Issue.student_id)
+    ).all()
+    apply_deltas(db.session.connection(), {
+        student_id: [-count, 0, -float(fine)] for student_id, count, fine in rows
+    })
+
+
+def record_fine_changes(new_fine, *criteria):
+    """Add the change in outstanding fine of open issues matching `criteria` when their fine becomes `new_fine`.
+
+    Call it before the UPDATE that stores the new fines.
+    """
+    rows = db.session.execute(
+        db.select(Issue.student_id, func.sum(_outstanding(new_fine) - _outstanding()))
+        .where(Issue.returned == False, *criteria)
+        .group_by(Issue.student_id)
+    ).all()
+    apply_deltas(db.session.connection(), {student_id: [0, 0, float(delta or 0.0)] for student_id, delta in rows})
+
+
+def _actual_counters(student_ids=None):
+    # Archived loans still count towards a student's lifetime total
+    statement = db.select(
+        IssueRecord.student_id,
+        func.sum(case((IssueRecord.returned == False, 1), else_=0)),
+        func.count(IssueRecord.id),
+        func.coalesce(func.sum(case(
+            (and_(IssueRecord.returned == False, IssueRecord.fine > 0), IssueRecord.fine), else_=0.0
+        )), 0.0)
+    ).group_by(IssueRecord.student_id)
+    if student_ids is not None:
+        statement = statement.where(IssueRecord.student_id.in_(student_ids))
+    return {row[0]: (int(row[1] or 0), row[2], float(row[3])) for row in db.session.execute(statement)}
+
+
+def reconcile(student_ids=None):
+    """Recompute counters from the full issue history (all students, or `student_ids`); return (checked, corrected).
+
+    The caller commits.
+    """
+    if student_ids is not None:
+        student_ids = list(student_ids)
+        chunks = [student_ids[start:start + RECONCILE_CHUNK]
+                  for start in range(0, len(student_ids), RECONCILE_CHUNK)]
+    else:
+        chunks = [None]
+    
+    table = Student.__table__
+    checked, corrections = 0, []
+    for chunk in chunks:
+        actual = _actual_counters(chunk)
+        statement = db.select(table.c.id, table.c.active_loans, table.c.total_loans, table.c.outstanding_fine)
+        if chunk is not None:
+            statement = statement.where(table.c.id.in_(chunk))
+        for student_id, active, total, fine in db.session.execute(statement):
+            checked += 1
+            expected = actual.get(student_id, (0, 0, 0.0))
+            if (active, total) != expected[:2] or abs((fine or 0.0) - expected[2]) > FINE_TOLERANCE:
+                corrections.append({'b_id': student_id, 'b_active': expected[0],
+                                    'b_total': expected[1], 'b_fine': expected[2]})
+    
+    if corrections:
+        db.session.connection().execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(
+                active_loans=bindparam('b_active'),
+                total_loans=bindparam('b_total'),
+                outstanding_fine=bindparam('b_fine')
+            ),
+            corrections
+        )
+    return checked, len(corrections)
+
+
+def _previous_values(issue):
+    """(student_id, returned, fine) as last flushed, or None if an old value was never loaded"""
+    state = inspect(issue)
+    values = []
+    for name in ('student_id', 'returned', 'fine'):
+        history = state.attrs[name].load_history()
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            return None
+    return tuple(values)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_previous_values(session, flush_context, instances):
+    # Old values have to be read before the flush writes the new ones
+    previous = []
+    for issue in list(session.dirty) + list(session.deleted):
+        if isinstance(issue, Issue) and inspect(issue).persistent:
+            previous.append((issue, _previous_values(issue)))
+    session.info['loan_counter_previous'] = previous
+
+
+@event.listens_for(db.session, 'after_flush')
+def _adjust_counters(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    recount = set()
+
+    def add(student_id, contribution, sign):
+        for position, value in enumerate(contribution):
+            deltas[student_id][position] += sign * value
+    
+    for issue in session.new:
+        if isinstance(issue, Issue):
+            add(issue.student_id, _contribution(issue.returned, issue.fine), 1)
+    for issue, previous in session.info.pop('loan_counter_previous', ()):
+        if previous is None:
+            # An old value was overwritten without being loaded: count this student afresh
+            recount.add(issue.student_id)
+            continue
+        add(previous[0], _contribution(previous[1], previous[2]), -1)
+        if issue not in session.deleted:
+            add(issue.student_id, _contribution(issue.returned, issue.fine), 1)
+    
+    for student_id in recount:
+        deltas.pop(student_id, None)
+    apply_deltas(session.connection(), deltas)
+    if recount - {None}:
+        reconcile(recount - {None})
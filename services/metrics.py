@@ -0,0 +1,128 @@
+"""
+Per-endpoint request metrics in the Prometheus text format.
+
+Every request's wall time, SQL statement count, SQL time and rows (from
+services/query_counter.py) are added to fixed-bucket histograms labelled
+by endpoint, and served at /metrics. Observing a request is a handful of
+bisects and additions under one lock, cheap enough to leave on in
+production. With SLOW_REQUEST_SECONDS set, requests slower than that are
+logged together with their slowest statements.
+
+Histograms live in process memory, so each worker reports its own; scrape
+every worker (or run a single one) for complete numbers.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+SLOW_LOG_STATEMENTS = 5  # Slowest statements quoted per slow request
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label value"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # label -> [per-bucket counts..., +Inf count], sum
+
+    def observe(self, label, value):
+        counts, total = self._series.get(label) or ([0] * (len(self.buckets) + 1), 0.0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self._series[label] = (counts, total + value)
+
+    def render(self, label_name):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{{label_name}="{label}"}} {cumulative}')
+        return lines
+
+
+class RequestMetrics:
+    """Request counters and histograms for one worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}  # (endpoint, method, status) -> count
+        self.histograms = [
+            Histogram('library_request_duration_seconds', 'Wall time per request.', SECONDS_BUCKETS),
+            Histogram('library_request_sql_statements', 'SQL statements per request.', STATEMENT_BUCKETS),
+            Histogram('library_request_sql_seconds', 'Time spent executing SQL per request.', SECONDS_BUCKETS),
+            Histogram('library_request_sql_rows', 'Rows returned or written by SQL per request.', ROW_BUCKETS),
+        ]
+
+    def observe(self, endpoint, method, status, seconds, statements, sql_seconds, rows):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for histogram, value in zip(self.histograms, (seconds, statements, sql_seconds, rows)):
+                histogram.observe(endpoint, value)
+
+    def render(self):
+        with self._lock:
+            lines = ['# HELP library_requests_total Requests handled.', '# TYPE library_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'library_requests_total{{endpoint="{endpoint}",method="{method}",'
+                             f'status="{status}"}} {count}')
+            for histogram in self.histograms:
+                lines.extend(histogram.render('endpoint'))
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def _log_slow_request(endpoint, seconds):
+    statements = sorted(g.get('sql_log') or [], reverse=True)[:SLOW_LOG_STATEMENTS]
+    logger.warning(
+        'Slow request %s %s (%s): %.3fs, %d SQL statements in %.3fs%s',
+        request.method, request.full_path, endpoint, seconds, g.sql_statements, g.sql_seconds,
+        ''.join(f'\n  {elapsed * 1000:.1f} ms: {" ".join(statement.split())}' for elapsed, statement in statements)
+    )
+
+
+def init_app(app):
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_status(response):
+        g.response_status = response.status_code
+        return response
+    
+    # Teardown runs after a streamed body has been sent, so the wall time covers it
+    @app.teardown_request
+    def observe_request(exc):
+        started = g.get('request_started')
+        if started is None or 'sql_statements' not in g:
+            return
+        seconds = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        status = g.get('response_status', 500)
+        request_metrics.observe(endpoint, request.method, status, seconds,
+                                g.sql_statements, g.sql_seconds, g.sql_rows)
+        
+        threshold = app.config['SLOW_REQUEST_SECONDS']
+        if threshold is not None and seconds >= threshold:
+            _log_slow_request(endpoint, seconds)
+
+
+def metrics_view():
+    """Request metrics for this worker in the Prometheus text format"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
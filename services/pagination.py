@@ -0,0 +1,99 @@
+"""
+Keyset (cursor) pagination for listing pages.
+
+Pages are addressed by the key of the last row on the previous page
+(`after`) or the first row on the next page (`before`) rather than by
+OFFSET, so every page costs one indexed range scan of `per_page + 1` rows
+however deep into the table it is.
+"""
+from flask import current_app, request
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move forwards or backwards"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_args(self):
+        return {'after': self.next_cursor}
+
+    @property
+    def prev_args(self):
+        return {'before': self.prev_cursor}
+
+
+class RankedPage:
+    """One page of relevance-ranked results, addressed by offset into the ranking"""
+
+    def __init__(self, items, per_page, offset=0, has_next=False):
+        self.items = items
+        self.per_page = per_page
+        self.offset = offset
+        self.has_next = has_next
+
+    @property
+    def has_prev(self):
+        return self.offset > 0
+
+    @property
+    def next_args(self):
+        return {'offset': self.offset + self.per_page}
+
+    @property
+    def prev_args(self):
+        return {'offset': max(0, self.offset - self.per_page) or None}
+
+
+def page_args():
+    """Read `after`, `before` and `per_page` from the query string, clamped to config limits"""
+    default_size = current_app.config['LISTING_PAGE_SIZE']
+    max_size = current_app.config['LISTING_MAX_PAGE_SIZE']
+    per_page = request.args.get('per_page', default_size, type=int)
+    per_page = max(1, min(per_page, max_size))
+    return {
+        'after': request.args.get('after', type=int),
+        'before': request.args.get('before', type=int),
+        'per_page': per_page
+    }
+
+
+def keyset_paginate(query, key_column, after=None, before=None, per_page=50, descending=False):
+    """Return a KeysetPage of `query` ordered by the unique `key_column` (highest first if `descending`)"""
+    forward = key_column.desc() if descending else key_column.asc()
+    backward = key_column.asc() if descending else key_column.desc()
+    
+    if before is not None:
+        # Walk backwards from the cursor, then restore the page order
+        behind = key_column > before if descending else key_column < before
+        rows = query.filter(behind).order_by(backward).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        next_cursor = _key(items[-1], key_column) if items else None
+        prev_cursor = _key(items[0], key_column) if items and has_more else None
+        return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+    
+    if after is not None:
+        query = query.filter(key_column < after if descending else key_column > after)
+    rows = query.order_by(forward).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = _key(items[-1], key_column) if items and has_more else None
+    prev_cursor = _key(items[0], key_column) if items and after is not None else None
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def _key(item, key_column):
+    return getattr(item, key_column.key)
@@ -0,0 +1,139 @@
+"""
+Per-request SQL accounting with an optional statement budget.
+
+Engine cursor hooks tally, for the request being handled, the number of
+statements executed, the time spent executing them and the rows they
+returned or wrote. SQLite connections get a cursor that counts fetched
+rows, since sqlite3 does not report them. services/metrics.py turns these into
+per-endpoint histograms; here they are checked against a budget. Routes
+that exceed their budget are logged, or, with SQL_BUDGET_STRICT enabled
+(for development and CI), fail with SQLBudgetExceeded so an N+1
+regression can't slip through unnoticed. `flask check-sql-budget` drives
+the main pages through the test client and checks them against the budget.
+"""
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+class SQLBudgetExceeded(Exception):
+    """A request ran more SQL statements than its budget allows"""
+
+
+def _tracking():
+    return has_request_context() and 'sql_statements' in g
+
+
+def _count_rows(count):
+    if count and _tracking():
+        g.sql_rows += count
+
+
+class CountingCursor(sqlite3.Cursor):
+    """SQLite cursor that reports fetched rows; sqlite3 leaves rowcount at -1 for SELECTs"""
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _count_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _count_rows(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def _use_counting_connection(dialect, conn_rec, cargs, cparams):
+    if dialect.name == 'sqlite' and dialect.driver == 'pysqlite':
+        cparams.setdefault('factory', CountingConnection)
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if _tracking():
+        g.sql_statements += 1
+        if context is not None:
+            context.sql_started = time.perf_counter()
+
+
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'sql_started', None)
+    if started is None or not _tracking():
+        return
+    elapsed = time.perf_counter() - started
+    g.sql_seconds += elapsed
+    if context.isinsert or context.isupdate or context.isdelete:
+        g.sql_rows += max(cursor.rowcount, 0)
+    elif cursor.rowcount > 0 and not isinstance(cursor, CountingCursor):
+        # PostgreSQL drivers report the rows a SELECT returned up front
+        g.sql_rows += cursor.rowcount
+    if g.sql_log is not None:
+        g.sql_log.append((elapsed, statement))
+
+
+def start_request(capture_statements=False):
+    """Reset the counters for the request being handled"""
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    g.sql_rows = 0
+    g.sql_log = [] if capture_statements else None
+
+
+@contextmanager
+def count_statements():
+    """Collect every statement the engine executes inside the block into a list"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def statement_budget(app, endpoint):
+    """Budget for an endpoint: SQL_STATEMENT_BUDGETS entry, else SQL_STATEMENT_BUDGET"""
+    return app.config['SQL_STATEMENT_BUDGETS'].get(endpoint, app.config['SQL_STATEMENT_BUDGET'])
+
+
+def init_app(app):
+    with app.app_context():
+        event.listen(db.engine, 'do_connect', _use_counting_connection)
+        event.listen(db.engine, 'before_cursor_execute', _start_statement)
+        event.listen(db.engine, 'after_cursor_execute', _finish_statement)
+        # Reconnect pooled connections so they pick up the counting cursor
+        db.engine.dispose()
+
+    @app.before_request
+    def start_counting():
+        start_request(capture_statements=app.config['SLOW_REQUEST_SECONDS'] is not None)
+
+    @app.after_request
+    def check_budget(response):
+        count = g.get('sql_statements', 0)
+        budget = statement_budget(app, request.endpoint)
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} ran {count} SQL statements (budget {budget})'
+            if app.config['SQL_BUDGET_STRICT']:
+                raise SQLBudgetExceeded(message)
+            logger.warning(message)
+        return response
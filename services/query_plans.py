@@ -0,0 +1,108 @@
+"""
+Query-plan regression checks for the hot circulation queries.
+
+Each check builds the statement a route actually runs and asks the
+database for its plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN with
+sequential scans disabled on PostgreSQL). A check fails if any table in
+the plan is read with a full scan instead of an index, unless the check
+is listed in EXEMPTIONS with the reason the scan is accepted. Run them
+with `flask check-query-plans`, which exits non-zero on failure.
+"""
+import re
+from datetime import datetime, timedelta
+from models import db, Book, CategorySequence, Hold, Issue, IssueRecord, Student, Work
+from services.book_search import code_matches
+from services.exporter import export_query
+from services.fine_engine import fine_summary_statement, issues_with_fines_statement
+from services.fine_scheduler import open_issue_batch
+from services.holds import expired_batch, queue_statement
+from services.inventory import free_copy
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+PG_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+
+# Checks whose full scan is accepted, with the reason; they are still run so their plans stay visible
+EXEMPTIONS = {
+    'students.manage_students: substring search':
+        'matches anywhere in name, admission number or course; a leading wildcard cannot use a b-tree index, '
+        'and the typeahead (/students/search) is the indexed prefix search',
+}
+
+
+def _checks():
+    """(name, statement) for every query on a hot path"""
+    from routes.student_routes import search_condition, typeahead_statement
+    now = datetime.utcnow()
+    return [
+        ('issues.issue_books: open loans', Issue.query.filter_by(returned=False).statement),
+        ('issues.return_book_by_barcode: open loan of book',
+         Issue.query.filter_by(book_id=1, returned=False).limit(1).statement),
+        ('issues.batch_return: open loans of books',
+         db.select(Issue.book_id, Issue.id).where(Issue.book_id.in_([1, 2, 3]), Issue.returned == False)),
+        ('lookup: book by barcode', Book.query.filter_by(barcode='LIB010001').statement),
+        ('lookup: book by book code', Book.query.filter_by(book_code='010001').statement),
+        ('books.manage_books: code prefix', code_matches('0100', 51).statement),
+        ('books.manage_books: listing page', Work.query.filter(Work.id > 100).order_by(Work.id).limit(51).statement),
+        ('books.available_books: picker rebuild',
+         db.select(Work.id, Work.available_copies).where(Work.available_copies > 0)),
+        ('issues.issue_book: claim any free copy', db.select(free_copy(1))),
+        ('inventory: highest book code in category', CategorySequence.highest_number_statement('01')),
+        ('inventory: copies of works', db.select(Book.work_id, Book.book_code).where(Book.work_id.in_([1, 2, 3]))),
+        ('students.manage_students: listing page',
+         Student.query.filter(Student.id > 100).order_by(Student.id).limit(51).statement),
+        ('students.manage_students: substring search',
+         Student.query.filter(search_condition('emma')).order_by(Student.id).limit(51).statement),
+        ('students.student_profile: student', Student.query.filter_by(admission_number='12345678').statement),
+        ('students.student_profile: open loans',
+         Issue.query.filter_by(student_id=1, returned=False).order_by(Issue.issue_date.desc()).statement),
+        ('students.student_profile: history page',
+         IssueRecord.query.filter_by(student_id=1, returned=True).filter(IssueRecord.id < 1000)
+         .order_by(IssueRecord.id.desc()).limit(51).statement),
+        ('students.search_students: admission prefix', typeahead_statement('1234', 10)),
+        ('students.search_students: name prefix', typeahead_statement('em', 10)),
+        ('fines.fine_calculator: summary', fine_summary_statement()),
+        ('fines.fine_calculator: issues with fines', issues_with_fines_statement(now)),
+        ('fine accrual: open issue batch', open_issue_batch(0, 500)),
+        ('issues.export_issues: date range', export_query(now - timedelta(days=30), now)),
+        ('holds: queues of returned copies\' works', queue_statement([1, 2, 3])),
+        ('holds: hold of student on work', Hold.query.filter(
+            Hold.work_id == 1, Hold.student_id == 1, Hold.status.in_(Hold.ACTIVE_STATUSES)).statement),
+        ('holds: ready hold on copy', Hold.query.filter(
+            Hold.book_id == 1, Hold.student_id == 1, Hold.status == Hold.READY).statement),
+        ('holds: expiry sweep batch', expired_batch(now, 500)),
+        ('students.student_profile: holds',
+         Hold.query.filter(Hold.student_id == 1, Hold.status.in_(Hold.ACTIVE_STATUSES)).statement),
+    ]
+
+
+def _plan_lines(connection, sql):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        return [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {sql}')]
+    return [row[3] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def full_scans(plan_lines, dialect_name):
+    """Tables read with a full scan in the given plan"""
+    pattern = PG_FULL_SCAN if dialect_name == 'postgresql' else SQLITE_FULL_SCAN
+    # Reading back a subquery's own result (e.g. the issue_records union) is not a table scan
+    subqueries = {match.group(1) for match in (SQLITE_SUBQUERY.search(line) for line in plan_lines) if match}
+    return [match.group(1) for match in (pattern.search(line) for line in plan_lines)
+            if match and match.group(1) not in subqueries]
+
+
+def check_query_plans():
+    """Run every check; return a list of dicts with name, ok, full_scans, exempt and plan"""
+    results = []
+    with db.engine.connect() as connection:
+        dialect = connection.dialect
+        for name, statement in _checks():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            with connection.begin():
+                plan = _plan_lines(connection, sql)
+            scans = full_scans(plan, dialect.name)
+            exempt = EXEMPTIONS.get(name) if scans else None
+            results.append({'name': name, 'ok': not scans or exempt is not None, 'full_scans': scans,
+                            'exempt': exempt, 'plan': plan})
+    return results
@@ -0,0 +1,177 @@
+"""
+Conditional GET and rendered-response caching for the listing pages.
+
+A catalog version (the catalog_version row) is bumped after every
+committed transaction that wrote works, copies, students or issues,
+whether through the ORM unit of work or a bulk Core statement run on the
+session. The bump is a one-statement transaction of its own, so writers
+never queue on the version row while their transaction is open; a page
+read between a write's commit and its bump may still be served under the
+previous version, until the bump lands moments later. Listing
+views decorated with @cached_listing derive a strong ETag from the
+endpoint, query arguments and that version: a terminal revalidating an
+unchanged page gets 304 Not Modified, and a first view of a page some
+other terminal already rendered is served from an in-process LRU of
+rendered bodies. Checking either costs one primary-key read.
+
+Writes that bypass the session (raw SQL on another connection) are not
+seen; pages carrying flashed messages are never cached.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, make_response, request, session
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Book, Student, Issue, CatalogVersion, Work
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 256
+TRACKED_TABLES = {Work.__tablename__, Book.__tablename__, Student.__tablename__, Issue.__tablename__}
+TRACKED_MODELS = (Work, Book, Student, Issue)
+
+
+class ResponseCache:
+    """Thread-safe LRU of (endpoint, args, version) -> (body, mimetype)"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified
+            }
+
+
+response_cache = ResponseCache()
+
+
+def init_app(app):
+    response_cache.maxsize = app.config.get('RESPONSE_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    response_cache.clear()
+
+
+def _touches_catalog(session):
+    return any(isinstance(instance, TRACKED_MODELS)
+               for instance in list(session.new) + list(session.dirty) + list(session.deleted))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_flush(session, flush_context):
+    if _touches_catalog(session):
+        session.info['catalog_written'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if getattr(statement, 'table', None) is not None and statement.table.name in TRACKED_TABLES:
+            orm_execute_state.session.info['catalog_written'] = True
+
+
+def committed_version(session):
+    """Bump the catalog version for the transaction `session` just committed, once; return the new version.
+
+    Called from after_commit, so the catalog write is already durable. The bump
+    runs in its own short transaction on a separate connection: the version row
+    lock is held for one UPDATE, not for the whole circulation write. Returns
+    None if the transaction wrote nothing tracked, or if the bump failed (pages
+    then stay cached until the next write bumps the version).
+    """
+    if session.in_nested_transaction():
+        # Releasing a savepoint also fires after_commit; the outer transaction may still roll back
+        return None
+    if 'catalog_version' not in session.info and session.info.pop('catalog_written', False):
+        try:
+            with db.engine.begin() as connection:
+                session.info['catalog_version'] = CatalogVersion.bump(connection)
+        except SQLAlchemyError:
+            logger.exception('Catalog version bump failed; cached listing pages may be stale until the next write')
+            session.info['catalog_version'] = None
+    return session.info.get('catalog_version')
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_after_commit(session):
+    committed_version(session)
+
+
+# Only the end of the outermost transaction clears the flags: a savepoint rolled back
+# (sequence initialisation) must not drop writes made before it
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_bulk_write(session, transaction):
+    if transaction.parent is None:
+        for key in ('catalog_written', 'catalog_version'):
+            session.info.pop(key, None)
+
+
+def _etag(key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'v{key[2]}-{digest}'
+
+
+def cached_listing(view):
+    """Serve a GET listing with a strong ETag, 304s and a rendered-body cache keyed by catalog version"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+        
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), CatalogVersion.current())
+        etag = _etag(key)
+        if etag in request.if_none_match:
+            response_cache.record_not_modified()
+            response = Response(status=304)
+        else:
+            entry = response_cache.get(key)
+            if entry is not None:
+                response = Response(entry[0], mimetype=entry[1])
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                response_cache.put(key, (response.get_data(), response.mimetype))
+        response.set_etag(etag)
+        # Terminals may keep the page but must revalidate before showing it again
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
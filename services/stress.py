@@ -0,0 +1,118 @@
+"""
+Concurrent issuing stress check.
+
+Many client threads issue the same handful of titles at once through
+POST /issues/issue and POST /students/profile/<n>/issue, each claiming any
+free copy, then the database is checked for double issues (a copy with
+more than one open issue), for availability flags that disagree with the
+open issues, for more issues than there were free copies, and for copy
+counters that disagree with the copies. The issues created are removed
+and the copies made available again afterwards, but run it against a
+scratch database all the same.
+"""
+import random
+import threading
+import time
+from sqlalchemy import case, delete, func, update
+from models import db, Book, Student, Issue, Work
+from services.inventory import reconcile as reconcile_copies
+from services.loan_counters import reconcile
+
+
+def _client_loop(app, worker, work_ids, students, requests_per_worker):
+    rng = random.Random(worker)
+    client = app.test_client()
+    for _ in range(requests_per_worker):
+        work_id = rng.choice(work_ids)
+        student_id, admission_number = rng.choice(students)
+        # Alternate between the circulation desk and the student profile issue paths
+        if rng.random() < 0.5:
+            client.post('/issues/issue', data={'student_id': student_id, 'work_id': work_id})
+        else:
+            client.post(f'/students/profile/{admission_number}/issue', data={'work_id': work_id})
+
+
+def consistency_problems(book_ids):
+    """(double issues, mismatched availability flags) among `book_ids`"""
+    open_counts = dict(db.session.execute(
+        db.select(Issue.book_id, func.count(Issue.id))
+        .where(Issue.book_id.in_(book_ids), Issue.returned == False)
+        .group_by(Issue.book_id)
+    ).all())
+    available = dict(db.session.execute(
+        db.select(Book.id, Book.available).where(Book.id.in_(book_ids))
+    ).all())
+    doubles = {book_id: count for book_id, count in open_counts.items() if count > 1}
+    mismatched = [book_id for book_id in book_ids if bool(available[book_id]) == (book_id in open_counts)]
+    return doubles, mismatched
+
+
+def counter_drift(work_ids):
+    """Ids of works among `work_ids` whose available-copy counter disagrees with their copies"""
+    free = dict(db.session.execute(
+        db.select(Book.work_id, func.sum(case((Book.available == True, 1), else_=0)))
+        .where(Book.work_id.in_(work_ids))
+        .group_by(Book.work_id)
+    ).all())
+    counters = dict(db.session.execute(
+        db.select(Work.id, Work.available_copies).where(Work.id.in_(work_ids))
+    ).all())
+    return [work_id for work_id in work_ids if counters[work_id] != int(free.get(work_id) or 0)]
+
+
+def run_issue_stress(app, books=5, workers=16, requests_per_worker=25):
+    """Hammer the issue endpoints for a few titles from many threads; returns a report dict"""
+    work_ids = db.session.execute(
+        db.select(Work.id).where(Work.available_copies > 0).order_by(Work.id).limit(books)
+    ).scalars().all()
+    book_ids = db.session.execute(
+        db.select(Book.id).where(Book.work_id.in_(work_ids), Book.available == True).order_by(Book.id)
+    ).scalars().all()
+    students = db.session.execute(
+        db.select(Student.id, Student.admission_number).order_by(Student.id).limit(50)
+    ).all()
+    if not work_ids or not students:
+        raise ValueError('The stress check needs at least one available book and one student')
+    first_issue_id = (db.session.execute(db.select(func.max(Issue.id))).scalar() or 0) + 1
+    db.session.commit()
+    
+    threads = [
+        threading.Thread(target=_client_loop,
+                         args=(app, worker, work_ids, [tuple(row) for row in students],
+                               requests_per_worker))
+        for worker in range(workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    db.session.expire_all()
+    doubles, mismatched = consistency_problems(book_ids)
+    drifted = counter_drift(work_ids)
+    issues_created = db.session.execute(
+        db.select(func.count(Issue.id)).where(Issue.id >= first_issue_id, Issue.book_id.in_(book_ids))
+    ).scalar()
+    
+    # Put the copies back the way they were
+    db.session.execute(delete(Issue).where(Issue.id >= first_issue_id, Issue.book_id.in_(book_ids)))
+    db.session.execute(update(Book).where(Book.id.in_(book_ids)).values(available=True))
+    reconcile_copies(work_ids)
+    reconcile([student_id for student_id, _ in students])
+    db.session.commit()
+    
+    total = workers * requests_per_worker
+    return {
+        'books': len(work_ids),
+        'copies': len(book_ids),
+        'workers': workers,
+        'requests': total,
+        'requests_per_second': round(total / elapsed, 1) if elapsed else None,
+        'issues_created': issues_created,
+        'double_issues': doubles,
+        'mismatched_availability': mismatched,
+        'drifted_counters': drifted,
+        'ok': not doubles and not mismatched and not drifted and issues_created <= len(book_ids)
+    }
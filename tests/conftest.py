@@ -0,0 +1,39 @@
+"""
+Fixtures shared by the test suite: the application bound to a temporary
+file-backed SQLite database holding a small generated library.
+
+config.Config reads the environment when it is imported, so the database
+URL is set here, before anything imports the app.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_database_dir = tempfile.mkdtemp(prefix='library-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'library.db')
+os.environ['FINE_SCHEDULER_ENABLED'] = '0'
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+from services.book_search import ensure_search_index  # noqa: E402
+from services.datagen import generate_library  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        generate_library(200, 60, 500)
+        # The generator bulk-inserts works, bypassing the hooks that keep the search index in step
+        ensure_search_index(rebuild=True)
+    yield flask_app
+    with flask_app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(_database_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def cli(app):
+    return app.test_cli_runner()
@@ -0,0 +1,20 @@
+"""The `flask check-query-plans` and `flask check-sql-budget` gates, run against the test library"""
+from services.query_plans import EXEMPTIONS, check_query_plans
+
+
+def test_check_query_plans_passes(cli):
+    result = cli.invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert '[SCAN]' not in result.output
+
+
+def test_query_plan_exemptions_name_existing_checks(app):
+    with app.app_context():
+        names = {result['name'] for result in check_query_plans()}
+    assert set(EXEMPTIONS) <= names
+
+
+def test_check_sql_budget_passes(cli):
+    result = cli.invoke(args=['check-sql-budget'])
+    assert result.exit_code == 0, result.output
+    assert '[FAIL]' not in result.output
@@ -0,0 +1,74 @@
+"""Concurrent claims on the file-backed test database never issue one copy twice"""
+import threading
+
+import pytest
+from sqlalchemy import update
+
+from models import db, Book, Work
+from services.circulation import claim_book
+from services.inventory import claim_copy, reconcile
+
+THREADS = 12
+
+
+@pytest.fixture
+def free_copies(app):
+    """(work id, ids of its free copies) for a title with several free copies; restored afterwards"""
+    with app.app_context():
+        work_id = db.session.execute(
+            db.select(Work.id).where(Work.available_copies >= 2).order_by(Work.id).limit(1)
+        ).scalar_one()
+        book_ids = db.session.execute(
+            db.select(Book.id).where(Book.work_id == work_id, Book.available == True).order_by(Book.id)
+        ).scalars().all()
+    yield work_id, book_ids
+    with app.app_context():
+        db.session.execute(update(Book).where(Book.id.in_(book_ids)).values(available=True))
+        reconcile([work_id])
+        db.session.commit()
+
+
+def _race(app, claim, threads=THREADS):
+    """Run `claim` in `threads` threads released together, each committing its own transaction"""
+    barrier = threading.Barrier(threads)
+    results, errors = [], []
+    
+    def run():
+        with app.app_context():
+            barrier.wait()
+            try:
+                results.append(claim())
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+    
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert not errors, errors
+    return results
+
+
+def test_claim_book_issues_a_copy_once(app, free_copies):
+    _, book_ids = free_copies
+    results = _race(app, lambda: claim_book(book_ids[0]))
+    assert results.count(True) == 1
+    with app.app_context():
+        assert db.session.get(Book, book_ids[0]).available is False
+
+
+def test_claim_copy_hands_out_each_copy_once(app, free_copies):
+    work_id, book_ids = free_copies
+    results = _race(app, lambda: claim_copy(work_id), threads=len(book_ids) + THREADS)
+    claimed = [book_id for book_id in results if book_id is not None]
+    assert sorted(claimed) == book_ids
+    with app.app_context():
+        assert db.session.get(Work, work_id).available_copies == 0
+
+
+def test_stress_issue_command_finds_no_double_issues(cli):
+    result = cli.invoke(args=['stress-issue', '--workers', '8', '--requests', '10'])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,47 @@
+"""Adding a title that is already in the catalog keeps one work with one set of loan settings"""
+from models import db, Work
+from services.importer import import_books
+
+
+def _existing(app):
+    with app.app_context():
+        work = db.session.execute(db.select(Work).order_by(Work.id).limit(1)).scalar_one()
+        return {field: getattr(work, field) for field in
+                ('id', 'title', 'author', 'book_type', 'category', 'course', 'duration_type', 'duration_days',
+                 'total_copies')}
+
+
+def _form(work, **changes):
+    form = {field: work[field] or '' for field in
+            ('title', 'author', 'book_type', 'category', 'course', 'duration_type', 'duration_days')}
+    form.update(changes)
+    return form
+
+
+def _total_copies(app, work_id):
+    with app.app_context():
+        return db.session.get(Work, work_id).total_copies
+
+
+def test_add_book_refuses_different_loan_settings(app):
+    work = _existing(app)
+    other_type = 'reference' if work['book_type'] == 'textbook' else 'textbook'
+    client = app.test_client()
+    
+    response = client.post('/books/add', data=_form(work, book_type=other_type), follow_redirects=True)
+    assert b'no copies were added' in response.data
+    assert _total_copies(app, work['id']) == work['total_copies']
+    
+    client.post('/books/add', data=_form(work))
+    assert _total_copies(app, work['id']) == work['total_copies'] + 1
+
+
+def test_import_rejects_different_loan_settings(app):
+    work = _existing(app)
+    other_category = 'medical' if work['category'] != 'medical' else 'general'
+    rows = [(1, _form(work, category=other_category)), (2, _form(work))]
+    with app.app_context():
+        report = import_books(rows)
+    assert report.inserted == 1
+    assert [(line_number, reason.startswith('title is already in the catalog as category'))
+            for line_number, reason, _ in report.rejected] == [(1, True)]
@@ -0,0 +1,66 @@
+"""SQL statement budgets per endpoint, so an N+1 query fails the suite"""
+import importlib
+
+import pytest
+
+import config
+from services.benchmark import clear_caches, route_cases
+from services.query_counter import SQLBudgetExceeded, count_statements, statement_budget
+
+
+def _cases(app):
+    with app.app_context():
+        return route_cases()
+
+
+@pytest.fixture
+def strict(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_BUDGET_STRICT', True)
+    monkeypatch.setitem(app.config, 'PROPAGATE_EXCEPTIONS', True)
+    return app
+
+
+def test_every_page_is_within_its_budget(strict):
+    client = strict.test_client()
+    adapter = strict.url_map.bind('localhost')
+    for name, path in _cases(strict):
+        budget = statement_budget(strict, adapter.match(path.split('?')[0])[0])
+        assert budget is not None, name
+        # Cold, so cached pages are measured doing their full work
+        clear_caches()
+        with strict.app_context(), count_statements() as statements:
+            response = client.get(path)
+        assert response.status_code in (200, 302), f'{name}: HTTP {response.status_code}'
+        assert len(statements) <= budget, f'{name} ran {len(statements)} SQL statements (budget {budget})'
+
+
+@pytest.mark.parametrize('path', ['/books/', '/students/'])
+def test_listing_statements_do_not_grow_with_page_size(strict, path):
+    client = strict.test_client()
+    counts = []
+    for per_page in (5, 50):
+        clear_caches()
+        with strict.app_context(), count_statements() as statements:
+            assert client.get(f'{path}?per_page={per_page}').status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_strict_mode_fails_a_request_over_budget(strict, monkeypatch):
+    monkeypatch.setitem(strict.config, 'SQL_STATEMENT_BUDGETS', {'students.manage_students': 0})
+    clear_caches()
+    with pytest.raises(SQLBudgetExceeded):
+        strict.test_client().get('/students/')
+
+
+@pytest.mark.parametrize('value, budget', [(None, 20), ('35', 35), ('0', None), ('', None)])
+def test_default_budget_from_environment(monkeypatch, value, budget):
+    if value is None:
+        monkeypatch.delenv('SQL_STATEMENT_BUDGET', raising=False)
+    else:
+        monkeypatch.setenv('SQL_STATEMENT_BUDGET', value)
+    try:
+        assert importlib.reload(config).Config.SQL_STATEMENT_BUDGET == budget
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)